@@ -0,0 +1,62 @@
+"""
+AI compose generation cache benchmark with a local stub model.
+
+Times a cold generation, a repeat (memory tier), a repeat after clearing the memory tier
+(disk tier), and N concurrent identical requests (coalesced into one model call).
+
+    python benchmarks/bench_ai_cache.py --latency 2 --concurrency 10
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from stub_servers import StubGenerativeModel, make_templates, scratch_app_env
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--latency', type=float, default=2.0, help='stub model latency, in seconds')
+    parser.add_argument('--concurrency', type=int, default=10)
+    args = parser.parse_args()
+
+    with scratch_app_env():
+        from app import create_app, ai_manager
+        app = create_app()
+
+        model = StubGenerativeModel(latency=args.latency)
+        ai_manager._model = model
+        # A template the cache hasn't seen before, so the first call is really cold.
+        template = dict(make_templates(1)[0], title=f'Cache Bench {time.time_ns()}')
+
+        def timed(fn):
+            start = time.perf_counter()
+            result = fn()
+            return result, time.perf_counter() - start
+
+        with app.app_context():
+            (_, error), cold = timed(lambda: ai_manager.generate_compose_file(template))
+            assert error is None, error
+            _, warm = timed(lambda: ai_manager.generate_compose_file(template))
+            ai_manager._memory_cache.clear()
+            _, disk = timed(lambda: ai_manager.generate_compose_file(template))
+
+        concurrent_template = dict(template, title=template['title'] + ' concurrent')
+        calls_before = model.calls
+
+        def generate_in_context():
+            with app.app_context():
+                return ai_manager.generate_compose_file(concurrent_template)
+
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            _, concurrent = timed(lambda: list(executor.map(lambda _: generate_in_context(), range(args.concurrency))))
+
+    print(f"stub model latency={args.latency}s")
+    print(f"cold generation:     {cold * 1000:10.3f} ms")
+    print(f"memory cache hit:    {warm * 1e6:10.1f} us")
+    print(f"disk cache hit:      {disk * 1e6:10.1f} us")
+    print(f"{args.concurrency} concurrent identical requests: {concurrent:.3f}s, "
+          f"{model.calls - calls_before} model call(s)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,303 @@
+"""
+End-to-end benchmark of the DockYard web app at several catalog sizes.
+
+For each size, a fresh process starts the app against local stub template sources,
+a stub AI model and a fake Docker daemon, with its own scratch data dir. It times
+startup until the first catalog is served, a refresh where every template changed
+and one where no source changed, then drives `/`, `/app/<id>`,
+`/templates_json`, `/install_app` and `/dashboard` from concurrent logged-in clients
+and reports throughput, p50/p99 latency and the peak RSS of the process.
+
+Results are written as JSON so runs on different commits can be compared:
+
+    python benchmarks/bench_app.py --sizes 100,1000,10000,50000 --output before.json
+    python benchmarks/bench_app.py --sizes 100,1000,10000,50000 --output after.json --compare before.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from stub_servers import APP_ROOT, FakeDockerDaemon, StubGenerativeModel, TemplateSourceServer
+
+ENDPOINTS = ('index', 'app_details', 'templates_json', 'install_app', 'dashboard')
+USERNAME = 'bench'
+PASSWORD = 'bench-password'
+WARMUP_REQUESTS = 3
+# Changes between runs smaller than this are reported as noise by --compare.
+COMPARE_THRESHOLD = 0.10
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS.
+    return peak / (2**20 if sys.platform == 'darwin' else 2**10)
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=APP_ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# Child process: one catalog size
+
+def _timed_refresh(template_manager, flask_app):
+    start = time.perf_counter()
+    with flask_app.app_context():
+        template_manager.update_cached_templates()
+    return time.perf_counter() - start
+
+
+def _logged_in_client(flask_app):
+    client = flask_app.test_client()
+    response = client.post('/login', data={'username': USERNAME, 'password': PASSWORD})
+    if response.status_code != 302:
+        raise RuntimeError(f"Login failed with status {response.status_code}.")
+    return client
+
+
+def _request(client, endpoint, template_ids, rng, install):
+    if endpoint == 'index':
+        return client.get('/')
+    if endpoint == 'app_details':
+        return client.get(f'/app/{rng.choice(template_ids)}')
+    if endpoint == 'templates_json':
+        return client.get('/templates_json', headers={'Accept-Encoding': 'gzip'})
+    if endpoint == 'install_app':
+        return client.post('/install_app', json=install(rng))
+    return client.get('/dashboard')
+
+
+def _load(flask_app, endpoint, template_ids, requests, concurrency, install):
+    """Sends `requests` requests to one endpoint from `concurrency` threads; returns throughput and latency stats."""
+    clients = [_logged_in_client(flask_app) for _ in range(concurrency)]
+    for client in clients[:1]:
+        for _ in range(WARMUP_REQUESTS):
+            _request(client, endpoint, template_ids, random.Random(0), install)
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def worker(index):
+        client = clients[index]
+        rng = random.Random(index)
+        for _ in range(index, requests, concurrency):
+            start = time.perf_counter()
+            response = _request(client, endpoint, template_ids, rng, install)
+            response.get_data()
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+                if response.status_code >= 400:
+                    errors.append(response.status_code)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(worker, range(concurrency)))
+    wall = time.perf_counter() - start
+    return {
+        'requests': len(latencies),
+        'errors': len(errors),
+        'throughput_rps': round(len(latencies) / wall, 1),
+        'p50_ms': round(statistics.median(latencies) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+        'max_ms': round(max(latencies) * 1000, 2),
+    }
+
+
+def run_size(args):
+    """Benchmarks one catalog size in this process and returns the result dict."""
+    sources = max(1, min(args.sources, args.size))
+    per_source = -(-args.size // sources)
+    stub = TemplateSourceServer(sources=sources, templates_per_source=per_source).__enter__()
+    daemon = FakeDockerDaemon(containers=args.containers).__enter__()
+    os.environ['TEMPLATE_SOURCES_URL'] = ','.join(stub.urls)
+    os.environ['DOCKER_BASE_URL'] = daemon.base_url
+    os.environ['INSTALL_JOB_QUEUE_LIMIT'] = str(args.requests + WARMUP_REQUESTS + 10)
+    os.environ.setdefault('TEMPLATE_UPDATE_JITTER_SECONDS', '0')
+
+    start = time.perf_counter()
+    from app import create_app, ai_manager, template_manager, jobs
+    flask_app = create_app()
+    import_seconds = time.perf_counter() - start
+    flask_app.config['WTF_CSRF_ENABLED'] = False
+    ai_manager._model = StubGenerativeModel(latency=args.ai_latency)
+
+    # The app starts its first refresh in the background on import; this waits for it.
+    startup = import_seconds + _timed_refresh(template_manager, flask_app)
+    for source in range(sources):
+        stub.set_templates(source, [dict(t, description=t['description'] + ' Updated.')
+                                    for t in stub.get_templates(source)])
+    changed = _timed_refresh(template_manager, flask_app)
+    unchanged = _timed_refresh(template_manager, flask_app)
+
+    catalog = template_manager.get_catalog()
+    template_ids = [t.id for t in catalog.templates]
+    client = flask_app.test_client()
+    client.post('/register', data={'username': USERNAME, 'password': PASSWORD, 'confirm_password': PASSWORD})
+
+    def install(rng):
+        # Every install deploys to the fake daemon; one in ten asks the stub AI for the compose file.
+        return {'template_id': rng.choice(template_ids), 'deploy': True, 'use_ai': rng.random() < 0.1}
+
+    endpoints = {}
+    for endpoint in args.endpoints:
+        endpoints[endpoint] = _load(flask_app, endpoint, template_ids, args.requests, args.concurrency, install)
+
+    job_manager = jobs.get_job_manager(flask_app)
+    deadline = time.monotonic() + 120
+    while job_manager.active_count() and time.monotonic() < deadline:
+        time.sleep(0.05)
+    # Only the most recent finished jobs are retained, so these counts are a sample.
+    job_statuses = {}
+    for job in job_manager.list(limit=jobs.MAX_FINISHED_JOBS):
+        job_statuses[job.status] = job_statuses.get(job.status, 0) + 1
+
+    stub.__exit__(None, None, None)
+    daemon.__exit__(None, None, None)
+    return {
+        'size': args.size,
+        'templates': len(catalog),
+        'sources': sources,
+        'import_seconds': round(import_seconds, 3),
+        'refresh_seconds': {
+            'startup': round(startup, 3),
+            'changed': round(changed, 3),
+            'unchanged': round(unchanged, 3),
+        },
+        'endpoints': endpoints,
+        'install_jobs': job_statuses,
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+    }
+
+
+# Parent process: all sizes
+
+def run_all(args):
+    results = []
+    for size in args.sizes:
+        data_dir = tempfile.mkdtemp(prefix='dockyard-bench-')
+        env = dict(os.environ, DOCKYARD_DATA_DIR=data_dir)
+        command = [sys.executable, os.path.abspath(__file__), '--child', '--size', str(size),
+                   '--requests', str(args.requests), '--concurrency', str(args.concurrency),
+                   '--sources', str(args.sources), '--containers', str(args.containers),
+                   '--ai-latency', str(args.ai_latency), '--endpoints', ','.join(args.endpoints)]
+        print(f"size={size} ...", file=sys.stderr, flush=True)
+        try:
+            completed = subprocess.run(command, env=env, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                       text=True, check=True)
+        finally:
+            shutil.rmtree(data_dir, ignore_errors=True)
+        results.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+    return results
+
+
+def print_results(results):
+    for result in results:
+        refresh = result['refresh_seconds']
+        print(f"\n{result['templates']} templates from {result['sources']} source(s): "
+              f"startup={refresh['startup']:.2f}s refresh changed={refresh['changed']:.2f}s "
+              f"unchanged={refresh['unchanged']:.2f}s, peak RSS={result['peak_rss_mb']:.0f} MiB")
+        print(f"  {'endpoint':<16}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'errors':>8}")
+        for endpoint, stats in result['endpoints'].items():
+            print(f"  {endpoint:<16}{stats['throughput_rps']:>10.1f}{stats['p50_ms']:>10.2f}"
+                  f"{stats['p99_ms']:>10.2f}{stats['errors']:>8}")
+        print(f"  install jobs: {', '.join(f'{n} {status}' for status, n in sorted(result['install_jobs'].items()))}")
+
+
+def _comparable(result):
+    """Flattens one size's result to {metric: (value, lower_is_better)}."""
+    metrics = {f"refresh.{k}": (v, True) for k, v in result['refresh_seconds'].items()}
+    metrics['peak_rss_mb'] = (result['peak_rss_mb'], True)
+    for endpoint, stats in result['endpoints'].items():
+        metrics[f"{endpoint}.p50_ms"] = (stats['p50_ms'], True)
+        metrics[f"{endpoint}.p99_ms"] = (stats['p99_ms'], True)
+        metrics[f"{endpoint}.throughput_rps"] = (stats['throughput_rps'], False)
+    return metrics
+
+
+def compare(baseline, results):
+    """Prints the metrics that moved by more than COMPARE_THRESHOLD against a previous run."""
+    print(f"\nCompared with {baseline.get('commit') or 'baseline'}:")
+    previous = {r['size']: r for r in baseline['results']}
+    for result in results:
+        old = previous.get(result['size'])
+        if old is None:
+            continue
+        old_metrics = _comparable(old)
+        for name, (value, lower_is_better) in _comparable(result).items():
+            if name not in old_metrics or not old_metrics[name][0]:
+                continue
+            change = value / old_metrics[name][0] - 1
+            if abs(change) < COMPARE_THRESHOLD:
+                continue
+            worse = change > 0 if lower_is_better else change < 0
+            print(f"  size={result['size']:<6} {name:<28} {old_metrics[name][0]:>10} -> {value:<10} "
+                  f"{change:+.0%} {'REGRESSION' if worse else 'improvement'}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='100,1000,10000,50000', help='comma-separated catalog sizes')
+    parser.add_argument('--requests', type=int, default=200, help='timed requests per endpoint')
+    parser.add_argument('--concurrency', type=int, default=4, help='concurrent clients')
+    parser.add_argument('--sources', type=int, default=4, help='template sources the catalog is split across')
+    parser.add_argument('--containers', type=int, default=5, help='containers on the fake Docker daemon')
+    parser.add_argument('--ai-latency', type=float, default=0.05, help='stub AI model latency, in seconds')
+    parser.add_argument('--endpoints', default=','.join(ENDPOINTS), help='comma-separated subset of ' + ','.join(ENDPOINTS))
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    parser.add_argument('--compare', help='JSON results of an earlier run to compare against')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--size', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    args.endpoints = [e for e in args.endpoints.split(',') if e]
+    unknown = set(args.endpoints) - set(ENDPOINTS)
+    if unknown:
+        parser.error(f"unknown endpoints: {', '.join(sorted(unknown))}")
+
+    if args.child:
+        print(json.dumps(run_size(args)), flush=True)
+        # Skip interpreter teardown; the scheduler and job threads don't need a clean exit.
+        os._exit(0)
+
+    args.sizes = [int(s) for s in args.sizes.split(',') if s]
+    results = run_all(args)
+    print_results(results)
+    report = {
+        'commit': git_commit(),
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'parameters': {'requests': args.requests, 'concurrency': args.concurrency, 'sources': args.sources,
+                       'containers': args.containers, 'ai_latency': args.ai_latency},
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nWrote {args.output}")
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), results)
+
+
+if __name__ == '__main__':
+    main()
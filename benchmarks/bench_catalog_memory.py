@@ -0,0 +1,94 @@
+"""
+Catalog entry memory: plain dicts vs compact Template records.
+
+Parses merged template sources and reports the memory retained per template by the
+catalog entries in their previous form (a dict copy of each upstream template plus an
+'id' key) and as Template records. By default it uses --sources synthetic sources of
+--templates each, every one a partial mirror of the first (merged community lists
+repeat many of the same templates); pass real Portainer template.json files or URLs
+with --source to measure those instead.
+
+    python benchmarks/bench_catalog_memory.py --sources 3 --templates 10000
+    python benchmarks/bench_catalog_memory.py --source templates-a.json --source https://example.com/templates.json
+"""
+import argparse
+import gc
+import json
+import tracemalloc
+
+import requests
+
+from stub_servers import make_templates
+from app.catalog import make_template_id
+from app.template_record import Template
+
+
+def load_bodies(args):
+    if args.source:
+        bodies = []
+        for source in args.source:
+            if source.startswith(('http://', 'https://')):
+                bodies.append(requests.get(source, timeout=30).content)
+            else:
+                with open(source, 'rb') as f:
+                    bodies.append(f.read())
+        return bodies
+    bodies = []
+    for n in range(args.sources):
+        # Source n carries the first source's templates from every (n + 1)-th one on,
+        # plus as many of its own.
+        shared = make_templates(args.templates)[n::n + 1]
+        own = make_templates(args.templates - len(shared), prefix=f'Src{n} App')
+        bodies.append(json.dumps({'version': '2', 'templates': shared + own}).encode('utf-8'))
+    return bodies
+
+
+def templates_of(body):
+    data = json.loads(body)
+    return data['templates'] if isinstance(data, dict) else data
+
+
+def as_dicts(templates):
+    entries = []
+    for template in templates:
+        entry = dict(template)
+        entry['id'] = make_template_id(template)
+        entries.append(entry)
+    return entries
+
+
+def as_records(templates):
+    return [Template.from_dict(t, make_template_id(t)) for t in templates]
+
+
+def retained(bodies, build):
+    gc.collect()
+    tracemalloc.start()
+    entries = []
+    for body in bodies:
+        entries.extend(build(templates_of(body)))
+    gc.collect()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return len(entries), current
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sources', type=int, default=3)
+    parser.add_argument('--templates', type=int, default=10000, help='templates per synthetic source')
+    parser.add_argument('--source', action='append', help='template.json file or URL (repeatable)')
+    args = parser.parse_args()
+
+    bodies = load_bodies(args)
+    print(f"{len(bodies)} source(s), {sum(len(b) for b in bodies) / 2**20:.1f} MiB of JSON")
+    results = {}
+    for label, build in (('dict entries', as_dicts), ('Template records', as_records)):
+        count, size = retained(bodies, build)
+        results[label] = size
+        print(f"{label:>17}: {count} templates, {size / 2**20:7.1f} MiB, {size / max(count, 1):7.0f} bytes/template")
+    print(f"saved: {1 - results['Template records'] / results['dict entries']:.0%}")
+
+
+if __name__ == '__main__':
+    main()
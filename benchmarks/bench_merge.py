@@ -0,0 +1,96 @@
+"""
+Cross-source merge benchmark.
+
+Builds --sources synthetic sources totalling --templates templates: the first holds
+the originals, the others mirror most of them with the variations seen in merged
+community lists (other title spelling or suffix, another image tag, an extra note)
+plus templates of their own. Reports the time of the merge stage and of the whole
+catalog build against a refresh budget, the index cards before (exact-title groups)
+and after merging, and the memory of the catalog entries with and without variant deltas.
+
+    python benchmarks/bench_merge.py --templates 50000 --sources 5 --budget 30
+"""
+import argparse
+import gc
+import time
+import tracemalloc
+
+from stub_servers import make_templates
+from app import merge
+from app.catalog import Catalog, make_template_id
+from app.template_record import Template
+
+
+def make_sources(total, sources):
+    per_source = total // sources
+    originals = make_templates(per_source)
+    merged = list(originals)
+    for n in range(1, sources):
+        mirrored = []
+        for i, template in enumerate(originals[:per_source * 3 // 4]):
+            variant = dict(template)
+            if i % 3 == 0:
+                variant['title'] = template['title'].upper()
+            elif i % 3 == 1:
+                variant['title'] = f"{template['title']} (mirror {n})"
+            variant['image'] = template['image'].replace(':latest', f':{n}.0')
+            if i % 2:
+                variant['note'] = f'Mirrored by source {n}.'
+            mirrored.append(variant)
+        own = make_templates(per_source - len(mirrored), prefix=f'Src{n} App')
+        merged.extend(mirrored + own)
+    return merged
+
+
+def entry_memory(templates, with_deltas):
+    clusters = merge.cluster_templates(templates)
+    gc.collect()
+    tracemalloc.start()
+    entries = []
+    for positions in clusters:
+        base = None
+        for position in positions:
+            entry = Template.from_dict(templates[position], make_template_id(templates[position]),
+                                       base=base if with_deltas else None)
+            if base is None:
+                base = entry
+            entries.append(entry)
+    gc.collect()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return current
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--templates', type=int, default=50000)
+    parser.add_argument('--sources', type=int, default=5)
+    parser.add_argument('--budget', type=float, default=30, help='refresh budget in seconds (TEMPLATE_REFRESH_DEADLINE)')
+    args = parser.parse_args()
+
+    templates = make_sources(args.templates, args.sources)
+    print(f"{len(templates)} templates from {args.sources} sources")
+
+    start = time.perf_counter()
+    clusters = merge.cluster_templates(templates)
+    merge_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    catalog = Catalog(templates)
+    build_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    Catalog(templates, previous=catalog)
+    rebuild_seconds = time.perf_counter() - start
+
+    print(f"merge stage: {merge_seconds:.2f}s ({len(clusters)} clusters)")
+    print(f"catalog build: {build_seconds:.2f}s cold, {rebuild_seconds:.2f}s from the previous catalog "
+          f"({build_seconds / args.budget:.0%} of the {args.budget:.0f}s budget)")
+    exact_title_cards = len({t['title'] for t in templates})
+    print(f"index cards: {exact_title_cards} by exact title, {len(catalog.grouped_templates)} merged")
+
+    full = entry_memory(templates, with_deltas=False)
+    delta = entry_memory(templates, with_deltas=True)
+    print(f"entries: {full / len(templates):.0f} bytes/template full, {delta / len(templates):.0f} with variant deltas")
+
+
+if __name__ == '__main__':
+    main()
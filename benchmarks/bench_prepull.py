@@ -0,0 +1,86 @@
+"""
+Image pre-pull benchmark against a fake Docker API socket.
+
+Pins N templates whose images repeat across templates (the same image listed by several
+sources) and share repositories (several tags of one image), then pre-pulls them with one
+worker and with the configured concurrency. Each fresh daemon starts with no images;
+every pulled layer takes --latency seconds. Reports wall time, the number of pulls after
+dedupe, and the layers that were downloaded versus already present.
+
+The pre-puller's behaviour (dedupe, concurrency cap, bandwidth budget, local images) is
+covered by tests/test_image_prepull.py.
+
+    python benchmarks/bench_prepull.py --templates 24 --repositories 6 --latency 0.2
+"""
+import argparse
+import time
+
+from stub_servers import FakeDockerDaemon, scratch_app_env
+
+
+def make_pins(templates, repositories, tags):
+    pins = []
+    for n in range(templates):
+        repository = f'example/app-{n % repositories}'
+        tag = f'{(n // repositories) % tags + 1}.0'
+        # Sources spell the same image differently; the pre-puller must treat them as one.
+        image = f'docker.io/{repository}:{tag}' if n % 2 else f'{repository}:{tag}'
+        pins.append({'template_id': f'template-{n}', 'image': image})
+    return pins
+
+
+def run(pins, latency, max_concurrent, max_bytes_per_second=0, bandwidth_window=None, present=()):
+    import docker
+    from app.image_prepull import PrePuller, BandwidthBudget
+
+    with FakeDockerDaemon(containers=0, pull_latency=latency) as daemon:
+        daemon.images.update(present)
+        client = docker.DockerClient(base_url=daemon.base_url)
+        prepuller = PrePuller(lambda: client, max_concurrent=max_concurrent, max_bytes_per_second=max_bytes_per_second)
+        if bandwidth_window:
+            prepuller.bandwidth = BandwidthBudget(max_bytes_per_second, window=bandwidth_window)
+        start = time.perf_counter()
+        prepuller.run_once(pins)
+        elapsed = time.perf_counter() - start
+        status = prepuller.status()
+        local = prepuller.local_images.get(client)
+        client.close()
+    return {
+        'elapsed': elapsed,
+        'pulls': len(daemon.pulls),
+        'images': len(status),
+        'failed': sum(1 for s in status if s['state'] != 'local'),
+        'layers_downloaded': daemon.downloaded_layers,
+        'layers_shared': sum(s['layers_shared'] for s in status),
+        'local': local,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--templates', type=int, default=24)
+    parser.add_argument('--repositories', type=int, default=6)
+    parser.add_argument('--tags', type=int, default=2, help='distinct tags per repository')
+    parser.add_argument('--latency', type=float, default=0.2, help='injected download time per layer, in seconds')
+    parser.add_argument('--concurrency', type=int, default=4)
+    args = parser.parse_args()
+
+    with scratch_app_env():
+        from app import create_app
+        app = create_app()
+        pins = make_pins(args.templates, args.repositories, args.tags)
+        with app.app_context():
+            sequential = run(pins, args.latency, max_concurrent=1)
+            concurrent = run(pins, args.latency, max_concurrent=args.concurrency)
+    assert sequential['failed'] == concurrent['failed'] == 0
+    assert concurrent['pulls'] == concurrent['images']
+
+    print(f"templates={args.templates} repositories={args.repositories} tags={args.tags} latency={args.latency}s/layer")
+    print(f"unique images after dedupe: {concurrent['images']} (daemon pulls: {concurrent['pulls']})")
+    for label, result in (('1 worker', sequential), (f'{args.concurrency} workers', concurrent)):
+        print(f"{label:>10}: {result['elapsed']:.2f}s, layers downloaded={result['layers_downloaded']}, "
+              f"already present={result['layers_shared']}, failed={result['failed']}, local images={len(result['local'])}")
+
+
+if __name__ == '__main__':
+    main()
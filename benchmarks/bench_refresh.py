@@ -0,0 +1,50 @@
+"""
+Refresh wall-clock benchmark: sequential vs concurrent template source fetching.
+
+Starts a local stub HTTP server that serves N sources, each delayed by a fixed
+latency, and times fetching all of them one after another (the old behaviour)
+against template_manager.fetch_all_sources. The source cache is cleared before each
+pass, so both download every body instead of revalidating (304).
+
+    python benchmarks/bench_refresh.py --sources 12 --latency 0.5
+"""
+import argparse
+import os
+import time
+
+from stub_servers import TemplateSourceServer, scratch_app_env
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sources', type=int, default=12, help='number of template sources')
+    parser.add_argument('--latency', type=float, default=0.5, help='injected latency per source, in seconds')
+    parser.add_argument('--templates', type=int, default=100, help='templates per source')
+    args = parser.parse_args()
+
+    with scratch_app_env(), \
+            TemplateSourceServer(sources=args.sources, templates_per_source=args.templates, latency=args.latency) as stub:
+        os.environ['TEMPLATE_SOURCES_URL'] = ','.join(stub.urls)
+        from app import create_app, template_manager, source_cache
+        app = create_app()
+
+        with app.app_context():
+            source_cache.clear()
+            start = time.perf_counter()
+            sequential = [template_manager.fetch_templates_from_url(url) for url in stub.urls]
+            sequential_time = time.perf_counter() - start
+
+            source_cache.clear()
+            start = time.perf_counter()
+            concurrent = template_manager.fetch_all_sources(stub.urls)
+            concurrent_time = time.perf_counter() - start
+
+        assert [len(t) for t in sequential] == [len(t) for t in concurrent]
+        print(f"sources={args.sources} latency={args.latency}s templates/source={args.templates}")
+        print(f"sequential: {sequential_time:.3f}s")
+        print(f"concurrent: {concurrent_time:.3f}s (max_workers={app.config['TEMPLATE_FETCH_MAX_WORKERS']})")
+        print(f"speedup:    {sequential_time / concurrent_time:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
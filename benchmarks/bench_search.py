@@ -0,0 +1,66 @@
+"""
+Search latency benchmark for the /api/templates backend.
+
+Builds a Catalog from N synthetic templates and times search_catalog (including
+JSON serialization of the page) over a mix of queries, filters and cursors.
+
+    python benchmarks/bench_search.py --templates 10000
+"""
+import argparse
+import json
+import random
+import statistics
+import time
+
+from stub_servers import make_templates
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--templates', type=int, default=10000, help='catalog size')
+    parser.add_argument('--iterations', type=int, default=2000, help='number of timed searches')
+    args = parser.parse_args()
+
+    from app.catalog import Catalog
+    from app import search
+
+    templates = make_templates(args.templates)
+    start = time.perf_counter()
+    catalog = Catalog(templates)
+    build_time = time.perf_counter() - start
+
+    rng = random.Random(42)
+    queries = [
+        {'text': 'app'},
+        {'text': 'synthetic template'},
+        {'text': f'app {rng.randrange(args.templates)}'},
+        {'text': 'bench', 'category': 'Group 3'},
+        {'text': '', 'template_type': '1'},
+        {'text': 'example app-1'},
+        {'text': 'nomatch'},
+    ]
+
+    samples = []
+    for i in range(args.iterations):
+        query = dict(queries[i % len(queries)])
+        if i % 3 == 0:
+            # Every third search fetches the next page of the same query.
+            first = search.search_catalog(catalog, **query)
+            if first['next_cursor']:
+                query['cursor'] = first['next_cursor']
+        start = time.perf_counter()
+        json.dumps(search.search_catalog(catalog, **query))
+        samples.append((time.perf_counter() - start) * 1000)
+
+    print(f"templates={args.templates} catalog build={build_time * 1000:.0f} ms")
+    print(f"search p50={statistics.median(samples):.3f} ms "
+          f"p99={percentile(samples, 99):.3f} ms max={max(samples):.3f} ms over {len(samples)} searches")
+
+
+if __name__ == '__main__':
+    main()
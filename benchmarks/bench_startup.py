@@ -0,0 +1,119 @@
+"""
+Cold start benchmark: times `import app` plus `create_app()` (the whole startup path of
+a worker) in fresh processes and reports the median of each startup phase.
+
+Each run gets a scratch data dir and no reachable template sources, so nothing is
+fetched. With --follower, a leader process holds the scheduler lock first, so the timed
+processes boot like the second and later gunicorn workers. --importtime lists the
+modules with the largest cumulative import time (python -X importtime) of one run.
+
+    python benchmarks/bench_startup.py --runs 10 --follower --importtime 15
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from stub_servers import APP_ROOT
+
+CHILD = """
+import json, sys, time
+started_at = time.perf_counter()
+import app
+app.create_app()
+from app import instrumentation
+print(json.dumps({'wall': time.perf_counter() - started_at, 'phases': instrumentation.startup_phases()}))
+"""
+LEADER = "import app, sys; app.create_app(); print('ready', flush=True); sys.stdin.read()"
+
+
+def _env(data_dir):
+    # An unroutable source: the leader's background refresh fails fast and fetches nothing.
+    return dict(os.environ, DOCKYARD_DATA_DIR=data_dir, TEMPLATE_SOURCES_URL='http://127.0.0.1:9/none.json')
+
+
+def _run_child(data_dir, importtime=False):
+    command = [sys.executable] + (['-X', 'importtime'] if importtime else []) + ['-c', CHILD]
+    completed = subprocess.run(command, cwd=APP_ROOT, env=_env(data_dir), capture_output=True, text=True, check=True)
+    return json.loads(completed.stdout.strip().splitlines()[-1]), completed.stderr
+
+
+def _slowest_imports(stderr, count):
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        rows.append((int(cumulative), name.rstrip()))
+    top_level = [(us, name) for us, name in rows if not name.startswith('  ')]
+    return sorted(rows, reverse=True)[:count], sum(us for us, _ in top_level)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--follower', action='store_true', help='boot as a follower of a running leader')
+    parser.add_argument('--importtime', type=int, default=0, metavar='N', help='list the N slowest imports')
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    args = parser.parse_args()
+
+    data_dir = tempfile.mkdtemp(prefix='dockyard-startup-')
+    leader = None
+    try:
+        if args.follower:
+            leader = subprocess.Popen([sys.executable, '-c', LEADER], cwd=APP_ROOT, env=_env(data_dir),
+                                      stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+            if leader.stdout.readline().strip() != 'ready':
+                raise RuntimeError("Leader process failed to start.")
+
+        runs = []
+        for _ in range(args.runs):
+            start = time.perf_counter()
+            result, _ = _run_child(data_dir)
+            result['process_wall'] = time.perf_counter() - start
+            runs.append(result)
+            if not args.follower:
+                # Fresh state for each run: otherwise later runs would find the first one's files.
+                shutil.rmtree(data_dir, ignore_errors=True)
+                os.makedirs(data_dir)
+        slowest = None
+        if args.importtime:
+            _, stderr = _run_child(data_dir, importtime=True)
+            slowest = _slowest_imports(stderr, args.importtime)
+    finally:
+        if leader is not None:
+            leader.stdin.close()
+            leader.wait(timeout=30)
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+    phases = {name: statistics.median(r['phases'][name] for r in runs) for name in runs[0]['phases']}
+    summary = {
+        'role': 'follower' if args.follower else 'leader',
+        'runs': len(runs),
+        'startup_ms': round(statistics.median(r['wall'] for r in runs) * 1000, 1),
+        'process_ms': round(statistics.median(r['process_wall'] for r in runs) * 1000, 1),
+        'phases_ms': {name: round(seconds * 1000, 1) for name, seconds in phases.items()},
+    }
+    print(f"{summary['role']}: median of {len(runs)} runs: startup {summary['startup_ms']:.0f} ms, "
+          f"whole process {summary['process_ms']:.0f} ms")
+    for name, ms in summary['phases_ms'].items():
+        print(f"  {name:<18}{ms:>8.1f} ms")
+    if slowest:
+        rows, total = slowest
+        summary['slowest_imports_ms'] = {name.strip(): round(us / 1000, 1) for us, name in rows}
+        print(f"\nslowest imports (cumulative, {total / 1000:.0f} ms of imports in total):")
+        for us, name in rows:
+            print(f"  {us / 1000:>8.1f} ms  {name.strip()}")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(summary, f, indent=2)
+        print(f"\nWrote {args.output}")
+
+
+if __name__ == '__main__':
+    main()
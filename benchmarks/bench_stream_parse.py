@@ -0,0 +1,64 @@
+"""
+Peak memory of fetching one huge template source.
+
+Serves a synthetic source with N templates (100k by default) from a local stub and
+measures the tracemalloc peak of:
+  * the previous approach: requests' response.json() on the whole body, and
+  * fetch_templates_from_url, which streams the body to the source cache and parses
+    templates incrementally (the stub sends no Content-Length, so the streaming path
+    is used regardless of size).
+
+    python benchmarks/bench_stream_parse.py --templates 100000
+"""
+import argparse
+import gc
+import time
+import tracemalloc
+
+import requests
+
+from stub_servers import TemplateSourceServer, scratch_app_env
+
+
+def measure(label, func):
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:>22}: {len(result):>7} templates, peak {peak / 2**20:7.1f} MiB, "
+          f"retained {current / 2**20:7.1f} MiB, {elapsed:.2f}s")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--templates', type=int, default=100000)
+    args = parser.parse_args()
+
+    with scratch_app_env(), TemplateSourceServer(sources=1, templates_per_source=args.templates, chunked=True) as server:
+        url = server.urls[0]
+        from app import create_app
+        app = create_app()
+        from app import template_manager
+        app.config['TEMPLATE_SOURCE_MAX_TEMPLATES'] = args.templates
+        app.config['TEMPLATE_SOURCE_MAX_BYTES'] = 0
+        body_size = len(server.body(0))
+        print(f"source: {args.templates} templates, {body_size / 2**20:.1f} MiB body")
+
+        def buffered():
+            data = requests.get(url, timeout=60).json()
+            return data['templates']
+
+        def streamed():
+            with app.app_context():
+                return template_manager.fetch_templates_from_url(url, timeout=60)
+
+        measure('response.json()', buffered)
+        measure('streaming fetch', streamed)
+
+
+if __name__ == '__main__':
+    main()
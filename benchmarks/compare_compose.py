@@ -0,0 +1,122 @@
+"""
+Corpus check for the native compose converter.
+
+Converts every template in a template.json (a local file, or a URL) with the native
+converter, reports how many it handles and how fast, and checks that each output is
+valid YAML with the expected image, ports, volumes and environment. With --ai (needs
+GOOGLE_API_KEY), it also generates each template with the AI and compares the two
+on those fields.
+
+    python benchmarks/compare_compose.py --file template.json
+    python benchmarks/compare_compose.py --url https://.../template.json --ai --limit 20
+
+Requires PyYAML to parse the generated files; it is a benchmark-only dependency
+(pip install -r benchmarks/requirements.txt). Stack files are downloaded before the
+timed conversion, which itself never touches the network.
+"""
+import argparse
+import json
+import statistics
+import sys
+import time
+
+import requests
+from stub_servers import scratch_app_env  # also puts dockyard_app/ on sys.path
+
+try:
+    import yaml
+except ImportError:
+    sys.exit("compare_compose.py needs PyYAML: pip install -r benchmarks/requirements.txt")
+
+
+def summarize(compose_text):
+    """Reduces a compose file to the fields both generators are asked to produce."""
+    document = yaml.safe_load(compose_text) or {}
+    services = document.get('services') or {}
+    if len(services) != 1:
+        return {'services': sorted(services)}
+    service = next(iter(services.values()))
+    environment = service.get('environment') or {}
+    if isinstance(environment, list):
+        environment = dict(item.split('=', 1) if '=' in item else (item, '') for item in environment)
+    return {
+        'image': service.get('image'),
+        'ports': sorted(str(p) for p in service.get('ports') or []),
+        'volume_targets': sorted(str(v).split(':')[1] for v in service.get('volumes') or [] if ':' in str(v)),
+        'environment': sorted(environment),
+        'restart': service.get('restart'),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--file', help='path to a template.json')
+    source.add_argument('--url', help='URL of a template.json')
+    parser.add_argument('--ai', action='store_true', help='also generate with the AI model and compare')
+    parser.add_argument('--limit', type=int, default=None, help='only check the first N templates')
+    args = parser.parse_args()
+
+    if args.file:
+        with open(args.file) as f:
+            data = json.load(f)
+    else:
+        data = requests.get(args.url, timeout=30).json()
+    templates = data['templates'] if isinstance(data, dict) else data
+    templates = templates[:args.limit] if args.limit else templates
+
+    with scratch_app_env():
+        from app import create_app, compose_converter, ai_manager
+        app = create_app()
+
+        converted, unsupported, invalid, mismatched = 0, 0, 0, 0
+        timings = []
+        with app.app_context():
+            for template in templates:
+                title = template.get('title', '?')
+                try:
+                    stackfile = compose_converter.fetch_stackfile(template) if compose_converter.is_stack(template) else None
+                    start = time.perf_counter()
+                    native = compose_converter.convert_template(template, stackfile)
+                except compose_converter.ConversionError as e:
+                    unsupported += 1
+                    print(f"UNSUPPORTED {title}: {e}")
+                    continue
+                timings.append((time.perf_counter() - start) * 1000)
+                converted += 1
+                try:
+                    native_summary = summarize(native)
+                except yaml.YAMLError as e:
+                    invalid += 1
+                    print(f"INVALID YAML {title}: {e}")
+                    continue
+                if template.get('image') and native_summary.get('image') != template['image']:
+                    invalid += 1
+                    print(f"WRONG IMAGE {title}: {native_summary.get('image')} != {template['image']}")
+
+                if args.ai:
+                    ai_text, error = ai_manager.generate_compose_file(template)
+                    if error:
+                        print(f"AI ERROR {title}: {error}")
+                        continue
+                    try:
+                        ai_summary = summarize(ai_text)
+                    except yaml.YAMLError:
+                        print(f"AI INVALID YAML {title}")
+                        continue
+                    differences = {k: (native_summary.get(k), ai_summary.get(k))
+                                   for k in native_summary if native_summary.get(k) != ai_summary.get(k)}
+                    if differences:
+                        mismatched += 1
+                        print(f"DIFFERS {title}: {differences}")
+
+    print()
+    print(f"templates={len(templates)} converted={converted} unsupported={unsupported} invalid={invalid}")
+    if timings:
+        print(f"native conversion: median {statistics.median(timings):.3f} ms, max {max(timings):.3f} ms")
+    if args.ai:
+        print(f"native vs AI: {converted - mismatched} of {converted} agree on image/ports/volumes/env/restart")
+
+
+if __name__ == '__main__':
+    main()
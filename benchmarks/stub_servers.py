@@ -0,0 +1,386 @@
+"""
+Local stub servers used by the DockYard benchmarks.
+
+Nothing in here talks to the network: template sources are served from
+127.0.0.1 with an optional injected latency per request.
+"""
+import contextlib
+import hashlib
+import json
+import os
+import re
+import shutil
+import socketserver
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Make the Flask app importable (config.py and the app package live in dockyard_app/).
+APP_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'dockyard_app'))
+if APP_ROOT not in sys.path:
+    sys.path.insert(0, APP_ROOT)
+
+
+@contextlib.contextmanager
+def scratch_app_env():
+    """
+    Points the app at a temporary data dir (DOCKYARD_DATA_DIR) with the scheduler off, so a
+    benchmark never touches /app_data and no background refresh runs during the timed part.
+    Enter it before importing the app; the directory is removed on exit.
+    """
+    data_dir = tempfile.mkdtemp(prefix='dockyard-bench-')
+    saved = {key: os.environ.get(key) for key in ('DOCKYARD_DATA_DIR', 'SCHEDULER_ENABLED')}
+    os.environ.update(DOCKYARD_DATA_DIR=data_dir, SCHEDULER_ENABLED='0')
+    try:
+        yield data_dir
+    finally:
+        for key, value in saved.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+def make_templates(count, prefix='App'):
+    """Builds a list of synthetic Portainer v2 container templates."""
+    templates = []
+    slug = prefix.lower().replace(' ', '-')
+    for i in range(count):
+        templates.append({
+            'type': 1,
+            'title': f'{prefix} {i}',
+            'name': f'{slug}-{i}',
+            'description': f'Synthetic template number {i} for benchmarking.',
+            'categories': ['Benchmark', f'Group {i % 10}'],
+            'platform': 'linux',
+            'logo': f'https://example.invalid/logos/{i % 50}.png',
+            'image': f'example/{slug}-{i % 200}:latest',
+            'ports': [f'{8000 + (i % 1000)}:80/tcp'],
+            'volumes': [{'container': '/data', 'bind': f'/srv/{slug}-{i}'}],
+            'env': [{'name': 'TZ', 'label': 'Timezone', 'default': 'UTC'}],
+            'restart_policy': 'unless-stopped',
+        })
+    return templates
+
+
+class TemplateSourceServer:
+    """
+    Serves one template.json per path (/source/<n>.json) with a fixed injected latency.
+    Responses carry an ETag and honour If-None-Match with a 304. With `chunked`, bodies
+    are sent with chunked transfer encoding (no Content-Length).
+    Use as a context manager; `urls` lists the source URLs it serves.
+    """
+
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, sources=1, templates_per_source=50, latency=0.0, chunked=False):
+        self.latency = latency
+        self.chunked = chunked
+        self.request_count = 0
+        self.not_modified_count = 0
+        self._bodies = {}
+        for n in range(sources):
+            payload = {'version': '2', 'templates': make_templates(templates_per_source, prefix=f'Src{n} App')}
+            self._bodies[f'/source/{n}.json'] = json.dumps(payload).encode('utf-8')
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    def set_templates(self, source, templates):
+        """Replaces the templates served by source number `source` (its ETag changes with them)."""
+        self._bodies[f'/source/{source}.json'] = json.dumps({'version': '2', 'templates': templates}).encode('utf-8')
+
+    def get_templates(self, source):
+        return json.loads(self._bodies[f'/source/{source}.json'])['templates']
+
+    def body(self, source):
+        return self._bodies[f'/source/{source}.json']
+
+    def _make_handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stub.request_count += 1
+                if stub.latency:
+                    time.sleep(stub.latency)
+                body = stub._bodies.get(self.path)
+                if body is None:
+                    self.send_error(404)
+                    return
+                etag = '"%s"' % hashlib.sha256(body).hexdigest()[:16]
+                if self.headers.get('If-None-Match') == etag:
+                    stub.not_modified_count += 1
+                    self.send_response(304)
+                    self.send_header('ETag', etag)
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header('ETag', etag)
+                self.send_header('Content-Type', 'application/json')
+                if not stub.chunked:
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                    return
+                self.send_header('Transfer-Encoding', 'chunked')
+                self.end_headers()
+                for start in range(0, len(body), stub.CHUNK_SIZE):
+                    chunk = body[start:start + stub.CHUNK_SIZE]
+                    self.wfile.write(f'{len(chunk):x}\r\n'.encode() + chunk + b'\r\n')
+                self.wfile.write(b'0\r\n\r\n')
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    @property
+    def urls(self):
+        return [self.base_url + path for path in self._bodies]
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class FakeDockerDaemon:
+    """
+    Minimal Docker Engine API served over a unix socket, enough for the docker SDK:
+    /_ping, /version, /containers/json, /containers/<id>/stats (one-shot), image pulls
+    (/images/create streams per-layer progress), /images/json, /images/<name>/json and
+    container create/start/inspect. Images share a base layer, and tags of one repository
+    share a second one; layers already present are reported as "Already exists". Counters grow on every stats call so rates are non-zero.
+    `latency` delays stats calls; each pulled layer takes `pull_latency` seconds.
+    `max_active_pulls` records the most pulls that were streaming at the same time.
+    Use `base_url` (unix://...) as DOCKER_BASE_URL.
+    """
+
+    API_VERSION = '1.43'
+    LAYERS_PER_IMAGE = 3
+    LAYER_SIZE = 10 * 1024 * 1024
+
+    def __init__(self, containers=3, latency=0.0, pull_latency=0.0):
+        self.latency = latency
+        self.pull_latency = pull_latency
+        self.stats_calls = 0
+        self.pulls = []
+        self.active_pulls = 0
+        self.max_active_pulls = 0
+        self.images = set()
+        self.layers = set()
+        self.downloaded_layers = 0
+        self.created = {}
+        self.containers = [
+            {'Id': hashlib.sha256(f'container-{n}'.encode()).hexdigest(), 'Names': [f'/fake-app-{n}'],
+             'Image': f'example/fake-app-{n}:latest', 'State': 'running', 'Status': 'Up'}
+            for n in range(containers)
+        ]
+        self._counters = {c['Id']: 0 for c in self.containers}
+        self._lock = threading.Lock()
+        self._dir = tempfile.mkdtemp(prefix='fake-docker-')
+        self.socket_path = os.path.join(self._dir, 'docker.sock')
+        self._server = _UnixHTTPServer(self.socket_path, self._make_handler())
+        self._thread = None
+
+    @property
+    def base_url(self):
+        return f'unix://{self.socket_path}'
+
+    def _stats(self, container_id):
+        with self._lock:
+            self._counters[container_id] += 1
+            tick = self._counters[container_id]
+        return {
+            'read': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'cpu_stats': {'cpu_usage': {'total_usage': tick * 50_000_000}, 'system_cpu_usage': tick * 1_000_000_000, 'online_cpus': 2},
+            'precpu_stats': {},
+            'memory_stats': {'usage': 64 * 1024 * 1024 + tick * 1024, 'limit': 1024 * 1024 * 1024, 'stats': {'inactive_file': 1024 * 1024}},
+            'networks': {'eth0': {'rx_bytes': tick * 2048, 'tx_bytes': tick * 1024}},
+            'blkio_stats': {'io_service_bytes_recursive': [
+                {'major': 8, 'minor': 0, 'op': 'read', 'value': tick * 4096},
+                {'major': 8, 'minor': 0, 'op': 'write', 'value': tick * 8192},
+            ]},
+        }
+
+    def image_layers(self, image):
+        repository = image.rsplit(':', 1)[0]
+        keys = ['base', repository] + [f'{image}-{n}' for n in range(self.LAYERS_PER_IMAGE - 2)]
+        return [hashlib.sha256(f'layer-{key}'.encode()).hexdigest()[:12] for key in keys]
+
+    def _pull_events(self, image):
+        yield {'status': f'Pulling from {image.rsplit(":", 1)[0]}', 'id': image.rsplit(':', 1)[-1]}
+        steps = 4
+        for layer in self.image_layers(image):
+            with self._lock:
+                present = layer in self.layers
+                self.layers.add(layer)
+                if not present:
+                    self.downloaded_layers += 1
+            if present:
+                yield {'status': 'Already exists', 'id': layer, 'progressDetail': {}}
+                continue
+            yield {'status': 'Pulling fs layer', 'id': layer, 'progressDetail': {}}
+            for step in range(1, steps + 1):
+                if self.pull_latency:
+                    time.sleep(self.pull_latency / steps)
+                yield {'status': 'Downloading', 'id': layer,
+                       'progressDetail': {'current': self.LAYER_SIZE * step // steps, 'total': self.LAYER_SIZE}}
+            yield {'status': 'Pull complete', 'id': layer, 'progressDetail': {}}
+        yield {'status': f'Status: Downloaded newer image for {image}'}
+
+    def _make_handler(self):
+        daemon = self
+        stats_path = re.compile(r'^(?:/v[\d.]+)?/containers/([0-9a-f]+)/stats')
+        image_path = re.compile(r'^(?:/v[\d.]+)?/images/(.+)/json$')
+        container_path = re.compile(r'^(?:/v[\d.]+)?/containers/([0-9a-f]+)/(json|start)$')
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def _send_json(self, payload, status=200):
+                body = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.send_header('Api-Version', daemon.API_VERSION)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_HEAD(self):
+                self.do_GET()
+
+            def do_GET(self):
+                path = self.path.split('?', 1)[0]
+                if path.endswith('/_ping'):
+                    body = b'OK'
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'text/plain')
+                    self.send_header('Content-Length', str(len(body)))
+                    self.send_header('Api-Version', daemon.API_VERSION)
+                    self.end_headers()
+                    self.wfile.write(body)
+                elif path.endswith('/version'):
+                    self._send_json({'ApiVersion': daemon.API_VERSION, 'Version': '24.0.0-fake', 'MinAPIVersion': '1.12'})
+                elif path.endswith('/containers/json'):
+                    self._send_json(daemon.containers)
+                elif path.endswith('/images/json'):
+                    self._send_json([{'Id': 'sha256:' + hashlib.sha256(name.encode()).hexdigest(), 'RepoTags': [name]}
+                                     for name in sorted(daemon.images)])
+                elif image_path.match(path):
+                    name = urllib.parse.unquote(image_path.match(path).group(1))
+                    name = name if ':' in name.rsplit('/', 1)[-1] else f'{name}:latest'
+                    if name in daemon.images:
+                        self._send_json({'Id': 'sha256:' + hashlib.sha256(name.encode()).hexdigest(), 'RepoTags': [name]})
+                    else:
+                        self._send_json({'message': f'No such image: {name}'}, status=404)
+                elif container_path.match(path) and container_path.match(path).group(1) in daemon.created:
+                    self._send_json(daemon.created[container_path.match(path).group(1)])
+                else:
+                    match = stats_path.match(path)
+                    if match and match.group(1) in daemon._counters:
+                        daemon.stats_calls += 1
+                        if daemon.latency:
+                            time.sleep(daemon.latency)
+                        self._send_json(daemon._stats(match.group(1)))
+                    else:
+                        self._send_json({'message': f'no such endpoint: {path}'}, status=404)
+
+            def do_POST(self):
+                path, _, query = self.path.partition('?')
+                params = urllib.parse.parse_qs(query)
+                length = int(self.headers.get('Content-Length') or 0)
+                body = json.loads(self.rfile.read(length) or b'{}') if length else {}
+                if path.endswith('/images/create'):
+                    image = f"{params['fromImage'][0]}:{params.get('tag', ['latest'])[0]}"
+                    with daemon._lock:
+                        daemon.pulls.append(image)
+                        daemon.active_pulls += 1
+                        daemon.max_active_pulls = max(daemon.max_active_pulls, daemon.active_pulls)
+                    try:
+                        self.send_response(200)
+                        self.send_header('Content-Type', 'application/json')
+                        self.send_header('Transfer-Encoding', 'chunked')
+                        self.send_header('Api-Version', daemon.API_VERSION)
+                        self.end_headers()
+                        for event in daemon._pull_events(image):
+                            chunk = json.dumps(event).encode('utf-8') + b'\r\n'
+                            self.wfile.write(f'{len(chunk):x}\r\n'.encode() + chunk + b'\r\n')
+                            self.wfile.flush()
+                        daemon.images.add(image)
+                    finally:
+                        with daemon._lock:
+                            daemon.active_pulls -= 1
+                    self.wfile.write(b'0\r\n\r\n')
+                elif path.endswith('/containers/create'):
+                    container_id = hashlib.sha256(f'created-{len(daemon.created)}-{time.time()}'.encode()).hexdigest()
+                    name = params.get('name', [container_id[:12]])[0]
+                    daemon.created[container_id] = {'Id': container_id, 'Name': f'/{name}', 'Config': body,
+                                                    'State': {'Status': 'created'}}
+                    self._send_json({'Id': container_id, 'Warnings': []}, status=201)
+                elif container_path.match(path) and container_path.match(path).group(1) in daemon.created:
+                    daemon.created[container_path.match(path).group(1)]['State']['Status'] = 'running'
+                    self.send_response(204)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                else:
+                    self._send_json({'message': f'no such endpoint: {path}'}, status=404)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+        try:
+            os.unlink(self.socket_path)
+            os.rmdir(self._dir)
+        except OSError:
+            pass
+
+
+class StubGenerativeModel:
+    """
+    Stand-in for google.generativeai.GenerativeModel: sleeps for `latency` seconds and
+    returns a small compose file. `calls` counts generate_content invocations.
+    """
+
+    def __init__(self, latency=1.0):
+        self.latency = latency
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def generate_content(self, prompt):
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.latency)
+
+        class Response:
+            text = "services:\n  app:\n    image: example/app:latest\n    restart: unless-stopped\n"
+
+        return Response()
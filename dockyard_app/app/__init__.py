@@ -1,8 +1,10 @@
+import time
+_import_started_at = time.perf_counter()
+
 import logging
-import os # Import os for path manipulation
 from flask import Flask
+from flask.json.provider import DefaultJSONProvider
 from config import Config
-from apscheduler.schedulers.background import BackgroundScheduler
 from flask_login import LoginManager
 from flask_bcrypt import Bcrypt
 
@@ -14,58 +16,94 @@ from flask_bcrypt import Bcrypt
 # template_dir = os.path.join(app_root_path, 'templates')
 # For simplicity and common Flask patterns, '../templates' relative to the blueprint/app location is fine.
 
-app = Flask(__name__, template_folder='../templates', static_folder='../static')
-app.config.from_object(Config)
-
-bcrypt = Bcrypt(app)
-login_manager = LoginManager(app)
-login_manager.login_view = 'login'
-login_manager.login_message_category = 'info'
-
-from app.models import User
-
-@login_manager.user_loader
-def load_user(user_id):
-    return User.find_by_id(int(user_id))
-
-# Basic logging setup
-logging.basicConfig(level=logging.INFO)
-if not app.debug:
-    app.logger.setLevel(logging.INFO)
-else:
-    app.logger.setLevel(logging.DEBUG)
-
-app.logger.info("DockYard application starting up...")
-app.logger.info(f"Flask template_folder set to: {app.template_folder}")
-app.logger.info(f"Flask static_folder set to: {app.static_folder}")
-
-
-from app import routes
-from app import template_manager
-
-def initialize_templates_and_scheduler(flask_app):
-    with flask_app.app_context():
-        flask_app.logger.info("Attempting initial template cache population...")
-        template_manager.update_cached_templates()
-
-        scheduler = BackgroundScheduler(daemon=True)
-        job_hours = flask_app.config.get('TEMPLATE_UPDATE_INTERVAL_HOURS', 4)
-        scheduler.add_job(
-            func=template_manager.update_cached_templates,
-            trigger='interval',
-            hours=job_hours,
-            id='update_templates_job',
-            replace_existing=True
-        )
+from app.template_record import to_jsonable
+from app import instrumentation
+
+class CatalogJSONProvider(DefaultJSONProvider):
+    """jsonify/tojson that also serialize catalog Template records."""
+
+    @staticmethod
+    def default(o):
         try:
-            scheduler.start()
-            flask_app.logger.info(f"APScheduler started. Template update job scheduled every {job_hours} hours.")
-        except Exception as e:
-            flask_app.logger.error(f"APScheduler could not be started (maybe already running?): {e}")
+            return to_jsonable(o)
+        except TypeError:
+            return DefaultJSONProvider.default(o)
+
+# Set by create_app(). Routes and helpers import these from the package, so they are
+# imported only from inside the factory.
+app = None
+bcrypt = None
+login_manager = None
+_config_class = None
+
+def create_app(config_class=Config):
+    """
+    Builds and starts the application. Each startup phase is timed; the report is logged
+    and exported as dockyard_startup_phase_seconds. Heavy optional subsystems (AI client,
+    Docker client, host metrics, the scheduler library) are imported on first use, not here.
+
+    Routes are registered on the package-level `app`, so there is one application per
+    process: later calls with the same config_class return it, and a different one raises
+    RuntimeError.
+    """
+    global app, bcrypt, login_manager, _config_class
+    if app is not None:
+        if config_class is not _config_class:
+            raise RuntimeError(f"The application was already created with {_config_class.__name__}; "
+                               f"it can't be created again with {config_class.__name__}.")
+        return app
+    _config_class = config_class
+    startup = instrumentation.StartupTimer(_import_started_at)
+    startup.mark('imports')
+
+    app = Flask(__name__, template_folder='../templates', static_folder='../static')
+    app.json = CatalogJSONProvider(app)
+    app.config.from_object(config_class)
+    instrumentation.init_app(app)
+
+    bcrypt = Bcrypt(app)
+    login_manager = LoginManager(app)
+    login_manager.login_view = 'login'
+    login_manager.login_message_category = 'info'
+
+    from app.models import User
+
+    @login_manager.user_loader
+    def load_user(user_id):
+        return User.find_by_id(int(user_id))
+
+    # Basic logging setup
+    logging.basicConfig(level=logging.INFO)
+    if not app.debug:
+        app.logger.setLevel(logging.INFO)
+    else:
+        app.logger.setLevel(logging.DEBUG)
+
+    app.logger.info("DockYard application starting up...")
+    app.logger.info(f"Flask template_folder set to: {app.template_folder}")
+    app.logger.info(f"Flask static_folder set to: {app.static_folder}")
+    startup.mark('app')
+
+    from app import routes
+    from app import template_manager
+    from app import scheduler
+    startup.mark('routes')
 
-        import atexit
-        atexit.register(lambda: scheduler.shutdown() if scheduler.running else None)
+    with app.app_context():
+        # Serve the last persisted catalog right away; the network refresh runs in the background.
+        app.logger.info("Loading template catalog snapshot...")
+        if not template_manager.load_cached_templates_from_snapshot():
+            app.logger.info("No catalog snapshot available. Templates will appear once the background refresh completes.")
+        startup.mark('catalog_snapshot')
 
-initialize_templates_and_scheduler(app)
+        # With several workers, only the leader refreshes; the others pick up what it publishes.
+        if scheduler.start_if_leader(app):
+            # Counters shared by the processes of an earlier run are stale, even if a pid is reused.
+            instrumentation.clear_shared_snapshots()
+        else:
+            app.logger.info("Another process owns the template refresh scheduler. Following the shared catalog.")
+        startup.mark('scheduler')
 
-app.logger.info("DockYard application startup complete.")
+    instrumentation.record_startup(startup)
+    app.logger.info(f"DockYard application startup complete ({startup.report()}).")
+    return app
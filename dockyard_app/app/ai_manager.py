@@ -1,7 +1,30 @@
-import google.generativeai as genai
 from flask import current_app
+from collections import OrderedDict
+from concurrent.futures import Future
+import hashlib
 import os
 import json
+import threading
+from . import config_manager
+from .template_record import to_jsonable
+from . import instrumentation
+
+# Bump whenever the prompt changes, so cached results from the old prompt are not reused.
+PROMPT_VERSION = 1
+DEFAULT_MODEL_NAME = 'gemini-pro'
+DEFAULT_MEMORY_CACHE_SIZE = 256
+AI_CACHE_DIRNAME = 'ai_cache'
+
+# The configured model client, built once per process and reused for every request.
+_model = None
+_model_lock = threading.Lock()
+
+# In-memory LRU tier of generated compose files: cache key -> compose text.
+_memory_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+# Generations in progress: cache key -> Future. Identical concurrent requests share one call.
+_in_flight = {}
 
 def configure_ai():
     """Configures the generative AI model."""
@@ -10,26 +33,30 @@ def configure_ai():
         current_app.logger.error("GOOGLE_API_KEY is not set. AI features will be disabled.")
         return None
     try:
+        # Imported lazily: the client library is large and only needed once a compose file is generated by AI.
+        import google.generativeai as genai
         genai.configure(api_key=api_key)
-        return genai.GenerativeModel('gemini-pro')
+        return genai.GenerativeModel(current_app.config.get('AI_MODEL_NAME', DEFAULT_MODEL_NAME))
     except Exception as e:
         current_app.logger.error(f"Failed to configure Google AI: {e}")
         return None
 
-def generate_compose_file(template_data):
-    """
-    Generates a Docker Compose YAML file from template data using an AI model.
-    """
-    model = configure_ai()
-    if not model:
-        return None, "AI model is not configured. Please set the GOOGLE_API_KEY."
+def get_model():
+    """Returns the shared model client, configuring it on first use."""
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                _model = configure_ai()
+    return _model
 
-    # Constructing a detailed prompt for the AI
-    prompt = f"""
+def build_prompt(template_data):
+    """Builds the compose-generation prompt for a template."""
+    return f"""
     Based on the following JSON template for a Docker application, please generate a complete and valid `docker-compose.yml` file.
 
     Template Details:
-    {json.dumps(template_data, indent=2)}
+    {json.dumps(template_data, indent=2, default=to_jsonable)}
 
     Please ensure the following:
     1. The output is only the `docker-compose.yml` content, without any extra explanations or markdown formatting like ```yaml.
@@ -43,13 +70,107 @@ def generate_compose_file(template_data):
     Generate the `docker-compose.yml` file now.
     """
 
+def cache_key(template_data):
+    """
+    Content address of a generation: the canonical template JSON (without the catalog 'id'),
+    the prompt version and the model name.
+    """
+    content = {k: v for k, v in template_data.items() if k != 'id'}
+    canonical = json.dumps(content, sort_keys=True, separators=(',', ':'), default=str)
+    model_name = current_app.config.get('AI_MODEL_NAME', DEFAULT_MODEL_NAME) if current_app else DEFAULT_MODEL_NAME
+    return hashlib.sha256(f"v{PROMPT_VERSION}|{model_name}|{canonical}".encode('utf-8')).hexdigest()
+
+def _disk_cache_path(key):
+    config_manager._ensure_data_dir_exists()
+    cache_dir = os.path.join(config_manager.APP_DATA_DIR, AI_CACHE_DIRNAME)
+    os.makedirs(cache_dir, exist_ok=True)
+    return os.path.join(cache_dir, f"{key}.yml")
+
+def _remember(key, compose_content):
+    capacity = current_app.config.get('AI_CACHE_SIZE', DEFAULT_MEMORY_CACHE_SIZE)
+    with _cache_lock:
+        _memory_cache[key] = compose_content
+        _memory_cache.move_to_end(key)
+        while len(_memory_cache) > capacity:
+            _memory_cache.popitem(last=False)
+
+def get_cached_compose_file(key):
+    """Looks a generation up in the memory tier, then on disk. Returns the compose text or None."""
+    with _cache_lock:
+        if key in _memory_cache:
+            _memory_cache.move_to_end(key)
+            return _memory_cache[key]
+    try:
+        with open(_disk_cache_path(key), 'r') as f:
+            compose_content = f.read()
+    except FileNotFoundError:
+        return None
+    except OSError as e:
+        current_app.logger.warning(f"Could not read AI cache entry {key}: {e}")
+        return None
+    _remember(key, compose_content)
+    return compose_content
+
+def _store_compose_file(key, compose_content):
+    _remember(key, compose_content)
+    try:
+        path = _disk_cache_path(key)
+        tmp_path = f"{path}.tmp.{os.getpid()}.{threading.get_ident()}"
+        with open(tmp_path, 'w') as f:
+            f.write(compose_content)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        current_app.logger.warning(f"Could not persist AI cache entry {key}: {e}")
+
+def _generate_uncached(template_data):
+    model = get_model()
+    if not model:
+        return None, "AI model is not configured. Please set the GOOGLE_API_KEY."
+
     try:
         current_app.logger.info("Generating Docker Compose file with AI...")
-        response = model.generate_content(prompt)
+        response = model.generate_content(build_prompt(template_data))
         # Assuming the response text contains the YAML content directly
         compose_content = response.text
         current_app.logger.info("Successfully generated Docker Compose file.")
         return compose_content, None
     except Exception as e:
         current_app.logger.error(f"Error generating Docker Compose file with AI: {e}")
-        return None, f"An error occurred while communicating with the AI model: {str(e)}"
\ No newline at end of file
+        return None, f"An error occurred while communicating with the AI model: {str(e)}"
+
+def generate_compose_file(template_data):
+    """
+    Generates a Docker Compose YAML file from template data using an AI model.
+    Results are cached by content (memory LRU, then disk), and identical requests that
+    arrive while a generation is running wait for that one call instead of starting another.
+    """
+    key = cache_key(template_data)
+    cached = get_cached_compose_file(key)
+    instrumentation.cache_result('ai_compose', cached is not None)
+    if cached is not None:
+        current_app.logger.info(f"Using cached Docker Compose file for '{template_data.get('title')}'.")
+        return cached, None
+
+    with _cache_lock:
+        future = _in_flight.get(key)
+        is_owner = future is None
+        if is_owner:
+            future = Future()
+            _in_flight[key] = future
+
+    if not is_owner:
+        current_app.logger.info(f"Waiting for in-flight generation of '{template_data.get('title')}'.")
+        return future.result()
+
+    try:
+        compose_content, error_message = _generate_uncached(template_data)
+        if compose_content is not None and not error_message:
+            _store_compose_file(key, compose_content)
+        future.set_result((compose_content, error_message))
+        return compose_content, error_message
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _cache_lock:
+            _in_flight.pop(key, None)
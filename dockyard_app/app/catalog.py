@@ -0,0 +1,267 @@
+import hashlib
+import json
+import re
+import time
+from collections.abc import Mapping
+from types import MappingProxyType
+from . import merge
+from .search import SearchIndex
+from .template_record import Template
+
+_SLUG_RE = re.compile(r'[^a-z0-9]+')
+
+def _slugify(title):
+    return _SLUG_RE.sub('-', str(title).lower()).strip('-') or 'template'
+
+def template_content_hash(template):
+    """Returns a hash of a template's content, independent of key order and of any 'id' key."""
+    content = {k: v for k, v in template.items() if k != 'id'}
+    canonical = json.dumps(content, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha1(canonical.encode('utf-8')).hexdigest()
+
+def make_template_id(template, content_hash=None):
+    """
+    Builds a stable template ID: a readable slug of the title plus a content hash prefix.
+    The ID depends only on the template itself, so it doesn't shift when sources are
+    reordered or other templates are added or removed.
+    """
+    content_hash = content_hash or template_content_hash(template)
+    return f"{_slugify(template.get('title', ''))}-{content_hash[:10]}"
+
+def _normalize_type(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return value
+
+def template_identity(template):
+    """
+    What makes two versions of a template "the same app" for change tracking: its title,
+    type and image repository (or stack repository). An image tag bump is a change, not a
+    removal plus an addition.
+    """
+    image = template.get('image')
+    if isinstance(image, str) and image:
+        head, _, last = image.split('@', 1)[0].rpartition('/')
+        source = f"{head}/{last.split(':', 1)[0]}" if head else last.split(':', 1)[0]
+    else:
+        repository = template.get('repository')
+        source = json.dumps(repository, sort_keys=True, default=str) if repository else None
+    return (str(template.get('title') or ''), _normalize_type(template.get('type')), source)
+
+class CatalogDiff:
+    """
+    Changes from one catalog version to the next, by template id. Ids embed a content
+    hash, so a template whose content changed gets a new id: it is listed in `changed`
+    as an (old_id, new_id) pair when its identity (see template_identity) is unchanged.
+    """
+
+    def __init__(self, from_version, to_version, added=(), removed=(), changed=()):
+        self.from_version = from_version
+        self.to_version = to_version
+        self.added = tuple(added)
+        self.removed = tuple(removed)
+        self.changed = tuple(changed)
+
+    def __bool__(self):
+        return bool(self.added or self.removed or self.changed)
+
+    @classmethod
+    def between(cls, old, new):
+        removed = [i for i in old.by_id if i not in new.by_id]
+        added = [i for i in new.by_id if i not in old.by_id]
+        removed_by_identity = {}
+        for template_id in removed:
+            removed_by_identity.setdefault(template_identity(old.by_id[template_id]), []).append(template_id)
+        changed = []
+        added_only = []
+        for template_id in added:
+            candidates = removed_by_identity.get(template_identity(new.by_id[template_id]))
+            if candidates:
+                changed.append((candidates.pop(0), template_id))
+            else:
+                added_only.append(template_id)
+        paired = {old_id for old_id, _ in changed}
+        return cls(old.version, new.version, added_only, [i for i in removed if i not in paired], changed)
+
+    @classmethod
+    def compose(cls, diffs):
+        """Folds consecutive diffs (oldest first) into one diff from the first version to the last."""
+        added = {}
+        removed = {}
+        renamed = {}  # current id -> id at the first version
+        for diff in diffs:
+            for old_id, new_id in diff.changed:
+                if old_id in added:
+                    del added[old_id]
+                    added[new_id] = None
+                else:
+                    renamed[new_id] = renamed.pop(old_id, old_id)
+            for template_id in diff.added:
+                added[template_id] = None
+            for template_id in diff.removed:
+                if template_id in added:
+                    del added[template_id]
+                else:
+                    removed[renamed.pop(template_id, template_id)] = None
+        # Removed and later re-added unchanged: no net change.
+        for template_id in [i for i in added if i in removed]:
+            del added[template_id]
+            del removed[template_id]
+        changed = [(first_id, new_id) for new_id, first_id in renamed.items() if first_id != new_id]
+        return cls(diffs[0].from_version if diffs else None, diffs[-1].to_version if diffs else None,
+                   added, removed, changed)
+
+class Catalog:
+    """
+    Immutable, indexed view of the merged template list.
+    Built once per refresh and swapped in as a whole, so readers holding a reference
+    always see a complete catalog. Entries are read-only Template records; indexes must
+    be treated as read-only too.
+
+    Near-duplicates (the same app from several sources, see merge.py) form a cluster:
+    `clusters` lists them, the index page shows one card per cluster, and each variant
+    is stored as a delta of the cluster's first template.
+
+    When built from the `previous` catalog, unchanged entries, index groups and search
+    tokens are reused, and `diff` holds the CatalogDiff from the previous version.
+    """
+
+    def __init__(self, templates, previous=None):
+        previous_by_id = previous.by_id if previous is not None else {}
+        templates = [t for t in templates if isinstance(t, Mapping)]
+        template_ids = []
+        seen_ids = set()
+        for template in templates:
+            template_id = make_template_id(template)
+            # Byte-identical duplicates (e.g. the same source listed twice) get a suffix.
+            if template_id in seen_ids:
+                suffix = 2
+                while f"{template_id}-{suffix}" in seen_ids:
+                    suffix += 1
+                template_id = f"{template_id}-{suffix}"
+            seen_ids.add(template_id)
+            template_ids.append(template_id)
+
+        entries = [None] * len(templates)
+        clusters = []
+        for positions in merge.cluster_templates(templates):
+            base = None
+            for position in positions:
+                # Same id means same content: share the previous catalog's entry, unless it is
+                # stored as a delta of a template other than this cluster's lead. That base may
+                # belong to an older catalog, which the delta would keep alive; rebuild it instead.
+                entry = previous_by_id.get(template_ids[position])
+                if entry is not None and entry.base is not None and entry.base is not base:
+                    entry = Template(template_ids[position], templates[position], base=base)
+                elif entry is None:
+                    entry = Template.from_dict(templates[position], template_ids[position], base=base)
+                if base is None:
+                    base = entry
+                entries[position] = entry
+            clusters.append(tuple(entries[p] for p in positions))
+        by_id = {entry.id: entry for entry in entries}
+
+        by_title = {}
+        by_type = {}
+        by_category = {}
+        by_image = {}
+        type_positions = {}
+        category_positions = {}
+        for position, entry in enumerate(entries):
+            if entry.title:
+                by_title.setdefault(entry.title, []).append(entry)
+            template_type = _normalize_type(entry.type)
+            by_type.setdefault(template_type, []).append(entry)
+            type_positions.setdefault(template_type, []).append(position)
+            for category in entry.categories or ():
+                by_category.setdefault(category, []).append(entry)
+                category_positions.setdefault(category, []).append(position)
+            if entry.image:
+                by_image.setdefault(entry.image, []).append(entry)
+
+        self.templates = tuple(entries)
+        self.by_id = by_id
+        self.clusters = tuple(clusters)
+        self._cluster_by_id = {entry.id: cluster for cluster in self.clusters for entry in cluster}
+        self.by_title = {k: tuple(v) for k, v in by_title.items()}
+        self.by_type = {k: tuple(v) for k, v in by_type.items()}
+        self.by_category = {k: tuple(v) for k, v in by_category.items()}
+        self.by_image = {k: tuple(v) for k, v in by_image.items()}
+        self._type_positions = {k: tuple(v) for k, v in type_positions.items()}
+        self._category_positions = {k: tuple(v) for k, v in category_positions.items()}
+        self.categories = tuple(sorted(self.by_category))
+        self.version = hashlib.sha1('\n'.join(by_id).encode('utf-8')).hexdigest()[:16]
+        self.diff = CatalogDiff.between(previous, self) if previous is not None else None
+        if self.diff is not None:
+            self.grouped_templates = _group_for_index(self.clusters, previous.grouped_templates)
+            self.search_index = SearchIndex(self.templates, previous=previous.search_index)
+        else:
+            self.grouped_templates = _group_for_index(self.clusters)
+            self.search_index = SearchIndex(self.templates)
+        # Index card order, for paging through grouped_templates by offset.
+        self.group_keys = tuple(self.grouped_templates)
+        self.built_at = time.time()
+
+    def __len__(self):
+        return len(self.templates)
+
+    def __bool__(self):
+        return bool(self.templates)
+
+    def get(self, template_id):
+        """Returns the template with the given ID, or None."""
+        return self.by_id.get(template_id)
+
+    def variants(self, template_id):
+        """Returns the templates in the same cluster as template_id (itself included), or ()."""
+        return self._cluster_by_id.get(template_id, ())
+
+    def find_by_title(self, title):
+        return self.by_title.get(title, ())
+
+    def find_by_type(self, template_type):
+        return self.by_type.get(_normalize_type(template_type), ())
+
+    def find_by_category(self, category):
+        return self.by_category.get(category, ())
+
+    def find_by_image(self, image):
+        return self.by_image.get(image, ())
+
+    def type_positions(self, template_type):
+        """Returns the catalog positions of templates of a given type (for search filters)."""
+        return self._type_positions.get(_normalize_type(template_type), ())
+
+    def category_positions(self, category):
+        return self._category_positions.get(category, ())
+
+def _indexable(t):
+    return t.title and t.logo and t.description and t.type in (1, 2, '1', '2')
+
+def _group_for_index(clusters, previous=None):
+    """
+    Builds the index page view: one card per cluster, listing its templates that have a
+    title, logo, description and a supported type (1 or 2), headed by the first of them.
+    Keyed by that first template's id. Computed once per catalog, read-only; groups of
+    `previous` with exactly the same templates are reused as they are.
+    """
+    grouped = {}
+    for cluster in clusters:
+        members = tuple(t for t in cluster if _indexable(t))
+        if not members:
+            continue
+        lead = members[0]
+        group = previous.get(lead.id) if previous is not None else None
+        if group is None or len(group['templates']) != len(members) or \
+                any(a is not b for a, b in zip(group['templates'], members)):
+            group = MappingProxyType({
+                'title': lead.title,
+                'logo': lead.logo,
+                'description': lead.description,
+                'templates': members,
+            })
+        grouped[lead.id] = group
+    return MappingProxyType(grouped)
+
+EMPTY_CATALOG = Catalog([])
@@ -0,0 +1,104 @@
+import gzip
+import json
+import logging
+import os
+import threading
+import time
+from flask import current_app
+from . import config_manager
+from .template_record import to_jsonable
+
+# The merged template catalog is persisted as gzipped compact JSON after every
+# successful refresh, so a restarted process can serve it immediately instead of
+# waiting for every remote source to answer.
+SNAPSHOT_FILENAME = 'catalog_snapshot.json.gz'
+SNAPSHOT_FORMAT_VERSION = 1
+
+_stats = {
+    'loaded': False,
+    'template_count': 0,
+    'saved_at': None,
+    'load_seconds': None,
+    'size_bytes': None,
+}
+
+def _get_logger():
+    return current_app.logger if current_app else logging.getLogger(__name__)
+
+def _snapshot_path():
+    config_manager._ensure_data_dir_exists()
+    return os.path.join(config_manager.APP_DATA_DIR, SNAPSHOT_FILENAME)
+
+def save_snapshot(templates):
+    """Writes the catalog snapshot atomically. Returns True on success."""
+    logger = _get_logger()
+    payload = {
+        'format': SNAPSHOT_FORMAT_VERSION,
+        'saved_at': time.time(),
+        'templates': templates,
+    }
+    try:
+        path = _snapshot_path()
+        tmp_path = f"{path}.tmp.{os.getpid()}.{threading.get_ident()}"
+        data = json.dumps(payload, separators=(',', ':'), default=to_jsonable).encode('utf-8')
+        with gzip.open(tmp_path, 'wb', compresslevel=6) as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        _stats['saved_at'] = payload['saved_at']
+        _stats['template_count'] = len(templates)
+        _stats['size_bytes'] = os.path.getsize(path)
+        logger.info(f"Saved catalog snapshot with {len(templates)} templates to {path}.")
+        return True
+    except (OSError, TypeError, ValueError) as e:
+        logger.error(f"Could not save catalog snapshot: {e}")
+        return False
+
+def load_snapshot():
+    """
+    Loads the persisted catalog snapshot.
+    Returns the list of templates, or None if there is no usable snapshot.
+    """
+    logger = _get_logger()
+    start = time.perf_counter()
+    try:
+        path = _snapshot_path()
+        if not os.path.exists(path):
+            logger.info(f"No catalog snapshot found at {path}.")
+            return None
+        with gzip.open(path, 'rb') as f:
+            payload = json.loads(f.read())
+        if not isinstance(payload, dict) or payload.get('format') != SNAPSHOT_FORMAT_VERSION \
+                or not isinstance(payload.get('templates'), list):
+            logger.warning(f"Ignoring catalog snapshot at {path}: unexpected format.")
+            return None
+        size_bytes = os.path.getsize(path)
+    except (OSError, EOFError, ValueError) as e:
+        logger.error(f"Could not load catalog snapshot: {e}")
+        return None
+
+    templates = payload['templates']
+    _stats.update({
+        'loaded': True,
+        'template_count': len(templates),
+        'saved_at': payload.get('saved_at'),
+        'load_seconds': time.perf_counter() - start,
+        'size_bytes': size_bytes,
+    })
+    logger.info(
+        f"Loaded catalog snapshot with {len(templates)} templates in {_stats['load_seconds'] * 1000:.1f} ms "
+        f"(age {get_snapshot_stats()['age_seconds']:.0f}s)."
+    )
+    return templates
+
+def get_snapshot_mtime():
+    """Returns the snapshot file's mtime in nanoseconds, or None if there is no snapshot."""
+    try:
+        return os.stat(_snapshot_path()).st_mtime_ns
+    except OSError:
+        return None
+
+def get_snapshot_stats():
+    """Returns snapshot metrics: whether one was loaded, its age, load time and size."""
+    stats = dict(_stats)
+    stats['age_seconds'] = time.time() - stats['saved_at'] if stats['saved_at'] else None
+    return stats
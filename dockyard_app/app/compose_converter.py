@@ -0,0 +1,273 @@
+import json
+import logging
+import re
+import threading
+from collections import OrderedDict
+from collections.abc import Mapping
+import requests
+from flask import current_app
+
+# Deterministic Portainer v2 template -> docker-compose.yml converter. Covers the fields
+# the AI prompt asks the model to map (image, ports, volumes, env, restart_policy) plus
+# the other container options Portainer templates use. Conversion never touches the
+# network. Stack templates reference a compose file in a git repository: the install job
+# fetches it first with fetch_stackfile() (cached) and passes it to convert_template().
+TEMPLATE_TYPE_CONTAINER = 1
+TEMPLATE_TYPE_SWARM_STACK = 2
+TEMPLATE_TYPE_COMPOSE_STACK = 3
+
+DEFAULT_RESTART_POLICY = 'unless-stopped'
+STACKFILE_FETCH_TIMEOUT = 10
+STACKFILE_MAX_BYTES = 1024 * 1024
+DEFAULT_STACKFILE_CACHE_SIZE = 64
+_NETWORK_MODES = ('host', 'bridge', 'none')
+_NAME_RE = re.compile(r'[^a-z0-9]+')
+
+# LRU of stack file contents by raw URL; stack files are small and rarely change.
+_stackfile_cache = OrderedDict()
+_stackfile_lock = threading.Lock()
+
+class ConversionError(ValueError):
+    """The template can't be converted deterministically; callers may fall back to the AI generator."""
+
+def _get_logger():
+    return current_app.logger if current_app else logging.getLogger(__name__)
+
+def _q(value):
+    # JSON strings are valid YAML double-quoted scalars, and quoting everything keeps
+    # values like "yes", "0755" or "8080:80" from being reinterpreted.
+    return json.dumps(str(value))
+
+def service_name(template):
+    """Lowercase title with underscores, as the AI prompt requests."""
+    name = _NAME_RE.sub('_', str(template.get('title') or template.get('name') or 'app').lower()).strip('_')
+    return name or 'app'
+
+def _template_type(template):
+    try:
+        return int(template.get('type', TEMPLATE_TYPE_CONTAINER))
+    except (TypeError, ValueError):
+        raise ConversionError(f"Unsupported template type: {template.get('type')!r}")
+
+def _env_value(var):
+    if var.get('select'):
+        options = [o for o in var['select'] if isinstance(o, dict)]
+        chosen = next((o for o in options if o.get('default')), options[0] if options else {})
+        return chosen.get('value', '')
+    value = var.get('default', var.get('value', ''))
+    return '' if value is None else value
+
+def _convert_ports(ports):
+    lines = []
+    for port in ports or []:
+        if isinstance(port, str) and port.strip():
+            lines.append(port.strip())
+        elif isinstance(port, dict) and len(port) == 1:
+            # {"80/tcp": "8080"} style: container port -> host port
+            (container_port, host_port), = port.items()
+            lines.append(f"{host_port}:{container_port}" if host_port else str(container_port))
+        else:
+            raise ConversionError(f"Unsupported port entry: {port!r}")
+    return lines
+
+def _convert_volumes(volumes, service):
+    mounts = []
+    named = []
+    for volume in volumes or []:
+        if not isinstance(volume, dict) or not volume.get('container'):
+            raise ConversionError(f"Unsupported volume entry: {volume!r}")
+        source = volume.get('bind')
+        if not source:
+            suffix = _NAME_RE.sub('_', volume['container'].lower()).strip('_') or 'data'
+            source = f"{service}_{suffix}"
+            named.append(source)
+        mount = f"{source}:{volume['container']}"
+        if volume.get('readonly'):
+            mount += ':ro'
+        mounts.append(mount)
+    return mounts, named
+
+def _convert_container(template):
+    image = template.get('image')
+    if not image:
+        raise ConversionError("Container template has no image.")
+    service = service_name(template)
+    lines = ['services:', f'  {service}:', f'    image: {_q(image)}']
+
+    if template.get('name'):
+        lines.append(f'    container_name: {_q(template["name"])}')
+    if template.get('hostname'):
+        lines.append(f'    hostname: {_q(template["hostname"])}')
+    if template.get('command'):
+        lines.append(f'    command: {_q(template["command"])}')
+    lines.append(f'    restart: {_q(template.get("restart_policy") or DEFAULT_RESTART_POLICY)}')
+    if template.get('privileged'):
+        lines.append('    privileged: true')
+    if template.get('interactive'):
+        lines.extend(['    stdin_open: true', '    tty: true'])
+
+    network = template.get('network')
+    if network in _NETWORK_MODES:
+        lines.append(f'    network_mode: {_q(network)}')
+    elif network:
+        lines.extend(['    networks:', f'      - {_q(network)}'])
+
+    ports = _convert_ports(template.get('ports'))
+    if ports and network != 'host':
+        lines.append('    ports:')
+        lines.extend(f'      - {_q(p)}' for p in ports)
+
+    mounts, named_volumes = _convert_volumes(template.get('volumes'), service)
+    if mounts:
+        lines.append('    volumes:')
+        lines.extend(f'      - {_q(m)}' for m in mounts)
+
+    env = [v for v in template.get('env') or [] if isinstance(v, dict) and v.get('name')]
+    if env:
+        lines.append('    environment:')
+        lines.extend(f'      {_q(v["name"])}: {_q(_env_value(v))}' for v in env)
+
+    labels = [l for l in template.get('labels') or [] if isinstance(l, dict) and l.get('name')]
+    if labels:
+        lines.append('    labels:')
+        lines.extend(f'      {_q(l["name"])}: {_q(l.get("value", ""))}' for l in labels)
+
+    if named_volumes:
+        lines.append('volumes:')
+        lines.extend(f'  {name}: {{}}' for name in named_volumes)
+    if network and network not in _NETWORK_MODES:
+        lines.extend(['networks:', f'  {_q(network)}:', '    external: true'])
+    return '\n'.join(lines) + '\n'
+
+def _parse_port(port):
+    # "8080:80/tcp", "127.0.0.1:8080:80" or "80" -> ("80/tcp", host binding or None)
+    rest, _, protocol = port.partition('/')
+    parts = rest.split(':')
+    container_port = f"{parts[-1]}/{protocol or 'tcp'}"
+    if len(parts) == 1:
+        return container_port, None
+    host_port = int(parts[-2]) if parts[-2] else None
+    if len(parts) == 3 and parts[0]:
+        return container_port, (parts[0], host_port)
+    return container_port, host_port
+
+def container_run_options(template):
+    """
+    Maps a container template to keyword arguments for docker's containers.run(), mirroring
+    what _convert_container writes to the compose file. Raises ConversionError for stacks.
+    """
+    if _template_type(template) != TEMPLATE_TYPE_CONTAINER:
+        raise ConversionError("Only container templates can be deployed directly.")
+    if not template.get('image'):
+        raise ConversionError("Container template has no image.")
+    service = service_name(template)
+    options = {
+        'image': template['image'],
+        'name': template.get('name') or service,
+        'restart_policy': {'Name': template.get('restart_policy') or DEFAULT_RESTART_POLICY},
+        'labels': {l['name']: str(l.get('value', '')) for l in template.get('labels') or [] if isinstance(l, dict) and l.get('name')},
+    }
+    for key in ('hostname', 'command', 'privileged'):
+        if template.get(key):
+            options[key] = template[key]
+    if template.get('interactive'):
+        options.update(stdin_open=True, tty=True)
+
+    network = template.get('network')
+    if network in _NETWORK_MODES:
+        options['network_mode'] = network
+    elif network:
+        options['network'] = network
+
+    ports = {}
+    for port in _convert_ports(template.get('ports')):
+        try:
+            container_port, binding = _parse_port(port)
+        except ValueError:
+            raise ConversionError(f"Unsupported port entry: {port!r}")
+        ports[container_port] = binding
+    if ports and network != 'host':
+        options['ports'] = ports
+
+    mounts, _ = _convert_volumes(template.get('volumes'), service)
+    if mounts:
+        volumes = {}
+        for mount in mounts:
+            readonly = mount.endswith(':ro')
+            source, _, target = (mount[:-3] if readonly else mount).partition(':')
+            volumes[source] = {'bind': target, 'mode': 'ro' if readonly else 'rw'}
+        options['volumes'] = volumes
+
+    env = [v for v in template.get('env') or [] if isinstance(v, dict) and v.get('name')]
+    if env:
+        options['environment'] = {v['name']: str(_env_value(v)) for v in env}
+    return options
+
+def stackfile_url(repository):
+    """Returns the raw URL of a stack template's compose file (GitHub repositories only)."""
+    if not isinstance(repository, dict) or not repository.get('url') or not repository.get('stackfile'):
+        raise ConversionError("Stack template has no repository url/stackfile.")
+    match = re.match(r'^https?://github\.com/([^/]+)/([^/]+?)(?:\.git)?/?$', repository['url'])
+    if not match:
+        raise ConversionError(f"Unsupported stack repository: {repository['url']}")
+    owner, repo = match.groups()
+    return f"https://raw.githubusercontent.com/{owner}/{repo}/HEAD/{repository['stackfile'].lstrip('/')}"
+
+def is_stack(template):
+    return _template_type(template) in (TEMPLATE_TYPE_SWARM_STACK, TEMPLATE_TYPE_COMPOSE_STACK)
+
+def fetch_stackfile(template):
+    """
+    Downloads the compose file of a stack template (network access; run it off the request
+    path, e.g. in an install job). Raises ConversionError if it can't be fetched.
+    """
+    url = stackfile_url(template.get('repository'))
+    with _stackfile_lock:
+        if url in _stackfile_cache:
+            _stackfile_cache.move_to_end(url)
+            return _stackfile_cache[url]
+    try:
+        with requests.get(url, timeout=STACKFILE_FETCH_TIMEOUT, stream=True) as response:
+            response.raise_for_status()
+            body = bytearray()
+            for chunk in response.iter_content(chunk_size=64 * 1024):
+                body += chunk
+                if len(body) > STACKFILE_MAX_BYTES:
+                    raise ConversionError(f"Stack file {url} is larger than {STACKFILE_MAX_BYTES} bytes.")
+            content = body.decode(response.encoding or 'utf-8', errors='replace')
+    except requests.exceptions.RequestException as e:
+        raise ConversionError(f"Could not fetch stack file {url}: {e}")
+    capacity = current_app.config.get('STACKFILE_CACHE_SIZE', DEFAULT_STACKFILE_CACHE_SIZE) if current_app \
+        else DEFAULT_STACKFILE_CACHE_SIZE
+    with _stackfile_lock:
+        _stackfile_cache[url] = content
+        _stackfile_cache.move_to_end(url)
+        while len(_stackfile_cache) > capacity:
+            _stackfile_cache.popitem(last=False)
+    return content
+
+def _convert_stack(template, content):
+    if content is None:
+        raise ConversionError("Stack template needs its stack file; fetch it with fetch_stackfile() first.")
+    env = [v for v in template.get('env') or [] if isinstance(v, dict) and v.get('name')]
+    header = []
+    if env:
+        # Stack files reference these as ${NAME}; list the template defaults for the .env file.
+        header.append('# Environment variables used by this stack (put them in a .env file next to it):')
+        header.extend(f"#   {v['name']}={_env_value(v)}" for v in env)
+    return '\n'.join(header + [content.rstrip('\n')]) + '\n'
+
+def convert_template(template, stackfile=None):
+    """
+    Converts a Portainer v2 template to docker-compose.yml text. Stack templates need
+    the contents of their stack file (see fetch_stackfile()).
+    Raises ConversionError for templates it can't handle.
+    """
+    if not isinstance(template, Mapping):
+        raise ConversionError("Template must be an object.")
+    template_type = _template_type(template)
+    if template_type == TEMPLATE_TYPE_CONTAINER:
+        return _convert_container(template)
+    if template_type in (TEMPLATE_TYPE_SWARM_STACK, TEMPLATE_TYPE_COMPOSE_STACK):
+        return _convert_stack(template, stackfile)
+    raise ConversionError(f"Unsupported template type: {template_type}")
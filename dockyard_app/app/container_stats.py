@@ -0,0 +1,396 @@
+import json
+import logging
+import os
+import threading
+import time
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from . import config_manager
+from . import docker_manager
+
+# Per-container Docker stats, polled concurrently over the shared Docker client and kept
+# in a bounded in-memory time-series store. Each container has three fixed-width rollup
+# tiers (1s, 1m, 1h buckets); every tier is a ring of array('d') columns, so memory per
+# container is fixed no matter how long the process runs.
+#
+# Only the leader process collects. After each poll it publishes the tiers as JSON files
+# in the data dir, which the other workers serve; the leader serves its own store. It
+# polls only while someone is looking: every worker serving container stats touches a
+# demand file, and the collector idles once that is older than DOCKER_STATS_IDLE_SECONDS.
+FIELDS = (
+    'cpu_percent',
+    'memory_bytes',
+    'memory_percent',
+    'net_rx_bytes_per_sec',
+    'net_tx_bytes_per_sec',
+    'blkio_read_bytes_per_sec',
+    'blkio_write_bytes_per_sec',
+)
+
+# resolution name -> (bucket width in seconds, number of buckets kept)
+ROLLUPS = {
+    '1s': (1, 300),     # 5 minutes
+    '1m': (60, 180),    # 3 hours
+    '1h': (3600, 168),  # 1 week
+}
+
+DEFAULT_POLL_INTERVAL = 2.0
+DEFAULT_MAX_CONTAINERS = 100
+DEFAULT_WORKERS = 8
+# Containers that haven't been seen for this long are dropped from the store.
+STALE_AFTER_SECONDS = 3600
+DEFAULT_IDLE_SECONDS = 300
+
+SHARED_DIRNAME = 'container_stats'
+DEMAND_FILENAME = 'demand'
+# Workers refresh the demand file at most this often.
+DEMAND_TOUCH_SECONDS = 10
+# A published tier file is rewritten at most this often, in seconds (the 1s tier after every poll).
+PUBLISH_INTERVALS = {'1s': 0, '1m': 15, '1h': 60}
+
+logger = logging.getLogger(__name__)
+
+class Rollup:
+    """One resolution tier: a ring of buckets holding per-field sums and a sample count."""
+
+    def __init__(self, width, capacity):
+        self.width = width
+        self.capacity = capacity
+        self._starts = array('d', [0.0]) * capacity
+        self._counts = array('d', [0.0]) * capacity
+        self._sums = {field: array('d', [0.0]) * capacity for field in FIELDS}
+        self._current = -1
+        self._size = 0
+
+    def add(self, timestamp, values):
+        start = float(int(timestamp // self.width) * self.width)
+        if self._size and self._starts[self._current] == start:
+            i = self._current
+        else:
+            i = (self._current + 1) % self.capacity
+            self._current = i
+            self._size = min(self._size + 1, self.capacity)
+            self._starts[i] = start
+            self._counts[i] = 0.0
+            for field in FIELDS:
+                self._sums[field][i] = 0.0
+        self._counts[i] += 1
+        for field in FIELDS:
+            self._sums[field][i] += values.get(field, 0.0)
+
+    def points(self, limit=None):
+        """Returns bucket start times and per-field means, oldest first, as column lists."""
+        count = self._size if limit is None else min(limit, self._size)
+        indexes = [(self._current - count + 1 + k) % self.capacity for k in range(count)]
+        columns = {'timestamps': [self._starts[i] for i in indexes]}
+        for field in FIELDS:
+            sums = self._sums[field]
+            columns[field] = [sums[i] / self._counts[i] if self._counts[i] else 0.0 for i in indexes]
+        return columns
+
+class ContainerSeries:
+    def __init__(self, container_id, name):
+        self.container_id = container_id
+        self.name = name
+        self.rollups = {resolution: Rollup(width, capacity) for resolution, (width, capacity) in ROLLUPS.items()}
+        self.latest = None
+        self.last_seen = 0.0
+
+    def add(self, timestamp, values):
+        for rollup in self.rollups.values():
+            rollup.add(timestamp, values)
+        self.latest = dict(values, timestamp=timestamp)
+        self.last_seen = timestamp
+
+class TimeSeriesStore:
+    """Bounded store of ContainerSeries. Evicts the least recently seen container when full."""
+
+    def __init__(self, max_containers=DEFAULT_MAX_CONTAINERS):
+        self.max_containers = max_containers
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def add(self, container_id, name, timestamp, values):
+        with self._lock:
+            series = self._series.get(container_id)
+            if series is None:
+                if len(self._series) >= self.max_containers:
+                    oldest = min(self._series.values(), key=lambda s: s.last_seen)
+                    del self._series[oldest.container_id]
+                series = ContainerSeries(container_id, name)
+                self._series[container_id] = series
+            series.name = name
+            series.add(timestamp, values)
+
+    def prune(self, now, stale_after=STALE_AFTER_SECONDS):
+        with self._lock:
+            for container_id in [cid for cid, s in self._series.items() if now - s.last_seen > stale_after]:
+                del self._series[container_id]
+
+    def snapshot(self, resolution='1s', limit=None):
+        if resolution not in ROLLUPS:
+            raise ValueError(f"Unknown resolution '{resolution}'. Expected one of {', '.join(ROLLUPS)}.")
+        with self._lock:
+            return [
+                {
+                    'id': series.container_id,
+                    'name': series.name,
+                    'latest': series.latest,
+                    'series': series.rollups[resolution].points(limit),
+                }
+                for series in sorted(self._series.values(), key=lambda s: s.name)
+            ]
+
+def _sum_blkio(stats, op):
+    entries = (stats.get('blkio_stats') or {}).get('io_service_bytes_recursive') or []
+    return float(sum(e.get('value', 0) for e in entries if str(e.get('op', '')).lower() == op))
+
+def parse_stats(stats):
+    """Extracts cumulative counters and gauges from one Docker stats document."""
+    cpu_stats = stats.get('cpu_stats') or {}
+    memory_stats = stats.get('memory_stats') or {}
+    networks = stats.get('networks') or {}
+    memory_usage = float(memory_stats.get('usage') or 0)
+    # Match `docker stats`: page cache doesn't count as used memory.
+    cache = (memory_stats.get('stats') or {}).get('inactive_file') or (memory_stats.get('stats') or {}).get('cache') or 0
+    memory_used = max(0.0, memory_usage - cache)
+    memory_limit = float(memory_stats.get('limit') or 0)
+    return {
+        'cpu_total': float((cpu_stats.get('cpu_usage') or {}).get('total_usage') or 0),
+        'system_cpu': float(cpu_stats.get('system_cpu_usage') or 0),
+        'online_cpus': float(cpu_stats.get('online_cpus') or len((cpu_stats.get('cpu_usage') or {}).get('percpu_usage') or []) or 1),
+        'memory_bytes': memory_used,
+        'memory_percent': (memory_used / memory_limit * 100.0) if memory_limit else 0.0,
+        'net_rx': float(sum(n.get('rx_bytes', 0) for n in networks.values())),
+        'net_tx': float(sum(n.get('tx_bytes', 0) for n in networks.values())),
+        'blkio_read': _sum_blkio(stats, 'read'),
+        'blkio_write': _sum_blkio(stats, 'write'),
+    }
+
+def compute_values(current, previous, elapsed):
+    """Turns two consecutive parsed samples into gauges and per-second rates."""
+    values = {'memory_bytes': current['memory_bytes'], 'memory_percent': current['memory_percent']}
+    if previous is None or elapsed <= 0:
+        for field in ('cpu_percent', 'net_rx_bytes_per_sec', 'net_tx_bytes_per_sec',
+                      'blkio_read_bytes_per_sec', 'blkio_write_bytes_per_sec'):
+            values[field] = 0.0
+        return values
+    cpu_delta = current['cpu_total'] - previous['cpu_total']
+    system_delta = current['system_cpu'] - previous['system_cpu']
+    values['cpu_percent'] = (cpu_delta / system_delta) * current['online_cpus'] * 100.0 \
+        if cpu_delta > 0 and system_delta > 0 else 0.0
+
+    def rate(key):
+        # Counters reset when a container restarts; treat that as zero rather than negative.
+        return max(0.0, (current[key] - previous[key]) / elapsed)
+
+    values['net_rx_bytes_per_sec'] = rate('net_rx')
+    values['net_tx_bytes_per_sec'] = rate('net_tx')
+    values['blkio_read_bytes_per_sec'] = rate('blkio_read')
+    values['blkio_write_bytes_per_sec'] = rate('blkio_write')
+    return values
+
+class ContainerStatsCollector:
+    """Polls stats for every running container concurrently and feeds a TimeSeriesStore."""
+
+    def __init__(self, client_factory=docker_manager.get_docker_client, interval=DEFAULT_POLL_INTERVAL,
+                 max_containers=DEFAULT_MAX_CONTAINERS, workers=DEFAULT_WORKERS, shared_dir=None, idle_after=None):
+        self.client_factory = client_factory
+        self.interval = interval
+        self.store = TimeSeriesStore(max_containers)
+        self.workers = workers
+        # With a shared_dir, tiers are published there and polling waits for demand.
+        self.shared_dir = shared_dir
+        self.idle_after = idle_after
+        self.last_error = None
+        self._published_at = {}
+        self._previous = {}
+        self._executor = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    def _fetch(self, client, container_id):
+        # one_shot skips the daemon's extra 1s sampling wait; rates come from our own previous sample.
+        return client.api.stats(container_id, stream=False, one_shot=True)
+
+    def poll_once(self):
+        client = self.client_factory()
+        if client is None:
+            self.last_error = docker_manager.get_docker_error() or "Docker is not available."
+            return 0
+        try:
+            containers = client.api.containers()
+        except Exception as e:
+            self.last_error = f"Could not list containers: {e}"
+            logger.error(self.last_error)
+            return 0
+
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='docker-stats')
+        futures = {
+            c['Id']: (self._executor.submit(self._fetch, client, c['Id']), (c.get('Names') or [c['Id'][:12]])[0].lstrip('/'))
+            for c in containers
+        }
+        now_mono = time.monotonic()
+        now = time.time()
+        collected = 0
+        for container_id, (future, name) in futures.items():
+            try:
+                current = parse_stats(future.result(timeout=max(self.interval * 2, 5)))
+            except Exception as e:
+                logger.warning(f"Could not read stats for container {name}: {e}")
+                continue
+            previous = self._previous.get(container_id)
+            elapsed = now_mono - previous[0] if previous else 0
+            self.store.add(container_id, name, now, compute_values(current, previous[1] if previous else None, elapsed))
+            self._previous[container_id] = (now_mono, current)
+            collected += 1
+
+        # Forget counters for containers that are gone.
+        for container_id in [cid for cid in self._previous if cid not in futures]:
+            del self._previous[container_id]
+        self.store.prune(now)
+        self.last_error = None
+        return collected
+
+    def report(self, resolution='1s', limit=None):
+        """The /api/containers/stats payload for one resolution. Raises ValueError for an unknown one."""
+        return {
+            'available': self.last_error is None,
+            'error': self.last_error,
+            'resolution': resolution,
+            'interval': self.interval,
+            'containers': self.store.snapshot(resolution, limit),
+        }
+
+    def is_wanted(self):
+        """True while a worker has served container stats within the last idle_after seconds."""
+        if self.shared_dir is None or not self.idle_after:
+            return True
+        try:
+            return time.time() - os.stat(os.path.join(self.shared_dir, DEMAND_FILENAME)).st_mtime < self.idle_after
+        except OSError:
+            return False
+
+    def publish(self, force=False):
+        """Writes the tiers that are due to shared_dir, one JSON file per resolution."""
+        if self.shared_dir is None:
+            return
+        now = time.monotonic()
+        for resolution, every in PUBLISH_INTERVALS.items():
+            if not force and now - self._published_at.get(resolution, float('-inf')) < every:
+                continue
+            path = os.path.join(self.shared_dir, f"{resolution}.json")
+            tmp_path = f"{path}.tmp.{os.getpid()}.{threading.get_ident()}"
+            try:
+                with open(tmp_path, 'w') as f:
+                    json.dump(self.report(resolution), f, separators=(',', ':'))
+                os.replace(tmp_path, path)
+            except OSError as e:
+                logger.warning(f"Could not publish container stats ({resolution}): {e}")
+                continue
+            self._published_at[resolution] = now
+
+    def _run(self):
+        while not self._stop.is_set():
+            started = time.monotonic()
+            if self.is_wanted():
+                try:
+                    self.poll_once()
+                except Exception as e:
+                    self.last_error = str(e)
+                    logger.error(f"Container stats poll failed: {e}")
+                self.publish()
+            self._stop.wait(max(0.0, self.interval - (time.monotonic() - started)))
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='docker-stats-collector', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+
+_collector = None
+_collector_lock = threading.Lock()
+_last_demand_touch = None
+# resolution -> (mtime, payload) of the last published file read by this process.
+_shared_reports = {}
+
+def _shared_dir():
+    return os.path.join(config_manager.APP_DATA_DIR, SHARED_DIRNAME)
+
+def start_collector(flask_app):
+    """Starts the collector in this process. Called by the leader only (see scheduler.start_if_leader)."""
+    global _collector
+    with _collector_lock:
+        if _collector is not None:
+            return _collector
+
+        def client_factory():
+            # The collector thread has no app context; docker_manager reads config from it.
+            with flask_app.app_context():
+                return docker_manager.get_docker_client()
+
+        shared_dir = _shared_dir()
+        os.makedirs(shared_dir, exist_ok=True)
+        collector = ContainerStatsCollector(
+            client_factory=client_factory,
+            interval=flask_app.config.get('DOCKER_STATS_INTERVAL_SECONDS', DEFAULT_POLL_INTERVAL),
+            max_containers=flask_app.config.get('DOCKER_STATS_MAX_CONTAINERS', DEFAULT_MAX_CONTAINERS),
+            workers=flask_app.config.get('DOCKER_STATS_WORKERS', DEFAULT_WORKERS),
+            shared_dir=shared_dir,
+            idle_after=flask_app.config.get('DOCKER_STATS_IDLE_SECONDS', DEFAULT_IDLE_SECONDS),
+        )
+        collector.start()
+        _collector = collector
+    return _collector
+
+def note_demand():
+    """Tells the leader's collector that someone is looking at container stats. Throttled; cheap per request."""
+    global _last_demand_touch
+    now = time.monotonic()
+    if _last_demand_touch is not None and now - _last_demand_touch < DEMAND_TOUCH_SECONDS:
+        return
+    _last_demand_touch = now
+    try:
+        shared_dir = _shared_dir()
+        os.makedirs(shared_dir, exist_ok=True)
+        path = os.path.join(shared_dir, DEMAND_FILENAME)
+        with open(path, 'a'):
+            pass
+        os.utime(path)
+    except OSError as e:
+        logger.warning(f"Could not record container stats demand: {e}")
+
+def _limit_series(containers, limit):
+    if not limit or limit <= 0:
+        return containers
+    return [dict(c, series={name: column[-limit:] for name, column in c['series'].items()}) for c in containers]
+
+def read_report(resolution='1s', limit=None):
+    """
+    Container stats for /api/containers/stats: from the collector on the leader, from its
+    published files elsewhere. Raises ValueError for an unknown resolution.
+    """
+    if resolution not in ROLLUPS:
+        raise ValueError(f"Unknown resolution '{resolution}'. Expected one of {', '.join(ROLLUPS)}.")
+    if _collector is not None:
+        return _collector.report(resolution, limit)
+    path = os.path.join(_shared_dir(), f"{resolution}.json")
+    try:
+        mtime = os.stat(path).st_mtime
+        cached = _shared_reports.get(resolution)
+        if cached is None or cached[0] != mtime:
+            with open(path) as f:
+                cached = (mtime, json.load(f))
+            _shared_reports[resolution] = cached
+        report = cached[1]
+    except (OSError, ValueError):
+        return {'available': False, 'error': "Waiting for the first container stats sample.",
+                'resolution': resolution, 'interval': None, 'containers': []}
+    return dict(report, containers=_limit_series(report['containers'], limit))
@@ -0,0 +1,107 @@
+import logging
+import threading
+import time
+from flask import current_app
+
+# One Docker client per process, shared by every feature that talks to the daemon.
+# The underlying HTTP connection pool is sized for concurrent stats/pull calls.
+DEFAULT_POOL_SIZE = 10
+# After a failed connection, don't retry (and wait on timeouts) more often than this.
+RECONNECT_INTERVAL_SECONDS = 30
+
+_client = None
+_client_error = None
+_last_attempt = 0.0
+_lock = threading.Lock()
+
+def _get_logger():
+    return current_app.logger if current_app else logging.getLogger(__name__)
+
+def get_docker_client():
+    """
+    Returns the shared Docker client, creating it on first use.
+    Returns None if the daemon is unreachable; the error is available from get_docker_error().
+    """
+    global _client, _client_error, _last_attempt
+    if _client is not None:
+        return _client
+    with _lock:
+        if _client is not None:
+            return _client
+        if _client_error and time.monotonic() - _last_attempt < RECONNECT_INTERVAL_SECONDS:
+            return None
+        _last_attempt = time.monotonic()
+        config = current_app.config if current_app else {}
+        base_url = config.get('DOCKER_BASE_URL')
+        pool_size = config.get('DOCKER_CLIENT_POOL_SIZE', DEFAULT_POOL_SIZE)
+        try:
+            import docker # Imported lazily: only needed once a Docker feature is used
+            if base_url:
+                client = docker.DockerClient(base_url=base_url, max_pool_size=pool_size)
+            else:
+                client = docker.from_env(max_pool_size=pool_size)
+            client.ping()
+        except Exception as e:
+            _client_error = str(e)
+            _get_logger().error(f"Docker daemon is not reachable: {e}")
+            return None
+        _client = client
+        _client_error = None
+        _get_logger().info(f"Connected to Docker daemon at {client.api.base_url} (pool size {pool_size}).")
+        return _client
+
+def get_docker_error():
+    return _client_error
+
+def reset_docker_client():
+    """Drops the shared client so the next call reconnects (e.g. after the daemon restarted)."""
+    global _client
+    with _lock:
+        if _client is not None:
+            try:
+                _client.close()
+            except Exception:
+                pass
+        _client = None
+
+# Minimum time between two progress events for the same image layer.
+PULL_PROGRESS_INTERVAL_SECONDS = 0.5
+
+def pull_image(client, image, report):
+    """
+    Pulls an image, passing per-layer progress to report(event_type, message, **fields).
+    Progress updates for a layer are throttled; status changes are always reported.
+    """
+    from docker.utils import parse_repository_tag
+    repository, tag = parse_repository_tag(image)
+    tag = tag or 'latest'
+    report('pull', f"Pulling {repository}:{tag}...")
+    last_report = {}
+    for event in client.api.pull(repository, tag=tag, stream=True, decode=True):
+        if event.get('error'):
+            raise RuntimeError(event['error'])
+        layer = event.get('id')
+        status = event.get('status', '')
+        detail = event.get('progressDetail') or {}
+        now = time.monotonic()
+        previous = last_report.get(layer)
+        if previous and previous[0] == status and now - previous[1] < PULL_PROGRESS_INTERVAL_SECONDS:
+            continue
+        last_report[layer] = (status, now)
+        report('pull', status, layer=layer, current=detail.get('current'), total=detail.get('total'))
+
+def deploy_template(template, report):
+    """
+    Pulls the template's image and starts a container for it through the Docker SDK.
+    Only container (type 1) templates can be deployed. Returns the container id.
+    """
+    from . import compose_converter
+    options = compose_converter.container_run_options(template)
+    client = get_docker_client()
+    if client is None:
+        raise RuntimeError(f"Docker is not available: {get_docker_error()}")
+    pull_image(client, options['image'], report)
+    report('deploy', f"Starting container '{options['name']}'...")
+    container = client.containers.run(detach=True, **options)
+    report('deploy', f"Container '{container.name}' started ({container.short_id}).", container_id=container.id)
+    return container.id
@@ -0,0 +1,299 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+from . import docker_manager
+
+# Background pre-pull of the images behind pinned templates, so installing them is
+# "instant". Pins are deduped by normalized image reference (several templates and
+# sources often share one image), tags of the same repository are pulled one after the
+# other (they share most layers, so the second pull only fetches the difference), and
+# different repositories are pulled in parallel up to a concurrency cap. Runs on the
+# leader from the scheduler, and only while the host is idle.
+DEFAULT_MAX_CONCURRENT = 2
+DEFAULT_IDLE_CPU_PERCENT = 75
+# How long the list of local images is reused before asking the daemon again.
+LOCAL_IMAGES_TTL_SECONDS = 30
+BANDWIDTH_WINDOW_SECONDS = 10
+
+STATE_LOCAL = 'local'
+STATE_QUEUED = 'queued'
+STATE_PULLING = 'pulling'
+STATE_FAILED = 'failed'
+
+def _get_logger():
+    return current_app.logger if current_app else logging.getLogger(__name__)
+
+def normalize_image(image):
+    """Canonical image reference: 'nginx' and 'docker.io/library/nginx:latest' both become 'nginx:latest'."""
+    image = str(image or '').strip()
+    if not image:
+        return None
+    for prefix in ('docker.io/', 'index.docker.io/'):
+        if image.startswith(prefix):
+            image = image[len(prefix):]
+    if image.startswith('library/'):
+        image = image[len('library/'):]
+    if '@' not in image and ':' not in image.rsplit('/', 1)[-1]:
+        image += ':latest'
+    return image
+
+def repository_of(image):
+    """'lscr.io/linuxserver/sonarr:4' -> 'lscr.io/linuxserver/sonarr'."""
+    name = image.split('@', 1)[0]
+    head, _, last = name.rpartition('/')
+    last = last.split(':', 1)[0]
+    return f"{head}/{last}" if head else last
+
+class LocalImages:
+    """The daemon's local image tags, cached for a short time."""
+
+    def __init__(self, ttl=LOCAL_IMAGES_TTL_SECONDS):
+        self.ttl = ttl
+        self._images = frozenset()
+        self._loaded_at = None
+        self._lock = threading.Lock()
+
+    def get(self, client):
+        with self._lock:
+            if self._loaded_at is None or time.monotonic() - self._loaded_at >= self.ttl:
+                tags = set()
+                for image in client.api.images():
+                    for tag in image.get('RepoTags') or []:
+                        if tag and tag != '<none>:<none>':
+                            tags.add(normalize_image(tag))
+                    for digest in image.get('RepoDigests') or []:
+                        tags.add(normalize_image(digest))
+                self._images = frozenset(tags)
+                self._loaded_at = time.monotonic()
+            return self._images
+
+    def add(self, image):
+        with self._lock:
+            self._images = self._images | {image}
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = None
+
+class BandwidthBudget:
+    """
+    Caps the average download rate of pre-pulls. The daemon downloads layers on its own,
+    so the cap is enforced at admission: a new pull waits until the bytes reported over
+    the last window are back under the limit.
+    """
+
+    def __init__(self, max_bytes_per_second, window=BANDWIDTH_WINDOW_SECONDS):
+        self.max_bytes_per_second = max_bytes_per_second
+        self.window = window
+        self._samples = []
+        self._lock = threading.Lock()
+
+    def consume(self, nbytes):
+        if self.max_bytes_per_second and nbytes > 0:
+            with self._lock:
+                self._samples.append((time.monotonic(), nbytes))
+
+    def _rate(self):
+        cutoff = time.monotonic() - self.window
+        with self._lock:
+            self._samples = [s for s in self._samples if s[0] >= cutoff]
+            return sum(n for _, n in self._samples) / self.window
+
+    def wait(self, stop_event=None):
+        if not self.max_bytes_per_second:
+            return
+        while self._rate() > self.max_bytes_per_second:
+            if stop_event is not None and stop_event.wait(0.5):
+                return
+            if stop_event is None:
+                time.sleep(0.5)
+
+class PrePuller:
+    def __init__(self, client_factory, max_concurrent=DEFAULT_MAX_CONCURRENT, max_bytes_per_second=0):
+        self.client_factory = client_factory
+        self.max_concurrent = max(1, max_concurrent)
+        self.bandwidth = BandwidthBudget(max_bytes_per_second)
+        self.local_images = LocalImages()
+        # Layers this process has seen the daemon download or report as present.
+        self.known_layers = set()
+        self._images = {}
+        self._lock = threading.Lock()
+        self._run_lock = threading.Lock()
+        self._stop = threading.Event()
+        # Set when pins change during a run, so the run is repeated with the new pins.
+        self.rerun_requested = threading.Event()
+        self.last_run_at = None
+        self.last_error = None
+
+    @property
+    def running(self):
+        return self._run_lock.locked()
+
+    def status(self):
+        with self._lock:
+            return [dict(entry, template_ids=sorted(entry['template_ids'])) for entry in self._images.values()]
+
+    def _update(self, image, **fields):
+        with self._lock:
+            entry = self._images[image]
+            entry.update(fields)
+            entry['updated_at'] = time.time()
+
+    def plan(self, pins, local):
+        """
+        Groups the pinned images for pulling: {repository: [image, ...]} for images that
+        aren't local yet. Every pinned image gets a status entry.
+        """
+        wanted = {}
+        for pin in pins:
+            image = normalize_image(pin.get('image'))
+            if image:
+                wanted.setdefault(image, set()).add(pin.get('template_id'))
+        groups = {}
+        with self._lock:
+            self._images = {image: self._images.get(image, {'image': image, 'error': None, 'layers': 0,
+                                                            'layers_shared': 0, 'bytes': 0, 'updated_at': None})
+                            for image in wanted}
+            for image, template_ids in wanted.items():
+                entry = self._images[image]
+                entry['template_ids'] = template_ids
+                if image in local:
+                    entry['state'] = STATE_LOCAL
+                else:
+                    entry['state'] = STATE_QUEUED
+                    groups.setdefault(repository_of(image), []).append(image)
+        return groups
+
+    def _pull(self, client, image):
+        self.bandwidth.wait(self._stop)
+        if self._stop.is_set():
+            return
+        self._update(image, state=STATE_PULLING, error=None)
+        layers = {}
+        shared = 0
+        try:
+            for event in client.api.pull(image, stream=True, decode=True):
+                if event.get('error'):
+                    raise RuntimeError(event['error'])
+                layer = event.get('id')
+                status = event.get('status', '')
+                if not layer or status.startswith('Pulling from'):
+                    continue
+                if layer not in layers and (status == 'Already exists' or layer in self.known_layers):
+                    shared += 1
+                current = (event.get('progressDetail') or {}).get('current')
+                if status == 'Downloading' and current:
+                    self.bandwidth.consume(current - layers.get(layer, 0))
+                    layers[layer] = current
+                else:
+                    layers.setdefault(layer, 0)
+                if status in ('Pull complete', 'Already exists'):
+                    self.known_layers.add(layer)
+            self.local_images.add(image)
+            self._update(image, state=STATE_LOCAL, layers=len(layers), layers_shared=shared, bytes=sum(layers.values()))
+            _get_logger().info(f"Pre-pulled {image}: {len(layers)} layer(s), {shared} already present.")
+        except Exception as e:
+            self._update(image, state=STATE_FAILED, error=str(e))
+            _get_logger().warning(f"Pre-pull of {image} failed: {e}")
+
+    def run_once(self, pins):
+        """Pulls every pinned image that isn't local yet. Returns False if a run is already in progress."""
+        if not self._run_lock.acquire(blocking=False):
+            return False
+        try:
+            self.last_run_at = time.time()
+            if not pins:
+                with self._lock:
+                    self._images = {}
+                return True
+            client = self.client_factory()
+            if client is None:
+                self.last_error = docker_manager.get_docker_error() or "Docker is not available."
+                return True
+            self.last_error = None
+            self.local_images.invalidate()
+            groups = self.plan(pins, self.local_images.get(client))
+            if not groups:
+                return True
+
+            def pull_group(images):
+                # Tags of one repository share layers: pull them one at a time.
+                for image in images:
+                    if self._stop.is_set():
+                        return
+                    self._pull(client, image)
+
+            with ThreadPoolExecutor(max_workers=self.max_concurrent, thread_name_prefix='prepull') as executor:
+                list(executor.map(pull_group, groups.values()))
+            return True
+        finally:
+            self._run_lock.release()
+
+    def stop(self):
+        self._stop.set()
+
+_prepuller = None
+_prepuller_lock = threading.Lock()
+
+def get_prepuller(flask_app):
+    global _prepuller
+    if _prepuller is None:
+        with _prepuller_lock:
+            if _prepuller is None:
+                def client_factory():
+                    with flask_app.app_context():
+                        return docker_manager.get_docker_client()
+
+                mbps = flask_app.config.get('PREPULL_MAX_BANDWIDTH_MBPS', 0)
+                _prepuller = PrePuller(
+                    client_factory,
+                    max_concurrent=flask_app.config.get('PREPULL_MAX_CONCURRENT', DEFAULT_MAX_CONCURRENT),
+                    max_bytes_per_second=int(mbps * 1024 * 1024 / 8),
+                )
+    return _prepuller
+
+def current_pins():
+    """Pinned templates with their current image (the catalog entry may have changed since pinning)."""
+    from . import storage, template_manager
+    pins = []
+    for pin in storage.get_storage().get_pinned_templates():
+        template = template_manager.get_template_by_id(pin['template_id'])
+        image = template.get('image') if template else None
+        pins.append(dict(pin, image=image or pin['image']))
+    return pins
+
+def is_idle(flask_app):
+    """No install job is running here and the host CPU is below PREPULL_IDLE_CPU_PERCENT."""
+    from . import jobs
+    if jobs.active_job_count():
+        return False
+    import psutil
+    threshold = flask_app.config.get('PREPULL_IDLE_CPU_PERCENT', DEFAULT_IDLE_CPU_PERCENT)
+    return psutil.cpu_percent(interval=0.5) < threshold
+
+def run_prepull(flask_app, force=False):
+    """Scheduler entry point: pre-pulls pinned images when the host is idle."""
+    with flask_app.app_context():
+        if not force and not is_idle(flask_app):
+            flask_app.logger.info("Skipping image pre-pull: host is busy.")
+            return
+        prepuller = get_prepuller(flask_app)
+        while True:
+            prepuller.rerun_requested.clear()
+            # A run already in progress will see rerun_requested and go again.
+            if not prepuller.run_once(current_pins()) or not prepuller.rerun_requested.is_set():
+                return
+
+def trigger(flask_app):
+    """Starts a pre-pull run in the background (e.g. right after a pin), or asks the current run to repeat."""
+    prepuller = get_prepuller(flask_app)
+    prepuller.rerun_requested.set()
+    if prepuller.running:
+        return
+    threading.Thread(target=run_prepull, args=(flask_app, True), name='prepull-trigger', daemon=True).start()
+
+def instant_template_ids(catalog, local):
+    """Ids of catalog templates whose image is already local."""
+    return [t['id'] for t in catalog.templates if t.get('image') and normalize_image(t['image']) in local]
@@ -0,0 +1,479 @@
+import bisect
+import hashlib
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import urllib.parse
+from contextlib import contextmanager
+from flask import current_app, g, request
+from . import config_manager
+
+# Request and hot-path instrumentation: counters and histograms exported in the
+# Prometheus text format at /metrics, and an opt-in sampling profiler that writes
+# per-request collapsed stacks (flame graph input) to the data dir.
+#
+# Metrics live in process memory. With several gunicorn workers, each process also
+# writes its counters and histograms to the data dir every few seconds, and /metrics
+# sums the files of the processes that are still alive, so a scrape that lands on any
+# worker sees the whole server. Gauges are read from the answering process only.
+# Files carry their process's start time, so a pid reused after a restart doesn't bring
+# back old counters, and the leader clears the directory when the app boots.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+SIZE_BUCKETS = (1024, 16 * 1024, 128 * 1024, 1024 * 1024, 8 * 1024 * 1024, 64 * 1024 * 1024)
+METRICS_DIRNAME = 'metrics'
+DEFAULT_SHARE_INTERVAL_SECONDS = 5
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+PROFILES_DIRNAME = 'profiles'
+PROFILE_HEADER = 'X-DockYard-Profile'
+PROFILER_OFF = 'off'
+PROFILER_HEADER = 'header'  # profile requests that send the X-DockYard-Profile header
+PROFILER_ALL = 'all'
+DEFAULT_PROFILE_INTERVAL_MS = 5
+DEFAULT_PROFILES_KEPT = 50
+
+def _get_logger():
+    return current_app.logger if current_app else logging.getLogger(__name__)
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)] + [f'{n}="{v}"' for n, v in extra]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def _format_number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def snapshot(self):
+        """Counters and histograms as JSON-serializable data, for sharing between processes."""
+        return {m.name: m.snapshot() for m in self.metrics if m.shared}
+
+    def render(self, shared_snapshots=()):
+        """Prometheus text exposition. shared_snapshots of other processes are added to ours."""
+        lines = []
+        for metric in self.metrics:
+            values = metric.merged([s.get(metric.name, []) for s in shared_snapshots]) if metric.shared else None
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render(values))
+        return '\n'.join(lines) + '\n'
+
+REGISTRY = Registry()
+
+class Counter:
+    kind = 'counter'
+    shared = True
+
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(n, '')) for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(tuple(str(labels.get(n, '')) for n in self.labelnames), 0)
+
+    def snapshot(self):
+        with self._lock:
+            return [[list(key), value] for key, value in self._values.items()]
+
+    def merged(self, others):
+        with self._lock:
+            values = dict(self._values)
+        for snapshot in others:
+            for key, value in snapshot:
+                key = tuple(key)
+                values[key] = values.get(key, 0) + value
+        return values
+
+    def render(self, values):
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_number(value)}"
+                for key, value in sorted(values.items())]
+
+class Histogram:
+    """Cumulative-bucket histogram. Internally each label set keeps per-bucket counts, the sum and the count."""
+    kind = 'histogram'
+    shared = True
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS, registry=REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(n, '')) for n in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels):
+        entry = self._values.get(tuple(str(labels.get(n, '')) for n in self.labelnames))
+        return entry[2] if entry else 0
+
+    def snapshot(self):
+        with self._lock:
+            return [[list(key), [list(counts), total, count]] for key, (counts, total, count) in self._values.items()]
+
+    def merged(self, others):
+        with self._lock:
+            values = {key: [list(counts), total, count] for key, (counts, total, count) in self._values.items()}
+        for snapshot in others:
+            for key, (counts, total, count) in snapshot:
+                key = tuple(key)
+                entry = values.get(key)
+                if entry is None or len(counts) != len(entry[0]):
+                    values[key] = [list(counts), total, count]
+                    continue
+                entry[0] = [a + b for a, b in zip(entry[0], counts)]
+                entry[1] += total
+                entry[2] += count
+        return values
+
+    def render(self, values):
+        lines = []
+        for key, (counts, total, count) in sorted(values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, [('le', _format_number(bound))])
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_number(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+class Gauge:
+    """
+    A value read from `func` at scrape time, in the answering process. With labelnames,
+    `func` returns {label values tuple: value} instead.
+    """
+    kind = 'gauge'
+    shared = False
+
+    def __init__(self, name, documentation, func, labelnames=(), registry=REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.func = func
+        self.labelnames = tuple(labelnames)
+        registry.register(self)
+
+    def render(self, values):
+        try:
+            value = self.func()
+        except Exception as e:
+            _get_logger().warning(f"Could not read gauge {self.name}: {e}")
+            return []
+        if value is None:
+            return []
+        if not self.labelnames:
+            return [f"{self.name} {_format_number(value)}"]
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_number(v)}" for key, v in value.items()]
+
+class StartupTimer:
+    """Times consecutive startup phases: mark(name) closes the phase that began at the previous mark."""
+
+    def __init__(self, started_at=None):
+        self.started_at = time.perf_counter() if started_at is None else started_at
+        self.phases = {}
+        self._last = self.started_at
+
+    def mark(self, name):
+        now = time.perf_counter()
+        self.phases[name] = now - self._last
+        self._last = now
+
+    @property
+    def total(self):
+        return self._last - self.started_at
+
+    def report(self):
+        phases = ', '.join(f"{name} {seconds * 1000:.0f}ms" for name, seconds in self.phases.items())
+        return f"{phases}; total {self.total * 1000:.0f}ms"
+
+# Metrics of the app. Label values are bounded: endpoints are Flask endpoint names and
+# sources are the configured template sources, labeled by source_label().
+HTTP_REQUESTS = Counter('dockyard_http_requests_total', 'HTTP requests by endpoint, method and status.',
+                        ('endpoint', 'method', 'status'))
+HTTP_REQUEST_SECONDS = Histogram('dockyard_http_request_duration_seconds',
+                                 'Time to produce a response (streamed bodies excluded).', ('endpoint', 'method'))
+CATALOG_REFRESHES = Counter('dockyard_catalog_refreshes_total', 'Catalog refreshes by result.', ('result',))
+CATALOG_REFRESH_SECONDS = Histogram('dockyard_catalog_refresh_duration_seconds', 'Catalog refresh duration.',
+                                    buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120))
+SOURCE_FETCHES = Counter('dockyard_source_fetches_total',
+                         'Template source fetches by outcome (ok, not_modified, rejected, error).', ('source', 'outcome'))
+SOURCE_FETCH_SECONDS = Histogram('dockyard_source_fetch_duration_seconds', 'Template source fetch duration.', ('source',))
+SOURCE_FETCH_BYTES = Histogram('dockyard_source_fetch_bytes', 'Template source body size.', ('source',),
+                               buckets=SIZE_BUCKETS)
+CACHE_REQUESTS = Counter('dockyard_cache_requests_total', 'Cache lookups by cache and result (hit or miss).',
+                         ('cache', 'result'))
+
+def source_label(url):
+    """
+    Metric label for a template source: its host and a short hash of the full URL, e.g.
+    'raw.githubusercontent.com-1a2b3c4d'. Source URLs can carry credentials or tokens,
+    so they are never exported as they are.
+    """
+    host = urllib.parse.urlsplit(url).hostname or 'unknown'
+    return f"{host}-{hashlib.sha256(url.encode('utf-8')).hexdigest()[:8]}"
+
+def cache_result(cache, hit):
+    CACHE_REQUESTS.inc(cache=cache, result='hit' if hit else 'miss')
+
+# Startup phases of this process, set by the app factory.
+_startup = None
+
+def record_startup(timer):
+    global _startup
+    _startup = timer
+
+def startup_phases():
+    """{phase: seconds} of this process's startup, or None before startup completed."""
+    return dict(_startup.phases) if _startup is not None else None
+
+STARTUP_SECONDS = Gauge('dockyard_startup_phase_seconds', 'Startup time of the answering process, by phase.',
+                        lambda: {(name,): round(s, 6) for name, s in _startup.phases.items()} if _startup else None,
+                        ('phase',))
+
+# Sharing between worker processes
+
+_share_thread_pid = None
+_share_lock = threading.Lock()
+
+def _metrics_dir():
+    config_manager._ensure_data_dir_exists()
+    path = os.path.join(config_manager.APP_DATA_DIR, METRICS_DIRNAME)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+def _process_started_at(pid):
+    """Start time of a process, or None if it is gone. Tells a reused pid apart."""
+    import psutil # Imported lazily: only needed once snapshots are shared
+    try:
+        return psutil.Process(pid).create_time()
+    except psutil.Error:
+        return None
+
+def write_shared_snapshot():
+    """Writes this process's counters and histograms for the other workers' /metrics."""
+    try:
+        path = os.path.join(_metrics_dir(), f"{os.getpid()}.json")
+        tmp_path = f"{path}.tmp.{os.getpid()}.{threading.get_ident()}"
+        with open(tmp_path, 'w') as f:
+            json.dump({'started_at': _process_started_at(os.getpid()), 'metrics': REGISTRY.snapshot()},
+                      f, separators=(',', ':'))
+        os.replace(tmp_path, path)
+    except OSError as e:
+        _get_logger().warning(f"Could not write metrics snapshot: {e}")
+
+def _snapshot_alive(pid, started_at):
+    current = _process_started_at(pid)
+    return current is not None and started_at is not None and abs(current - started_at) < 1
+
+def read_shared_snapshots():
+    """Snapshots of the other live processes. Files of exited processes are removed."""
+    snapshots = []
+    try:
+        directory = _metrics_dir()
+        names = os.listdir(directory)
+    except OSError:
+        return snapshots
+    for name in names:
+        pid_text, _, ext = name.partition('.')
+        if ext != 'json' or not pid_text.isdigit() or int(pid_text) == os.getpid():
+            continue
+        path = os.path.join(directory, name)
+        try:
+            with open(path) as f:
+                data = json.load(f)
+            alive = isinstance(data, dict) and _snapshot_alive(int(pid_text), data.get('started_at'))
+        except (OSError, ValueError):
+            continue
+        if not alive:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            continue
+        snapshots.append(data['metrics'])
+    return snapshots
+
+def clear_shared_snapshots():
+    """
+    Removes every shared snapshot, e.g. those left by a previous run of the server. Run by
+    the leader at boot; live workers write theirs again within the share interval.
+    """
+    directory = os.path.join(config_manager.APP_DATA_DIR, METRICS_DIRNAME)
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return
+    for name in names:
+        try:
+            os.remove(os.path.join(directory, name))
+        except OSError:
+            pass
+
+def _share_loop(interval):
+    while True:
+        time.sleep(interval)
+        write_shared_snapshot()
+
+def _ensure_share_thread(flask_app):
+    """Starts the snapshot writer once per process (after a fork, the child starts its own)."""
+    global _share_thread_pid
+    if _share_thread_pid == os.getpid():
+        return
+    interval = flask_app.config.get('METRICS_SHARE_INTERVAL_SECONDS', DEFAULT_SHARE_INTERVAL_SECONDS)
+    with _share_lock:
+        if _share_thread_pid == os.getpid():
+            return
+        _share_thread_pid = os.getpid()
+        if interval and interval > 0:
+            threading.Thread(target=_share_loop, args=(interval,), name='metrics-share', daemon=True).start()
+
+def render_metrics():
+    return REGISTRY.render(read_shared_snapshots())
+
+# Sampling profiler
+
+class SamplingProfiler:
+    """
+    Samples the stack of one thread every `interval` seconds from a helper thread and
+    counts collapsed stacks ("outer;inner" frames), the input format of flame graph tools.
+    """
+
+    def __init__(self, thread_id, interval=DEFAULT_PROFILE_INTERVAL_MS / 1000):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = {}
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='request-profiler', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        return self.stacks
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            frames = []
+            while frame is not None:
+                code = frame.f_code
+                frames.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            stack = ';'.join(reversed(frames))
+            self.stacks[stack] = self.stacks.get(stack, 0) + 1
+            self.samples += 1
+
+    def folded(self):
+        return ''.join(f"{stack} {count}\n" for stack, count in sorted(self.stacks.items()))
+
+def _profiles_dir():
+    config_manager._ensure_data_dir_exists()
+    path = os.path.join(config_manager.APP_DATA_DIR, PROFILES_DIRNAME)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+def save_profile(profiler, endpoint, keep=DEFAULT_PROFILES_KEPT):
+    """Writes a request's collapsed stacks and prunes old profiles. Returns the file name."""
+    directory = _profiles_dir()
+    name = f"{time.strftime('%Y%m%d-%H%M%S')}-{time.time_ns() % 10**9:09d}-{endpoint or 'unmatched'}.folded"
+    with open(os.path.join(directory, name), 'w') as f:
+        f.write(profiler.folded())
+    profiles = sorted(n for n in os.listdir(directory) if n.endswith('.folded'))
+    for old in profiles[:-keep] if keep > 0 else []:
+        try:
+            os.remove(os.path.join(directory, old))
+        except OSError:
+            pass
+    return name
+
+def _should_profile(flask_app):
+    mode = flask_app.config.get('PROFILER_MODE', PROFILER_OFF)
+    return mode == PROFILER_ALL or (mode == PROFILER_HEADER and bool(request.headers.get(PROFILE_HEADER)))
+
+# Flask hooks
+
+def init_app(flask_app):
+    """Registers the request hooks. Call before other before_request hooks so they are timed too."""
+
+    @flask_app.before_request
+    def _start_request_timer():
+        g.request_started_at = time.perf_counter()
+        _ensure_share_thread(flask_app)
+        if _should_profile(flask_app):
+            interval = flask_app.config.get('PROFILER_INTERVAL_MS', DEFAULT_PROFILE_INTERVAL_MS) / 1000
+            g.request_profiler = SamplingProfiler(threading.get_ident(), interval).start()
+
+    @flask_app.after_request
+    def _record_request(response):
+        started_at = g.pop('request_started_at', None)
+        endpoint = request.endpoint or 'unmatched'
+        if started_at is not None:
+            HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started_at, endpoint=endpoint, method=request.method)
+        HTTP_REQUESTS.inc(endpoint=endpoint, method=request.method, status=response.status_code)
+        profiler = g.pop('request_profiler', None)
+        if profiler is not None:
+            profiler.stop()
+            try:
+                name = save_profile(profiler, endpoint, flask_app.config.get('PROFILER_KEEP', DEFAULT_PROFILES_KEPT))
+                response.headers['X-DockYard-Profile-File'] = name
+                flask_app.logger.info(f"Profiled {request.method} {request.path}: {profiler.samples} samples in {name}.")
+            except OSError as e:
+                flask_app.logger.warning(f"Could not save request profile: {e}")
+        return response
+
+    @flask_app.teardown_request
+    def _stop_profiler(exc):
+        # after_request doesn't run when a request fails before producing a response.
+        profiler = g.pop('request_profiler', None)
+        if profiler is not None:
+            profiler.stop()
@@ -0,0 +1,311 @@
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+from . import config_manager
+from . import instrumentation
+
+# Install jobs: /install_app returns a job id right away, and a bounded worker pool
+# generates the compose file and optionally deploys it through the Docker SDK. Each
+# job keeps an ordered event log (status changes, per-layer pull progress, deploy
+# steps) that clients follow over SSE. Job records are persisted under the data dir.
+JOBS_DIRNAME = 'jobs'
+DEFAULT_WORKERS = 2
+DEFAULT_QUEUE_LIMIT = 20
+# Keep this many finished jobs (in memory and on disk).
+MAX_FINISHED_JOBS = 100
+# Keep the latest events of a job only (a large pull reports many layers); their seq
+# numbers keep counting, so clients resume where they were.
+MAX_JOB_EVENTS = 500
+# Other workers follow a job through its record on disk. Steps and status changes are
+# written right away; layer progress at most this often.
+PERSIST_INTERVAL_SECONDS = 1.0
+# Each job records the process running it (host, pid and process start time). An
+# unfinished job whose process on this host is gone was cut off by a restart. For jobs of
+# another host (or records without an owner), one that hasn't changed for this long
+# belonged to a process that is gone (live jobs keep updating their records).
+STALE_JOB_SECONDS = 300
+
+STATUS_QUEUED = 'queued'
+STATUS_RUNNING = 'running'
+STATUS_SUCCEEDED = 'succeeded'
+STATUS_FAILED = 'failed'
+FINISHED_STATUSES = (STATUS_SUCCEEDED, STATUS_FAILED)
+
+class QueueFull(RuntimeError):
+    pass
+
+def _get_logger():
+    return current_app.logger if current_app else logging.getLogger(__name__)
+
+def _process_identity():
+    """(host, pid, start time) of this process; the start time tells a reused pid apart."""
+    import psutil # Imported lazily: only needed once install jobs are used
+    return {'host': socket.gethostname(), 'pid': os.getpid(), 'started_at': psutil.Process().create_time()}
+
+def _owner_alive(owner, updated_at):
+    """Whether the process that owns an unfinished job may still be running it."""
+    if not owner or owner.get('host') != socket.gethostname():
+        return updated_at >= time.time() - STALE_JOB_SECONDS
+    import psutil
+    try:
+        return abs(psutil.Process(owner['pid']).create_time() - owner['started_at']) < 1
+    except (psutil.Error, KeyError, TypeError):
+        return False
+
+def _jobs_dir():
+    config_manager._ensure_data_dir_exists()
+    path = os.path.join(config_manager.APP_DATA_DIR, JOBS_DIRNAME)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+class Job:
+    def __init__(self, template_id, title, deploy=False, use_ai=False, job_id=None):
+        self.id = job_id or uuid.uuid4().hex
+        self.template_id = template_id
+        self.title = title
+        self.deploy = deploy
+        self.use_ai = use_ai
+        self.owner = None
+        self.status = STATUS_QUEUED
+        self.created_at = time.time()
+        self.updated_at = self.created_at
+        self.compose_file = None
+        self.generator = None
+        self.container_id = None
+        self.error = None
+        self.events = []
+        self.last_seq = 0
+        self.persisted_at = None  # time.monotonic() of the last write of this job's record
+        self._condition = threading.Condition()
+
+    def add_event(self, event_type, message=None, **fields):
+        with self._condition:
+            self.last_seq += 1
+            event = {'seq': self.last_seq, 'time': time.time(), 'type': event_type}
+            if message is not None:
+                event['message'] = message
+            event.update(fields)
+            self.events.append(event)
+            if len(self.events) > MAX_JOB_EVENTS:
+                del self.events[:len(self.events) - MAX_JOB_EVENTS]
+            self.updated_at = event['time']
+            self._condition.notify_all()
+            return event
+
+    def events_after(self, after_seq):
+        """The events kept with a seq above after_seq (seq numbers are consecutive)."""
+        events = self.events
+        if not events:
+            return []
+        return events[max(0, after_seq - events[0]['seq'] + 1):]
+
+    def set_status(self, status, message=None):
+        self.status = status
+        self.add_event('status', message, status=status)
+
+    @property
+    def finished(self):
+        return self.status in FINISHED_STATUSES
+
+    def wait_for_events(self, after_seq, timeout):
+        """Blocks until there are events after after_seq, the job finished, or timeout. Returns new events."""
+        with self._condition:
+            self._condition.wait_for(lambda: self.last_seq > after_seq or self.finished, timeout=timeout)
+            return self.events_after(after_seq)
+
+    def to_dict(self, include_events=True):
+        data = {
+            'id': self.id,
+            'template_id': self.template_id,
+            'title': self.title,
+            'deploy': self.deploy,
+            'use_ai': self.use_ai,
+            'owner': self.owner,
+            'status': self.status,
+            'created_at': self.created_at,
+            'updated_at': self.updated_at,
+            'compose_file': self.compose_file,
+            'generator': self.generator,
+            'container_id': self.container_id,
+            'error': self.error,
+        }
+        if include_events:
+            data['events'] = list(self.events)
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        job = cls(data['template_id'], data.get('title'), data.get('deploy', False), data.get('use_ai', False), job_id=data['id'])
+        for key in ('owner', 'status', 'created_at', 'updated_at', 'compose_file', 'generator', 'container_id', 'error'):
+            setattr(job, key, data.get(key))
+        job.events = data.get('events') or []
+        job.last_seq = job.events[-1]['seq'] if job.events else 0
+        return job
+
+def generate_compose(template, use_ai=False):
+    """
+    Generates a compose file: the native converter first, the AI when asked for or when
+    the converter can't handle the template. Returns (compose_text, error, generator).
+    """
+    from . import compose_converter, ai_manager
+    if not use_ai:
+        try:
+            stackfile = compose_converter.fetch_stackfile(template) if compose_converter.is_stack(template) else None
+            return compose_converter.convert_template(template, stackfile), None, 'native'
+        except compose_converter.ConversionError as e:
+            _get_logger().info(f"Native conversion not possible for '{template.get('title')}' ({e}). Falling back to AI.")
+    compose_file, error = ai_manager.generate_compose_file(template)
+    return compose_file, error, 'ai'
+
+class JobManager:
+    def __init__(self, flask_app, workers=DEFAULT_WORKERS, queue_limit=DEFAULT_QUEUE_LIMIT):
+        self.flask_app = flask_app
+        self.queue_limit = queue_limit
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='install-job')
+        self._jobs = {}  # jobs run by this process, and finished jobs
+        self._lock = threading.Lock()
+        self._owner = _process_identity()
+        self._load_persisted()
+
+    def _persist(self, job, throttle=False):
+        now = time.monotonic()
+        if throttle and job.persisted_at is not None and now - job.persisted_at < PERSIST_INTERVAL_SECONDS:
+            return
+        job.persisted_at = now
+        try:
+            path = os.path.join(_jobs_dir(), f"{job.id}.json")
+            tmp_path = f"{path}.tmp.{os.getpid()}.{threading.get_ident()}"
+            with open(tmp_path, 'w') as f:
+                json.dump(job.to_dict(), f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            _get_logger().warning(f"Could not persist job {job.id}: {e}")
+
+    def _load_persisted(self):
+        try:
+            jobs_dir = _jobs_dir()
+            names = [n for n in os.listdir(jobs_dir) if n.endswith('.json')]
+        except OSError:
+            return
+        for name in names:
+            try:
+                with open(os.path.join(jobs_dir, name)) as f:
+                    job = Job.from_dict(json.load(f))
+            except (OSError, ValueError, KeyError):
+                continue
+            if not job.finished:
+                if _owner_alive(job.owner, job.updated_at):
+                    # Another worker is running it; get() follows its persisted record.
+                    continue
+                # It was running in a process that no longer exists.
+                job.error = "Interrupted by an application restart."
+                job.set_status(STATUS_FAILED, job.error)
+                self._persist(job)
+            self._jobs[job.id] = job
+        self._prune()
+
+    def _prune(self):
+        finished = sorted((j for j in self._jobs.values() if j.finished), key=lambda j: j.updated_at)
+        for job in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self._jobs[job.id]
+            try:
+                os.remove(os.path.join(_jobs_dir(), f"{job.id}.json"))
+            except OSError:
+                pass
+
+    def submit(self, template, deploy=False, use_ai=False):
+        with self._lock:
+            pending = self.active_count()
+            if pending >= self.queue_limit:
+                raise QueueFull(f"Too many install jobs in progress ({pending}). Try again shortly.")
+            job = Job(template.get('id'), template.get('title'), deploy=deploy, use_ai=use_ai)
+            job.owner = self._owner
+            job.add_event('status', 'Queued.', status=STATUS_QUEUED)
+            self._jobs[job.id] = job
+            self._prune()
+        self._persist(job)
+        self._executor.submit(self._run, job, template)
+        return job
+
+    def get(self, job_id):
+        job = self._jobs.get(job_id)
+        if job is None:
+            # The job may belong to another worker process; read its persisted state.
+            try:
+                with open(os.path.join(_jobs_dir(), f"{os.path.basename(job_id)}.json")) as f:
+                    return Job.from_dict(json.load(f))
+            except (OSError, ValueError, KeyError):
+                return None
+        return job
+
+    def is_local(self, job_id):
+        return job_id in self._jobs
+
+    def active_count(self):
+        return sum(1 for j in list(self._jobs.values()) if not j.finished)
+
+    def list(self, limit=20):
+        with self._lock:
+            jobs = sorted(self._jobs.values(), key=lambda j: j.created_at, reverse=True)
+        return jobs[:limit]
+
+    def _run(self, job, template):
+        with self.flask_app.app_context():
+            logger = current_app.logger
+            try:
+                job.set_status(STATUS_RUNNING, 'Generating compose file...')
+                self._persist(job)
+                compose_file, error, generator = generate_compose(template, use_ai=job.use_ai)
+                if error:
+                    raise RuntimeError(error)
+                job.compose_file = compose_file
+                job.generator = generator
+                job.add_event('compose', f"Compose file generated ({generator}).", generator=generator)
+                self._persist(job)
+
+                if job.deploy:
+                    from . import docker_manager
+
+                    def report(event_type, message=None, **fields):
+                        job.add_event(event_type, message, **fields)
+                        # Layer progress is frequent; new steps reach other workers at once.
+                        self._persist(job, throttle=fields.get('layer') is not None)
+
+                    job.container_id = docker_manager.deploy_template(template, report)
+
+                job.set_status(STATUS_SUCCEEDED, 'Done.')
+                logger.info(f"Install job {job.id} for '{job.title}' succeeded.")
+            except Exception as e:
+                job.error = str(e)
+                job.set_status(STATUS_FAILED, job.error)
+                logger.error(f"Install job {job.id} for '{job.title}' failed: {e}")
+            finally:
+                self._persist(job)
+
+_manager = None
+_manager_lock = threading.Lock()
+
+def get_job_manager(flask_app):
+    global _manager
+    if _manager is None:
+        with _manager_lock:
+            if _manager is None:
+                _manager = JobManager(
+                    flask_app,
+                    workers=flask_app.config.get('INSTALL_JOB_WORKERS', DEFAULT_WORKERS),
+                    queue_limit=flask_app.config.get('INSTALL_JOB_QUEUE_LIMIT', DEFAULT_QUEUE_LIMIT),
+                )
+    return _manager
+
+def active_job_count():
+    """Install jobs queued or running in this process (0 if no job was ever submitted)."""
+    return _manager.active_count() if _manager is not None else 0
+
+instrumentation.Gauge('dockyard_install_jobs_active', 'Install jobs queued or running in this process.',
+                      active_job_count)
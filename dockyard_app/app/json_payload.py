@@ -0,0 +1,85 @@
+import gzip
+import json
+import threading
+from .template_record import to_jsonable
+from . import instrumentation
+
+try:
+    import brotli
+except ImportError:  # Brotli is optional; gzip is always available.
+    brotli = None
+
+JSON_MIMETYPE = 'application/json'
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+class SerializedPayload:
+    """
+    Pre-serialized response body with its compressed variants, built once per catalog version.
+    `bodies` maps a content coding ('identity', 'gzip', 'br') to bytes.
+    """
+
+    def __init__(self, version, kind, body, mimetype):
+        self.version = version
+        self.kind = kind
+        self.mimetype = mimetype
+        self.bodies = {'identity': body, 'gzip': gzip.compress(body, compresslevel=6, mtime=0)}
+        if brotli is not None:
+            self.bodies['br'] = brotli.compress(body, quality=5)
+
+    def etag_for(self, encoding):
+        # Strong ETags must differ between content codings of the same resource.
+        suffix = '' if encoding == 'identity' else f"-{encoding}"
+        return f"{self.kind}-{self.version}{suffix}"
+
+    @property
+    def etags(self):
+        return [self.etag_for(encoding) for encoding in self.bodies]
+
+    def choose_encoding(self, accept_encodings):
+        """Picks the smallest acceptable coding given werkzeug's parsed Accept-Encoding header."""
+        for encoding in ('br', 'gzip'):
+            if encoding in self.bodies and accept_encodings[encoding]:
+                return encoding
+        return 'identity'
+
+# kind -> SerializedPayload for the latest catalog version seen.
+_payloads = {}
+# template id -> its compact JSON encoding, for the latest catalog version serialized.
+# Template ids embed a content hash, so an id's encoding never changes.
+_fragments = {}
+_lock = threading.Lock()
+
+def _template_fragments(catalog):
+    global _fragments
+    previous = _fragments
+    fragments = {}
+    for template in catalog.templates:
+        encoded = previous.get(template.id)
+        if encoded is None:
+            encoded = json.dumps(template, separators=(',', ':'), default=to_jsonable).encode('utf-8')
+        fragments[template.id] = encoded
+    _fragments = fragments
+    return [fragments[t.id] for t in catalog.templates]
+
+def _serialize(catalog, kind):
+    fragments = _template_fragments(catalog)
+    if kind == 'ndjson':
+        body = b''.join(f + b'\n' for f in fragments)
+        return SerializedPayload(catalog.version, kind, body, NDJSON_MIMETYPE)
+    body = b'[' + b','.join(fragments) + b']'
+    return SerializedPayload(catalog.version, kind, body, JSON_MIMETYPE)
+
+def get_templates_payload(catalog, kind='json'):
+    """Returns the serialized catalog ('json' or 'ndjson'), serializing it only once per catalog version."""
+    payload = _payloads.get(kind)
+    if payload is not None and payload.version == catalog.version:
+        instrumentation.cache_result('templates_payload', True)
+        return payload
+    with _lock:
+        payload = _payloads.get(kind)
+        hit = payload is not None and payload.version == catalog.version
+        if not hit:
+            payload = _serialize(catalog, kind)
+            _payloads[kind] = payload
+    instrumentation.cache_result('templates_payload', hit)
+    return payload
@@ -0,0 +1,49 @@
+import logging
+import os
+import threading
+from flask import current_app
+from . import config_manager
+
+try:
+    import fcntl
+except ImportError:  # Non-POSIX platforms run a single process, which is always the leader.
+    fcntl = None
+
+# Exactly one process per data dir owns the background refresh job. Leadership is an
+# exclusive, non-blocking flock on a file in the data dir: the OS releases it when the
+# owning process exits, so another worker can take over.
+LEADER_LOCK_FILENAME = 'scheduler.lock'
+
+_lock_file = None
+_lock = threading.Lock()
+
+def _get_logger():
+    return current_app.logger if current_app else logging.getLogger(__name__)
+
+def is_leader():
+    return _lock_file is not None
+
+def try_acquire_leadership():
+    """Tries to become the leader without blocking. Returns True if this process is (now) the leader."""
+    global _lock_file
+    if _lock_file is not None:
+        return True
+    with _lock:
+        if _lock_file is not None:
+            return True
+        config_manager._ensure_data_dir_exists()
+        path = os.path.join(config_manager.APP_DATA_DIR, LEADER_LOCK_FILENAME)
+        lock_file = open(path, 'a+')
+        if fcntl is not None:
+            try:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                lock_file.close()
+                return False
+        lock_file.seek(0)
+        lock_file.truncate()
+        lock_file.write(str(os.getpid()))
+        lock_file.flush()
+        _lock_file = lock_file
+        _get_logger().info(f"Process {os.getpid()} is now the scheduler leader ({path}).")
+        return True
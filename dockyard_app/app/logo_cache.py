@@ -0,0 +1,302 @@
+import hashlib
+import io
+import logging
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from flask import current_app
+from . import config_manager
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow is optional; without it logos are stored as served upstream.
+    Image = None
+
+# Template logos are served from /logo/<key> out of an on-disk cache in the app data dir,
+# so the index page doesn't open hundreds of cross-origin requests to slow logo hosts.
+# Logos of the index cards are prefetched after each catalog refresh and normalized to
+# small PNG thumbnails (when Pillow is installed). The cache is bounded in size and
+# evicts the least recently served logos first; file mtimes record the last use.
+LOGO_CACHE_DIRNAME = 'logo_cache'
+DEFAULT_MAX_CACHE_BYTES = 100 * 1024 * 1024
+DEFAULT_THUMBNAIL_SIZE = 160  # twice the displayed size, for high-DPI screens
+DEFAULT_PREFETCH_WORKERS = 8
+DEFAULT_MAX_AGE_SECONDS = 7 * 24 * 3600
+FETCH_TIMEOUT = 10
+MAX_UPSTREAM_BYTES = 2 * 1024 * 1024
+# Cached logos older than this are fetched again by the next prefetch.
+REFETCH_AFTER_SECONDS = 7 * 24 * 3600
+# A logo that failed to download isn't retried before this.
+FAILURE_RETRY_SECONDS = 3600
+# Serving a logo refreshes its mtime (its LRU position) at most this often.
+TOUCH_INTERVAL_SECONDS = 3600
+SVG_MIMETYPE = 'image/svg+xml'
+_KEY_RE = re.compile(r'[0-9a-f]{32}')
+
+def _get_logger():
+    return current_app.logger if current_app else logging.getLogger(__name__)
+
+def logo_key(url):
+    """The cache key (and /logo/<key> path segment) of a logo URL."""
+    return hashlib.sha256(url.encode('utf-8')).hexdigest()[:32]
+
+def is_valid_key(key):
+    """True if `key` has the shape of a logo_key() result (32 lowercase hex characters)."""
+    return bool(_KEY_RE.fullmatch(key or ''))
+
+class LogoError(ValueError):
+    """An upstream logo couldn't be used (not an image, too large, unreadable)."""
+
+def normalize_logo(data, content_type, size=DEFAULT_THUMBNAIL_SIZE):
+    """
+    Returns (bytes, mimetype) for a downloaded logo. Raster images are shrunk to fit
+    size x size and re-encoded as PNG when Pillow is available; SVGs are kept as they are.
+    """
+    content_type = (content_type or '').split(';', 1)[0].strip().lower()
+    if content_type == SVG_MIMETYPE or data.lstrip()[:4] == b'<svg':
+        return data, SVG_MIMETYPE
+    if Image is None:
+        if not content_type.startswith('image/'):
+            raise LogoError(f"Not an image ({content_type or 'no content type'}).")
+        return data, content_type
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            image.seek(0)  # first frame of animations
+            if image.mode not in ('RGB', 'RGBA', 'L', 'LA'):
+                image = image.convert('RGBA')
+            image.thumbnail((size, size))
+            output = io.BytesIO()
+            image.save(output, format='PNG', optimize=True)
+    except Exception as e:  # Pillow raises many exception types for bad input.
+        raise LogoError(f"Unreadable image: {e}")
+    return output.getvalue(), 'image/png'
+
+class LogoCache:
+    """
+    Size-bounded logo cache in `directory`. Each logo is one file named by its key,
+    holding a header line ("<mimetype> <fetched_at>") followed by the image bytes.
+    Downloads (prefetches and misses) run on one pool of `workers` threads.
+    """
+
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_CACHE_BYTES, thumbnail_size=DEFAULT_THUMBNAIL_SIZE,
+                 workers=DEFAULT_PREFETCH_WORKERS):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.thumbnail_size = thumbnail_size
+        self.workers = max(1, workers)
+        self._lock = threading.Lock()
+        self._failures = {}  # url -> time.monotonic() of the last failed download
+        self._in_flight = set()
+        self._queued = set()  # urls submitted by fetch_async that haven't finished
+        self._executor = None
+        self._written_bytes = None  # running estimate of the cache size, None until scanned
+        self._prefetch_lock = threading.Lock()
+        self._pending_urls = None
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        # Keys come from request paths: never let one name anything but a cache file.
+        if not is_valid_key(key):
+            raise ValueError(f"Invalid logo key: {key!r}")
+        return os.path.join(self.directory, key)
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='logo-fetch')
+            return self._executor
+
+    def get(self, key):
+        """Returns (data, mimetype, etag) for a cached logo, or None."""
+        try:
+            path = self._path(key)
+            with open(path, 'rb') as f:
+                mimetype, _ = f.readline().decode('ascii').split()
+                data = f.read()
+            if time.time() - os.stat(path).st_mtime > TOUCH_INTERVAL_SECONDS:
+                os.utime(path)
+        except (OSError, ValueError, UnicodeDecodeError):
+            return None
+        return data, mimetype, hashlib.sha1(data).hexdigest()[:16]
+
+    def fetched_at(self, key):
+        try:
+            with open(self._path(key), 'rb') as f:
+                return float(f.readline().decode('ascii').split()[1])
+        except (OSError, ValueError, IndexError, UnicodeDecodeError):
+            return None
+
+    def is_fresh(self, url):
+        fetched_at = self.fetched_at(logo_key(url))
+        return fetched_at is not None and time.time() - fetched_at < REFETCH_AFTER_SECONDS
+
+    def recently_failed(self, url):
+        failed_at = self._failures.get(url)
+        return failed_at is not None and time.monotonic() - failed_at < FAILURE_RETRY_SECONDS
+
+    def fetch(self, url):
+        """Downloads, normalizes and stores one logo. Returns True on success."""
+        if not url.startswith(('http://', 'https://')):
+            return False
+        with self._lock:
+            if url in self._in_flight:
+                return False
+            self._in_flight.add(url)
+        try:
+            with requests.get(url, timeout=FETCH_TIMEOUT, stream=True) as response:
+                response.raise_for_status()
+                body = bytearray()
+                for chunk in response.iter_content(chunk_size=64 * 1024):
+                    body += chunk
+                    if len(body) > MAX_UPSTREAM_BYTES:
+                        raise LogoError(f"Larger than {MAX_UPSTREAM_BYTES} bytes.")
+                data, mimetype = normalize_logo(bytes(body), response.headers.get('Content-Type'), self.thumbnail_size)
+            self._store(logo_key(url), data, mimetype)
+            self._failures.pop(url, None)
+            return True
+        except (requests.exceptions.RequestException, LogoError, OSError) as e:
+            _get_logger().warning(f"Could not cache logo {url}: {e}")
+            self._failures[url] = time.monotonic()
+            return False
+        finally:
+            with self._lock:
+                self._in_flight.discard(url)
+
+    def fetch_async(self, url):
+        """
+        Queues a logo download on the fetch pool, unless it is already queued, being
+        fetched or recently failed. Returns the future, or None if nothing was queued.
+        """
+        with self._lock:
+            if url in self._queued or url in self._in_flight or self.recently_failed(url):
+                return None
+            self._queued.add(url)
+
+        def run():
+            try:
+                return self.fetch(url)
+            finally:
+                with self._lock:
+                    self._queued.discard(url)
+
+        return self._get_executor().submit(run)
+
+    def _store(self, key, data, mimetype):
+        path = self._path(key)
+        tmp_path = f"{path}.tmp.{os.getpid()}.{threading.get_ident()}"
+        with open(tmp_path, 'wb') as f:
+            f.write(f"{mimetype} {time.time():.0f}\n".encode('ascii'))
+            f.write(data)
+        os.replace(tmp_path, path)
+        with self._lock:
+            if self._written_bytes is not None:
+                self._written_bytes += len(data)
+            over_limit = self._written_bytes is None or self._written_bytes > self.max_bytes
+        if over_limit:
+            self.evict()
+
+    def evict(self):
+        """Deletes the least recently used logos until the cache is below 90% of max_bytes."""
+        files = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.is_file() and '.tmp.' not in entry.name:
+                    stat = entry.stat()
+                    files.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in files)
+        evicted = 0
+        if total > self.max_bytes:
+            target = self.max_bytes * 0.9
+            for _, size, path in sorted(files):
+                if total <= target:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+                evicted += 1
+            _get_logger().info(f"Evicted {evicted} logos from the logo cache ({total} bytes left).")
+        with self._lock:
+            self._written_bytes = total
+        return evicted
+
+    def prefetch(self, urls):
+        """
+        Downloads the logos in `urls` that aren't cached (or are stale) on the fetch pool.
+        A call made while a prefetch runs is queued and runs right after it, with the
+        latest urls. Returns the number of logos fetched by this call, or None if queued.
+        """
+        with self._lock:
+            self._pending_urls = list(urls)
+        if not self._prefetch_lock.acquire(blocking=False):
+            return None
+        fetched = 0
+        try:
+            while True:
+                with self._lock:
+                    urls, self._pending_urls = self._pending_urls, None
+                if urls is None:
+                    return fetched
+                wanted = [u for u in dict.fromkeys(urls) if not self.is_fresh(u) and not self.recently_failed(u)]
+                if not wanted:
+                    continue
+                start = time.monotonic()
+                results = list(self._get_executor().map(self.fetch, wanted))
+                fetched += sum(results)
+                _get_logger().info(
+                    f"Prefetched {sum(results)} of {len(wanted)} logos in {time.monotonic() - start:.1f}s.")
+        finally:
+            self._prefetch_lock.release()
+
+_logo_cache = None
+_logo_cache_lock = threading.Lock()
+# (catalog version, {key: url}) for the catalog last looked up.
+_urls_by_key = (None, {})
+
+def get_logo_cache(flask_app=None):
+    global _logo_cache
+    if _logo_cache is None:
+        with _logo_cache_lock:
+            if _logo_cache is None:
+                config = (flask_app or current_app).config
+                config_manager._ensure_data_dir_exists()
+                _logo_cache = LogoCache(
+                    os.path.join(config_manager.APP_DATA_DIR, LOGO_CACHE_DIRNAME),
+                    max_bytes=int(config.get('LOGO_CACHE_MAX_MB', DEFAULT_MAX_CACHE_BYTES / 2**20) * 2**20),
+                    thumbnail_size=config.get('LOGO_THUMBNAIL_SIZE', DEFAULT_THUMBNAIL_SIZE),
+                    workers=config.get('LOGO_PREFETCH_WORKERS', DEFAULT_PREFETCH_WORKERS),
+                )
+    return _logo_cache
+
+def url_for_key(catalog, key):
+    """The logo URL of a catalog template with the given key, or None. Only catalog logos are proxied."""
+    global _urls_by_key
+    version, urls = _urls_by_key
+    if version != catalog.version:
+        urls = {}
+        for template in catalog.templates:
+            if template.logo and template.logo not in urls:
+                urls[template.logo] = None
+        urls = {logo_key(url): url for url in urls}
+        _urls_by_key = (catalog.version, urls)
+    return urls.get(key)
+
+def card_logo_urls(catalog):
+    """Logo URLs shown on the index page, in card order."""
+    return list(dict.fromkeys(group['logo'] for group in catalog.grouped_templates.values() if group['logo']))
+
+def prefetch_catalog(flask_app, catalog):
+    """Prefetches the index card logos of a catalog on a background thread."""
+    urls = card_logo_urls(catalog)
+    if not urls:
+        return
+
+    def run():
+        with flask_app.app_context():
+            get_logo_cache(flask_app).prefetch(urls)
+
+    threading.Thread(target=run, name='logo-prefetch', daemon=True).start()
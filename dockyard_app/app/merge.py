@@ -0,0 +1,99 @@
+import re
+import unicodedata
+from .image_prepull import normalize_image, repository_of
+
+# Cross-source merge stage of a catalog build. Sources often list the same app under
+# slightly different titles ("NextCloud", "Nextcloud (LinuxServer)") or the same image
+# under another name. Each template is bucketed under canonical keys (normalized title,
+# image repository, stack repository) and templates sharing a bucket are joined with
+# union-find, so clustering is linear in the number of templates instead of pairwise.
+# An image or stack repository used by more than this many differently titled templates
+# is treated as generic (a base image such as alpine) and doesn't merge them.
+MAX_TITLES_PER_SOURCE_KEY = 4
+
+KIND_CONTAINER = 'container'
+KIND_STACK = 'stack'
+
+_BRACKETS_RE = re.compile(r'\([^)]*\)|\[[^\]]*\]')
+_NON_ALNUM_RE = re.compile(r'[^a-z0-9]+')
+
+def canonical_title(title):
+    """'NextCloud (LinuxServer)' -> 'nextcloud'. Accents, case, punctuation and bracketed suffixes are ignored."""
+    if not isinstance(title, str):
+        return ''
+    text = unicodedata.normalize('NFKD', title).encode('ascii', 'ignore').decode('ascii').lower()
+    return _NON_ALNUM_RE.sub('', _BRACKETS_RE.sub(' ', text)) or _NON_ALNUM_RE.sub('', text)
+
+def canonical_image(image):
+    """'docker.io/library/Nginx:1.25' -> 'nginx'. Registry defaults, tags and digests are ignored."""
+    image = normalize_image(image)
+    return repository_of(image).lower() if image else None
+
+def _kind(template):
+    try:
+        template_type = int(template.get('type'))
+    except (TypeError, ValueError):
+        template_type = None
+    return KIND_STACK if template_type in (2, 3) else KIND_CONTAINER
+
+def merge_keys(template):
+    """
+    The canonical keys of a template: (kind, 'title', title) and (kind, 'image', repository)
+    or, for stacks, (kind, 'repository', url, stackfile). Containers and stacks never merge.
+    """
+    kind = _kind(template)
+    keys = []
+    title = canonical_title(template.get('title'))
+    if title:
+        keys.append((kind, 'title', title))
+    if kind == KIND_CONTAINER:
+        image = canonical_image(template.get('image'))
+        if image:
+            keys.append((kind, 'image', image))
+    else:
+        repository = template.get('repository')
+        if isinstance(repository, dict) and isinstance(repository.get('url'), str):
+            url = repository['url'].strip().lower().rstrip('/')
+            if url.endswith('.git'):
+                url = url[:-len('.git')]
+            keys.append((kind, 'repository', url, str(repository.get('stackfile') or '')))
+    return title, keys
+
+def cluster_templates(templates):
+    """
+    Groups near-duplicate templates. Returns a list of clusters, each a list of positions
+    in `templates` in catalog order; clusters are ordered by their first member.
+    """
+    keyed = [merge_keys(t) for t in templates]
+
+    titles_by_key = {}
+    for title, keys in keyed:
+        for key in keys:
+            if key[1] != 'title':
+                titles_by_key.setdefault(key, set()).add(title)
+    generic = {key for key, titles in titles_by_key.items() if len(titles) > MAX_TITLES_PER_SOURCE_KEY}
+
+    parent = list(range(len(templates)))
+
+    def find(position):
+        while parent[position] != position:
+            parent[position] = parent[parent[position]]
+            position = parent[position]
+        return position
+
+    first_with_key = {}
+    for position, (_, keys) in enumerate(keyed):
+        for key in keys:
+            if key in generic:
+                continue
+            other = first_with_key.setdefault(key, position)
+            if other != position:
+                a, b = find(position), find(other)
+                if a != b:
+                    # The smaller position stays the root, so a cluster is led by its first member.
+                    parent[max(a, b)] = min(a, b)
+
+    clusters = {}
+    for position in range(len(templates)):
+        clusters.setdefault(find(position), []).append(position)
+    return list(clusters.values())
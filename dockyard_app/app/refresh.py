@@ -0,0 +1,173 @@
+import logging
+import random
+import threading
+import time
+from concurrent.futures import Future
+from flask import current_app
+
+# Refresh coordination: at most one catalog refresh runs per process, callers that ask
+# for one while it runs get the same future (single flight), and template sources that
+# keep failing are backed off exponentially behind a per-URL circuit breaker, so a dead
+# source costs one timeout per backoff period instead of one per refresh.
+DEFAULT_BACKOFF_BASE_SECONDS = 60
+DEFAULT_BACKOFF_MAX_SECONDS = 3600
+DEFAULT_FAILURE_THRESHOLD = 3
+# Backoff delays are spread by +/- this fraction so sources don't retry in lockstep.
+BACKOFF_JITTER = 0.2
+
+CIRCUIT_CLOSED = 'closed'
+CIRCUIT_OPEN = 'open'
+CIRCUIT_HALF_OPEN = 'half-open'
+
+def _get_logger():
+    return current_app.logger if current_app else logging.getLogger(__name__)
+
+class SourceHealth:
+    """Failure tracking for one source URL."""
+
+    def __init__(self, url):
+        self.url = url
+        self.consecutive_failures = 0
+        self.retry_at = None  # time.monotonic() before which the source isn't fetched
+        self.probing = False
+        self.last_error = None
+        self.last_success_at = None
+        self.last_failure_at = None
+
+    def state(self, threshold):
+        if self.consecutive_failures < threshold:
+            return CIRCUIT_CLOSED
+        if self.probing or (self.retry_at is not None and time.monotonic() >= self.retry_at):
+            return CIRCUIT_HALF_OPEN
+        return CIRCUIT_OPEN
+
+    def to_dict(self, threshold):
+        retry_in = max(0.0, self.retry_at - time.monotonic()) if self.retry_at is not None else None
+        return {
+            'url': self.url,
+            'state': self.state(threshold),
+            'consecutive_failures': self.consecutive_failures,
+            'retry_in_seconds': retry_in if self.consecutive_failures >= threshold else None,
+            'last_error': self.last_error,
+            'last_success_at': self.last_success_at,
+            'last_failure_at': self.last_failure_at,
+        }
+
+class SourceBreakers:
+    """
+    Per-URL circuit breakers. After `failure_threshold` consecutive failures a source's
+    circuit opens and it is skipped (callers use their cached copy) until its backoff
+    expires; then one probe is let through (half-open). Success closes the circuit,
+    failure re-opens it with twice the delay, up to `backoff_max`.
+    """
+
+    def __init__(self, backoff_base=DEFAULT_BACKOFF_BASE_SECONDS, backoff_max=DEFAULT_BACKOFF_MAX_SECONDS,
+                 failure_threshold=DEFAULT_FAILURE_THRESHOLD):
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.failure_threshold = max(1, failure_threshold)
+        self._sources = {}
+        self._lock = threading.Lock()
+
+    def _get(self, url):
+        health = self._sources.get(url)
+        if health is None:
+            health = self._sources[url] = SourceHealth(url)
+        return health
+
+    def allow(self, url):
+        """True if the source may be fetched now. Claims the single probe of a half-open circuit."""
+        with self._lock:
+            health = self._get(url)
+            state = health.state(self.failure_threshold)
+            if state == CIRCUIT_CLOSED:
+                return True
+            if state == CIRCUIT_HALF_OPEN and not health.probing:
+                health.probing = True
+                return True
+            return False
+
+    def record_success(self, url):
+        with self._lock:
+            health = self._get(url)
+            if health.consecutive_failures >= self.failure_threshold:
+                _get_logger().info(f"Template source {url} recovered; closing its circuit.")
+            health.consecutive_failures = 0
+            health.retry_at = None
+            health.probing = False
+            health.last_error = None
+            health.last_success_at = time.time()
+
+    def record_failure(self, url, error):
+        with self._lock:
+            health = self._get(url)
+            health.consecutive_failures += 1
+            health.probing = False
+            health.last_error = str(error)
+            health.last_failure_at = time.time()
+            excess = health.consecutive_failures - self.failure_threshold
+            if excess >= 0:
+                delay = min(self.backoff_max, self.backoff_base * (2 ** excess))
+                delay *= random.uniform(1 - BACKOFF_JITTER, 1 + BACKOFF_JITTER)
+                health.retry_at = time.monotonic() + delay
+                _get_logger().warning(
+                    f"Template source {url} failed {health.consecutive_failures} times in a row; "
+                    f"skipping it for {delay:.0f}s.")
+
+    def status(self):
+        with self._lock:
+            return [health.to_dict(self.failure_threshold) for health in self._sources.values()]
+
+    def forget_except(self, urls):
+        """Drops the state of sources that are no longer configured."""
+        with self._lock:
+            for url in [u for u in self._sources if u not in urls]:
+                del self._sources[url]
+
+class RefreshCoordinator:
+    """
+    Runs `refresh_func` on a background thread, one run at a time. request() returns the
+    Future of the run in progress, or starts a new one; the Future resolves to the
+    function's result (or raises its exception).
+    """
+
+    def __init__(self, refresh_func):
+        self.refresh_func = refresh_func
+        self._lock = threading.Lock()
+        self._current = None
+        self.last_started_at = None
+        self.last_finished_at = None
+        self.last_error = None
+
+    @property
+    def in_progress(self):
+        current = self._current
+        return current is not None and not current.done()
+
+    def request(self, flask_app=None):
+        with self._lock:
+            if self._current is not None and not self._current.done():
+                return self._current
+            future = Future()
+            self._current = future
+        threading.Thread(target=self._run, args=(future, flask_app), name='catalog-refresh', daemon=True).start()
+        return future
+
+    def _run(self, future, flask_app):
+        future.set_running_or_notify_cancel()
+        self.last_started_at = time.time()
+        try:
+            if flask_app is not None:
+                with flask_app.app_context():
+                    result = self.refresh_func()
+            else:
+                result = self.refresh_func()
+        except BaseException as e:
+            self.last_error = str(e)
+            _get_logger().error(f"Catalog refresh failed: {e}")
+            future.set_exception(e)
+        else:
+            self.last_error = None
+            future.set_result(result)
+        finally:
+            self.last_finished_at = time.time()
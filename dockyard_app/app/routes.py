@@ -1,45 +1,145 @@
 from flask import current_app, Blueprint
 from app import app, bcrypt
-from flask import render_template, jsonify, request, flash, redirect, url_for
+from flask import render_template, jsonify, request, flash, redirect, url_for, session, make_response, Response, get_template_attribute
+from markupsafe import Markup
 from . import template_manager
-from . import ai_manager
+from . import compose_converter
 from . import config_manager
+from . import search
+from . import json_payload
+from . import scheduler
+from . import system_metrics
+from . import container_stats
+from . import jobs
+from . import docker_manager
+from . import image_prepull
+from . import storage
+from . import logo_cache
+from . import instrumentation
 from .forms import RegistrationForm, LoginForm
+from .template_record import to_jsonable
 from .models import User
 from flask_login import login_user, current_user, logout_user, login_required
+import hmac
 import json # For pretty printing dicts in logs
-import psutil
+import logging
+import threading
+import time
+
+# Rendered first page of the index grid, keyed by catalog version: (version, Markup, next cursor).
+# Rebuilt only when a refresh produces a new catalog; later pages come from /api/templates?view=groups.
+_template_grid_cache = (None, None, None)
+# group key -> (group, rendered card). Catalogs built from the previous one share unchanged
+# group objects, so only cards of new or changed groups are rendered again.
+_template_card_cache = {}
+# Changes on every process start, so a redeploy with new templates invalidates browser ETags.
+_RENDER_EPOCH = f"{time.time_ns():x}"
+
+def _render_template_grid(catalog):
+    """Returns (first page of index cards as Markup, cursor of the next page or None)."""
+    global _template_grid_cache
+    global _template_card_cache
+    version, grid_html, next_cursor = _template_grid_cache
+    if version != catalog.version:
+        page_size = app.config.get('INDEX_PAGE_SIZE', 48)
+        render_card = get_template_attribute("_template_grid.html", "card")
+        previous_cards = _template_card_cache
+        card_cache = {}
+        rendered = 0
+        for key in catalog.group_keys[:page_size]:
+            group = catalog.grouped_templates[key]
+            cached = previous_cards.get(key)
+            if cached is None or cached[0] is not group:
+                cached = (group, render_card(group))
+                rendered += 1
+            card_cache[key] = cached
+        instrumentation.CACHE_REQUESTS.inc(len(card_cache) - rendered, cache='template_card', result='hit')
+        instrumentation.CACHE_REQUESTS.inc(rendered, cache='template_card', result='miss')
+        grid_html = Markup(render_template("_template_grid.html", cards=[html for _, html in card_cache.values()]))
+        next_cursor = search.encode_cursor(catalog.version, len(card_cache)) if len(card_cache) < len(catalog.group_keys) else None
+        _template_card_cache = card_cache
+        _template_grid_cache = (catalog.version, grid_html, next_cursor)
+        app.logger.info(f"Rendered template grid for catalog version {catalog.version} "
+                        f"({rendered} of {len(card_cache)} first-page cards re-rendered, {len(catalog.group_keys)} cards in total).")
+    return grid_html, next_cursor
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """
+    Prometheus metrics. With METRICS_TOKEN set, scrapers send 'Authorization: Bearer <token>';
+    without it, only logged-in users can read them.
+    """
+    token = app.config.get('METRICS_TOKEN')
+    if token:
+        if not hmac.compare_digest(request.headers.get('Authorization', ''), f"Bearer {token}"):
+            return Response("Unauthorized", status=401, headers={'WWW-Authenticate': 'Bearer'})
+    elif not current_user.is_authenticated:
+        return app.login_manager.unauthorized()
+    return Response(instrumentation.render_metrics(), content_type=instrumentation.CONTENT_TYPE)
+
+@app.template_global()
+def logo_url(url):
+    """Local /logo/<key> URL of a template logo, served from the logo cache."""
+    return url_for('logo', key=logo_cache.logo_key(url)) if url else ''
+
+@app.route('/logo/<key>')
+@login_required
+def logo(key):
+    """
+    Serves a cached logo thumbnail. On a miss, the logo is queued on the cache's fetch
+    pool and the browser is redirected to the upstream URL this once. Only catalog logos
+    are proxied.
+    """
+    if not logo_cache.is_valid_key(key):
+        return "Logo not found", 404
+    cache = logo_cache.get_logo_cache(app)
+    cached = cache.get(key)
+    instrumentation.cache_result('logo', cached is not None)
+    if cached is not None:
+        data, mimetype, etag = cached
+        response = Response(data, mimetype=mimetype)
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = f"private, max-age={app.config.get('LOGO_CACHE_MAX_AGE_SECONDS', logo_cache.DEFAULT_MAX_AGE_SECONDS)}"
+        response.headers['X-Content-Type-Options'] = 'nosniff'
+        # Third-party SVGs are served from this origin: never let them run scripts.
+        response.headers['Content-Security-Policy'] = "default-src 'none'; style-src 'unsafe-inline'; sandbox"
+        return response.make_conditional(request)
+    url = logo_cache.url_for_key(template_manager.get_catalog(), key)
+    if url is None or not url.startswith(('http://', 'https://')):
+        return "Logo not found", 404
+    cache.fetch_async(url)
+    response = redirect(url)
+    response.headers['Cache-Control'] = 'no-store'
+    return response
 
 @app.route('/')
 @login_required
 def index():
     app.logger.info("Index route called.")
-    templates_data = template_manager.get_all_templates()
-    # Group templates by title to handle duplicates
-    grouped_templates = {}
-    if templates_data:
-        for i, t in enumerate(templates_data):
-            template_type = t.get('type')
-            title = t.get('title')
-            logo = t.get('logo')
-            description = t.get('description')
-
-            # Only include templates that have a title, logo, description, and a supported type (1 or 2)
-            if title and logo and description and (template_type in [1, 2, '1', '2']):
-                if title not in grouped_templates:
-                    grouped_templates[title] = {
-                        'title': title,
-                        'logo': logo,
-                        'description': description,
-                        'templates': []
-                    }
-
-                # Use a unique ID for each template instance
-                t['id'] = f"{title.replace(' ', '_').lower()}_{i}"
-                grouped_templates[title]['templates'].append(t)
-
-    app.logger.info(f"Displaying {len(grouped_templates)} grouped templates from cache.")
-    return render_template("index.html", title="DockYard - Available Apps", grouped_templates=grouped_templates)
+    catalog = template_manager.get_catalog()
+    refreshing = not catalog and template_manager.is_refreshing()
+
+    # The page only varies with the catalog and the user, unless there are flashed messages to show.
+    etag = None
+    if not session.get('_flashes') and not refreshing:
+        etag = f"{catalog.version}-{current_user.get_id()}-{_RENDER_EPOCH}"
+        if etag in request.if_none_match:
+            return Response(status=304, headers={'ETag': f'"{etag}"', 'Cache-Control': 'private, no-cache'})
+
+    app.logger.info(f"Displaying {len(catalog.grouped_templates)} grouped templates from cache.")
+    template_grid, grid_cursor = _render_template_grid(catalog)
+    response = make_response(render_template(
+        "index.html",
+        title="DockYard - Available Apps",
+        template_grid=template_grid,
+        grid_cursor=grid_cursor,
+        categories=catalog.categories,
+        refreshing=refreshing,
+    ))
+    if etag:
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'private, no-cache'
+    return response
 
 @app.route('/settings')
 @login_required
@@ -56,29 +156,249 @@ def app_details(template_id):
         app.logger.error(f"Template with id {template_id} not found.")
         return "Template not found", 404
 
-    return render_template("app_details.html", title=template.get('title', 'App Details'), template=template)
+    pinned = any(pin['template_id'] == template_id for pin in storage.get_storage().get_pinned_templates())
+    variants = [t for t in template_manager.get_catalog().variants(template_id) if t is not template]
+    return render_template("app_details.html", title=template.get('title', 'App Details'), template=template,
+                           pinned=pinned, variants=variants)
+
+def _metrics_sampler():
+    return system_metrics.get_sampler(
+        interval=app.config.get('METRICS_SAMPLE_INTERVAL_SECONDS', 2),
+        history_size=app.config.get('METRICS_HISTORY_SIZE', 300),
+    )
 
 @app.route('/dashboard')
 @login_required
 def dashboard():
     app.logger.info("Dashboard route called.")
-    cpu_usage = psutil.cpu_percent(interval=1)
-    ram_usage = psutil.virtual_memory().percent
+    container_stats.note_demand()  # The leader's collector polls while the page is open
+    sampler = _metrics_sampler()
+    sample = sampler.ring.latest()
+    if sample is None:
+        # Only the very first view after startup waits, and only until the first sample lands.
+        sampler.ring.wait_for_sample(0, timeout=1)
+        sample = sampler.ring.latest()
+
+    cpu_usage = round(sample['cpu_percent'], 1) if sample else 0
+    ram_usage = round(sample['memory_percent'], 1) if sample else 0
 
     # Temperature is more complex, so we'll omit it for now.
     # It often requires specific libraries and configuration per-system.
 
-    return render_template("dashboard.html", title="System Dashboard", cpu_usage=cpu_usage, ram_usage=ram_usage)
+    return render_template("dashboard.html", title="System Dashboard", cpu_usage=cpu_usage, ram_usage=ram_usage, sample=sample)
+
+@app.route('/api/metrics')
+@login_required
+def metrics_history_api():
+    ring = _metrics_sampler().ring
+    return jsonify({
+        'interval': _metrics_sampler().interval,
+        'latest': ring.latest(),
+        'history': ring.history(limit=request.args.get('limit', type=int)),
+    }), 200
+
+# Server-sent event streams hold a worker thread each (gthread workers). They are kept
+# short (SSE_MAX_SECONDS; EventSource reconnects on its own), and at most SSE_MAX_STREAMS
+# of them stream at once per process, so the other threads stay free for ordinary
+# requests. A request over the limit gets what is available right now and a longer
+# retry delay: the client falls back to polling until a slot frees up.
+_stream_slots = None
+_stream_slots_lock = threading.Lock()
+
+def _get_stream_slots():
+    global _stream_slots
+    if _stream_slots is None:
+        with _stream_slots_lock:
+            if _stream_slots is None:
+                _stream_slots = threading.BoundedSemaphore(max(1, app.config.get('SSE_MAX_STREAMS', 4)))
+    return _stream_slots
+
+def _stream_wait(deadline, keepalive=15):
+    """How long a stream may block before its next keep-alive or its end."""
+    return max(0.0, min(keepalive, deadline - time.monotonic()))
+
+def _event_stream(generate):
+    """
+    Wraps generate(deadline, retry_ms) in a text/event-stream response. The generator runs
+    at least one pass and ends at the deadline; it must start with a retry line.
+    """
+    slots = _get_stream_slots()
+    streaming = slots.acquire(blocking=False)
+    if streaming:
+        deadline = time.monotonic() + app.config.get('SSE_MAX_SECONDS', 25)
+        retry_ms = 2000
+    else:
+        deadline = time.monotonic()
+        retry_ms = 5000
+    response = Response(generate(deadline, retry_ms), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+    })
+    if streaming:
+        # Runs when the server closes the response, even if the client left before the first byte.
+        response.call_on_close(slots.release)
+    return response
+
+@app.route('/api/metrics/stream')
+@login_required
+def metrics_stream_api():
+    ring = _metrics_sampler().ring
+
+    def generate(deadline, retry_ms):
+        sequence = 0
+        yield f"retry: {retry_ms}\n\n"
+        while True:
+            current = ring.wait_for_sample(sequence, timeout=_stream_wait(deadline))
+            if current != sequence:
+                sequence = current
+                yield f"data: {json.dumps(ring.latest())}\n\n"
+            elif time.monotonic() < deadline:
+                yield ": keep-alive\n\n"
+            if time.monotonic() >= deadline:
+                return
+
+    return _event_stream(generate)
+
+@app.route('/api/containers/stats')
+@login_required
+def container_stats_api():
+    container_stats.note_demand()
+    try:
+        report = container_stats.read_report(request.args.get('resolution', '1s'), limit=request.args.get('limit', type=int))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(report), 200
 
 @app.route('/templates_json')
 def list_templates_json():
     app.logger.info("Templates JSON route called.")
-    templates_data = template_manager.get_all_templates()
-    if not templates_data:
+    catalog = template_manager.get_catalog()
+    if not catalog:
         app.logger.warning("No template data in cache for JSON endpoint.")
         return jsonify({"error": "No templates found in cache."}), 404
-    app.logger.info(f"Returning {len(templates_data)} templates from cache via JSON.")
-    return jsonify(templates_data)
+
+    # NDJSON (one template per line) lets clients process templates as they arrive.
+    wants_ndjson = request.args.get('format') == 'ndjson' or \
+        request.accept_mimetypes.best_match([json_payload.JSON_MIMETYPE, json_payload.NDJSON_MIMETYPE]) == json_payload.NDJSON_MIMETYPE
+    payload = json_payload.get_templates_payload(catalog, 'ndjson' if wants_ndjson else 'json')
+    encoding = payload.choose_encoding(request.accept_encodings)
+    headers = {
+        'ETag': f'"{payload.etag_for(encoding)}"',
+        'Vary': 'Accept, Accept-Encoding',
+        'Cache-Control': 'no-cache',
+    }
+
+    if any(etag in request.if_none_match for etag in payload.etags):
+        return Response(status=304, headers=headers)
+
+    if encoding != 'identity':
+        headers['Content-Encoding'] = encoding
+    app.logger.info(f"Returning {len(catalog)} templates from cache via JSON ({payload.kind}, {encoding}).")
+    return Response(payload.bodies[encoding], mimetype=payload.mimetype, headers=headers)
+
+@app.route('/api/templates/changes')
+def template_changes_api():
+    """
+    Templates added, removed and changed since catalog version `since`, so clients holding
+    a copy of /templates_json can update it instead of downloading everything again.
+    Answers 410 when `since` is too old (or unknown): the client should reload the catalog.
+    """
+    since = request.args.get('since', '')
+    catalog = template_manager.get_catalog()
+    diff = template_manager.get_changes_since(since) if since else None
+    if diff is None:
+        return jsonify({
+            "error": f"No change history from version '{since}'. Reload the full catalog.",
+            "version": catalog.version,
+            "full_url": url_for('list_templates_json'),
+        }), 410
+    return jsonify({
+        "since": since,
+        "version": catalog.version,
+        "added": [catalog.get(template_id) for template_id in diff.added],
+        "removed": list(diff.removed),
+        "changed": [{"old_id": old_id, "template": catalog.get(new_id)} for old_id, new_id in diff.changed],
+    }), 200
+
+@app.route('/api/templates')
+@login_required
+def search_templates_api():
+    catalog = template_manager.get_catalog()
+    cursor = request.args.get('cursor')
+    limit = request.args.get('limit', search.DEFAULT_PAGE_SIZE, type=int)
+    try:
+        if request.args.get('view') == 'groups':
+            # The index grid: one result per card, in page order (filters don't apply).
+            page = search.browse_groups(catalog, cursor=cursor, limit=limit)
+        else:
+            page = template_manager.search_templates(
+                catalog,
+                text=request.args.get('q', ''),
+                template_type=request.args.get('type'),
+                category=request.args.get('category'),
+                cursor=cursor,
+                limit=limit,
+            )
+    except search.InvalidCursor as e:
+        return jsonify({"error": str(e), "catalog_version": catalog.version}), 400
+    for result in page['results']:
+        if result.get('logo'):
+            result['logo_url'] = logo_url(result['logo'])
+    page['refreshing'] = not catalog and template_manager.is_refreshing()
+    return jsonify(page), 200
+
+@app.route('/api/templates/status')
+@login_required  # Lists every source URL (credentials included) and its last error.
+def templates_status_api():
+    app.logger.info("API GET /api/templates/status called.")
+    return jsonify(template_manager.get_cache_status()), 200
+
+@app.route('/api/templates/instant')
+@login_required
+def instant_templates_api():
+    """Templates whose image is already on the Docker host, so installing them needs no pull."""
+    catalog = template_manager.get_catalog()
+    client = docker_manager.get_docker_client()
+    if client is None:
+        return jsonify({"available": False, "error": docker_manager.get_docker_error(), "template_ids": []}), 200
+    local = image_prepull.get_prepuller(app).local_images.get(client)
+    return jsonify({
+        "available": True,
+        "catalog_version": catalog.version,
+        "template_ids": image_prepull.instant_template_ids(catalog, local),
+    }), 200
+
+@app.route('/api/templates/<template_id>/pin', methods=['POST', 'DELETE'])
+@login_required
+def pin_template_api(template_id):
+    store = storage.get_storage()
+    if request.method == 'DELETE':
+        if not store.unpin_template(template_id):
+            return jsonify({"success": False, "message": f"Template '{template_id}' is not pinned."}), 404
+        return jsonify({"success": True, "pinned": False}), 200
+
+    template = template_manager.get_template_by_id(template_id)
+    if not template:
+        return jsonify({"success": False, "message": f"Template '{template_id}' not found."}), 404
+    if not template.get('image'):
+        return jsonify({"success": False, "message": "Only templates with an image can be pinned."}), 400
+    store.pin_template(template_id, template['image'])
+    # Start pulling now rather than at the next scheduled run. If another worker pulls the
+    # same image at the same time, the daemon joins the two pulls.
+    image_prepull.trigger(app)
+    return jsonify({"success": True, "pinned": True}), 200
+
+@app.route('/api/prepull')
+@login_required
+def prepull_status_api():
+    prepuller = image_prepull.get_prepuller(app)
+    return jsonify({
+        "pins": storage.get_storage().get_pinned_templates(),
+        "images": prepuller.status(),
+        "running": prepuller.running,
+        "last_run_at": prepuller.last_run_at,
+        "error": prepuller.last_error,
+    }), 200
 
 @app.route('/install_app', methods=['POST'])
 @login_required
@@ -98,17 +418,81 @@ def install_app_route():
         app.logger.error(f"Generation Error: Template with ID '{template_id_to_install}' not found in cache.")
         return jsonify({"success": False, "message": f"Template '{template_id_to_install}' not found."}), 404
 
-    app.logger.info(f"Found template for ID '{template_id_to_install}'. Template details: {json.dumps(target_template, indent=2)}")
+    app.logger.info(f"Found template for ID '{template_id_to_install}'.")
+    if app.logger.isEnabledFor(logging.DEBUG):
+        app.logger.debug(f"Template details: {json.dumps(target_template, indent=2, default=to_jsonable)}")
 
-    # Generate compose file using AI
-    compose_file_content, error_message = ai_manager.generate_compose_file(target_template)
+    # Generation (native converter first, the AI as fallback or on request) and the optional
+    # deploy run in the install job pool; the client follows progress on events_url.
+    deploy = bool(data.get('deploy'))
+    if deploy:
+        try:
+            compose_converter.container_run_options(target_template)
+        except compose_converter.ConversionError as e:
+            return jsonify({"success": False, "message": f"Can't deploy '{target_template.get('title')}': {e}"}), 400
+    try:
+        job = jobs.get_job_manager(app).submit(target_template, deploy=deploy, use_ai=bool(data.get('use_ai')))
+    except jobs.QueueFull as e:
+        return jsonify({"success": False, "message": str(e)}), 429
+
+    app.logger.info(f"Queued install job {job.id} for '{target_template.get('title')}' (deploy={deploy}).")
+    return jsonify({
+        "success": True,
+        "job_id": job.id,
+        "status_url": url_for('job_status_api', job_id=job.id),
+        "events_url": url_for('job_events_api', job_id=job.id),
+    }), 202
+
+@app.route('/api/jobs', methods=['GET'])
+@login_required
+def jobs_api():
+    manager = jobs.get_job_manager(app)
+    return jsonify({"jobs": [job.to_dict(include_events=False) for job in manager.list()]}), 200
 
-    if error_message:
-        app.logger.error(f"AI Generation failed for '{target_template.get('title')}': {error_message}")
-        return jsonify({"success": False, "message": error_message})
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+@login_required
+def job_status_api(job_id):
+    job = jobs.get_job_manager(app).get(job_id)
+    if job is None:
+        return jsonify({"error": f"Job '{job_id}' not found."}), 404
+    return jsonify(job.to_dict()), 200
+
+@app.route('/api/jobs/<job_id>/events')
+@login_required
+def job_events_api(job_id):
+    manager = jobs.get_job_manager(app)
+    job = manager.get(job_id)
+    if job is None:
+        return jsonify({"error": f"Job '{job_id}' not found."}), 404
+    # EventSource resends the last seen id on reconnect.
+    after = request.headers.get('Last-Event-ID', type=int) or request.args.get('after', 0, type=int)
 
-    app.logger.info(f"Successfully generated compose file for '{target_template.get('title')}'.")
-    return jsonify({"success": True, "compose_file": compose_file_content})
+    def generate(deadline, retry_ms):
+        nonlocal job, after
+        yield f"retry: {retry_ms}\n\n"
+        first = True
+        while True:
+            if manager.is_local(job_id):
+                events = job.wait_for_events(after, timeout=_stream_wait(deadline))
+            else:
+                # Owned by another worker process: follow its persisted record.
+                if not first:
+                    time.sleep(_stream_wait(deadline, keepalive=1))
+                job = manager.get(job_id) or job
+                events = job.events_after(after)
+            first = False
+            for event in events:
+                after = event['seq']
+                yield f"id: {event['seq']}\ndata: {json.dumps(event)}\n\n"
+            if job.finished and after >= job.last_seq:
+                yield f"event: done\ndata: {json.dumps(job.to_dict(include_events=False))}\n\n"
+                return
+            if time.monotonic() >= deadline:
+                return
+            if not events:
+                yield ": keep-alive\n\n"
+
+    return _event_stream(generate)
 
 @app.route('/api/settings/templates/sources', methods=['GET'])
 def get_template_sources_api():
@@ -133,26 +517,28 @@ def save_template_sources_api():
     cleaned_urls_list = [url.strip() for url in urls_list if url.strip()]
 
     if config_manager.save_user_template_sources(cleaned_urls_list):
-        app.logger.info("User template sources saved successfully. Triggering cache update.")
-        try:
-            template_manager.update_cached_templates()
-            app.logger.info("Template cache update triggered successfully after saving sources.")
-        except Exception as e:
-            app.logger.error(f"Error triggering template cache update: {e}")
-            return jsonify({"success": True, "message": "Template sources saved, but cache update failed. Please check logs."}), 500
-
-        return jsonify({"success": True, "message": "Template sources saved and cache updated."}), 200
+        app.logger.info("User template sources saved successfully. Requesting a cache update.")
+        # Only the leader fetches; this worker picks the new catalog up from storage.
+        template_manager.schedule_refresh(app)
+        return jsonify({"success": True, "message": "Template sources saved. The template list is being updated in the background."}), 202
     else:
         app.logger.error("API POST /sources: Failed to save template sources using config_manager.")
         return jsonify({"success": False, "message": "Failed to save template sources."}), 500
 
+@app.before_request
+def sync_shared_catalog():
+    # Cheap, throttled checks: pick up a catalog published by the scheduler leader,
+    # and take over the scheduler if the leader process has exited.
+    template_manager.sync_catalog_from_storage(app.config.get('CATALOG_SYNC_INTERVAL_SECONDS', 5))
+    scheduler.check_leadership(app)
+
 @app.before_request
 def check_for_users():
     # Allow access to static files and the registration page without a user check
-    if request.endpoint and (request.endpoint.startswith('static') or request.endpoint in ['register', 'login']):
+    if request.endpoint and (request.endpoint.startswith('static') or request.endpoint in ['register', 'login', 'metrics_endpoint']):
         return
 
-    if not User.get_all_users():
+    if not User.has_users():
         if request.endpoint != 'register':
             return redirect(url_for('register'))
 
@@ -161,14 +547,16 @@ def register():
     if current_user.is_authenticated:
         return redirect(url_for('index'))
     # If users already exist, redirect to login
-    if User.get_all_users() and request.method == 'GET':
+    if User.has_users() and request.method == 'GET':
         return redirect(url_for('login'))
     form = RegistrationForm()
     if form.validate_on_submit():
         hashed_password = bcrypt.generate_password_hash(form.password.data).decode('utf-8')
-        User.save_user(username=form.username.data, password_hash=hashed_password)
-        flash('Your account has been created! You are now able to log in', 'success')
-        return redirect(url_for('login'))
+        if User.save_user(username=form.username.data, password_hash=hashed_password) is not None:
+            flash('Your account has been created! You are now able to log in', 'success')
+            return redirect(url_for('login'))
+        # Registered by a concurrent request since the form was validated.
+        form.username.errors.append('That username is taken. Please choose a different one.')
     return render_template('register.html', title='Register', form=form)
 
 @app.route("/login", methods=['GET', 'POST'])
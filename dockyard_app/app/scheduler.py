@@ -0,0 +1,97 @@
+import atexit
+import threading
+import time
+from datetime import datetime
+from . import leader
+from . import template_manager
+from . import image_prepull
+from . import container_stats
+
+_scheduler = None
+_lock = threading.Lock()
+_last_leadership_check = 0.0
+
+def _update_templates_job(flask_app):
+    # Scheduler threads have no app context of their own. Joins a refresh already
+    # started by a request (e.g. after sources were saved) instead of running a second one.
+    with flask_app.app_context():
+        template_manager.update_cached_templates()
+
+def _refresh_request_job(flask_app):
+    # Picks up refreshes requested by followers (e.g. after the template sources were saved).
+    with flask_app.app_context():
+        template_manager.handle_refresh_request(flask_app)
+
+def _start_scheduler(flask_app):
+    global _scheduler
+    # Imported lazily: only the leader process runs a scheduler.
+    from apscheduler.schedulers.background import BackgroundScheduler
+    scheduler = BackgroundScheduler(daemon=True)
+    job_hours = flask_app.config.get('TEMPLATE_UPDATE_INTERVAL_HOURS', 4)
+    scheduler.add_job(
+        func=_update_templates_job,
+        args=[flask_app],
+        trigger='interval',
+        hours=job_hours,
+        # Spread refreshes of many instances so they don't hit the sources at the same moment.
+        jitter=flask_app.config.get('TEMPLATE_UPDATE_JITTER_SECONDS', 300) or None,
+        next_run_time=datetime.now(),  # Initial refresh, without blocking startup
+        id='update_templates_job',
+        replace_existing=True
+    )
+    scheduler.add_job(
+        func=_refresh_request_job,
+        args=[flask_app],
+        trigger='interval',
+        seconds=flask_app.config.get('CATALOG_SYNC_INTERVAL_SECONDS', 5),
+        id='refresh_request_job',
+        replace_existing=True
+    )
+    prepull_seconds = flask_app.config.get('PREPULL_INTERVAL_SECONDS', 600)
+    if prepull_seconds:
+        scheduler.add_job(
+            func=image_prepull.run_prepull,
+            args=[flask_app],
+            trigger='interval',
+            seconds=prepull_seconds,
+            id='prepull_images_job',
+            replace_existing=True
+        )
+    try:
+        scheduler.start()
+        flask_app.logger.info(f"APScheduler started. Template update job scheduled every {job_hours} hours.")
+    except Exception as e:
+        flask_app.logger.error(f"APScheduler could not be started (maybe already running?): {e}")
+        return
+    _scheduler = scheduler
+    atexit.register(lambda: scheduler.shutdown() if scheduler.running else None)
+
+def start_if_leader(flask_app):
+    """
+    Starts the refresh scheduler if this process wins (or already holds) leadership.
+    Followers serve whatever catalog the leader last published to storage.
+    Returns True if this process runs the scheduler.
+    """
+    if not flask_app.config.get('SCHEDULER_ENABLED', True):
+        return False
+    with _lock:
+        if _scheduler is not None:
+            return True
+        if not leader.try_acquire_leadership():
+            return False
+        _start_scheduler(flask_app)
+        container_stats.start_collector(flask_app)
+        return _scheduler is not None
+
+def check_leadership(flask_app):
+    """Lets a follower take over the scheduler if the leader went away. Throttled; cheap to call per request."""
+    global _last_leadership_check
+    if _scheduler is not None:
+        return
+    interval = flask_app.config.get('LEADER_CHECK_INTERVAL_SECONDS', 30)
+    now = time.monotonic()
+    if now - _last_leadership_check < interval:
+        return
+    _last_leadership_check = now
+    if start_if_leader(flask_app):
+        flask_app.logger.info("Took over the template refresh scheduler.")
@@ -0,0 +1,172 @@
+import base64
+import binascii
+import bisect
+import re
+
+_TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+DEFAULT_PAGE_SIZE = 24
+MAX_PAGE_SIZE = 100
+
+# Fields included in each search result; the full template is available via /app/<id>.
+RESULT_FIELDS = ('id', 'title', 'description', 'logo', 'type', 'categories', 'image', 'note')
+
+class InvalidCursor(ValueError):
+    pass
+
+def tokenize(text):
+    return _TOKEN_RE.findall(str(text).lower()) if text else []
+
+def _document_text(template):
+    parts = [template.get('title'), template.get('description'), template.get('image')]
+    categories = template.get('categories')
+    if isinstance(categories, (list, tuple)):
+        parts.extend(c for c in categories if isinstance(c, str))
+    return ' '.join(str(p) for p in parts if p)
+
+def encode_cursor(version, offset):
+    raw = f"{version}:{offset}".encode('ascii')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor, version):
+    """Returns the offset stored in a cursor; raises InvalidCursor if it is malformed or from another catalog version."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        cursor_version, offset = base64.urlsafe_b64decode(padded).decode('ascii').split(':')
+        offset = int(offset)
+    except (ValueError, binascii.Error, UnicodeDecodeError):
+        raise InvalidCursor("Malformed cursor.")
+    if cursor_version != version or offset < 0:
+        raise InvalidCursor("Cursor belongs to a different catalog version; restart the search.")
+    return offset
+
+class SearchIndex:
+    """
+    In-memory inverted index over template title, description, categories and image.
+    Documents are catalog positions; every query token is matched as a prefix, all
+    tokens must match, and templates whose title matches rank first. Token sets of
+    templates already in the `previous` index (same id) are reused, so only new and
+    changed templates are tokenized.
+    """
+
+    def __init__(self, templates, previous=None):
+        self._templates = templates
+        previous_tokens = previous._document_tokens if previous is not None else {}
+        document_tokens = {}
+        postings = {}
+        title_postings = {}
+        for position, template in enumerate(templates):
+            template_id = template.get('id')
+            tokens = previous_tokens.get(template_id)
+            if tokens is None:
+                tokens = (frozenset(tokenize(_document_text(template))), frozenset(tokenize(template.get('title'))))
+            if template_id is not None:
+                document_tokens[template_id] = tokens
+            for token in tokens[0]:
+                postings.setdefault(token, []).append(position)
+            for token in tokens[1]:
+                title_postings.setdefault(token, []).append(position)
+        self._document_tokens = document_tokens
+        self._postings = {token: frozenset(docs) for token, docs in postings.items()}
+        self._title_postings = {token: frozenset(docs) for token, docs in title_postings.items()}
+        self._vocabulary = sorted(self._postings)
+        self._title_vocabulary = sorted(self._title_postings)
+
+    @staticmethod
+    def _prefix_matches(vocabulary, postings, prefix):
+        start = bisect.bisect_left(vocabulary, prefix)
+        matched = set()
+        for token in vocabulary[start:]:
+            if not token.startswith(prefix):
+                break
+            matched |= postings[token]
+        return matched
+
+    def _match_all(self, vocabulary, postings, tokens):
+        result = None
+        for token in tokens:
+            docs = self._prefix_matches(vocabulary, postings, token)
+            result = docs if result is None else result & docs
+            if not result:
+                return set()
+        return result
+
+    def query(self, text, candidates=None):
+        """
+        Returns matching catalog positions in rank order.
+        `candidates` optionally restricts results to a set of positions (used for filters).
+        """
+        tokens = tokenize(text)
+        if not tokens:
+            positions = range(len(self._templates)) if candidates is None else candidates
+            return sorted(positions)
+
+        matches = self._match_all(self._vocabulary, self._postings, tokens)
+        if candidates is not None:
+            matches &= candidates
+        if not matches:
+            return []
+        title_matches = self._match_all(self._title_vocabulary, self._title_postings, tokens) & matches
+        return sorted(title_matches) + sorted(matches - title_matches)
+
+def _result(template):
+    return {field: template.get(field) for field in RESULT_FIELDS if template.get(field) is not None}
+
+def search_catalog(catalog, text='', template_type=None, category=None, cursor=None, limit=DEFAULT_PAGE_SIZE, match=None):
+    """
+    Searches a catalog and returns one page of results as a JSON-ready dict.
+    `match` optionally replaces the in-memory text matching with another engine
+    (e.g. SQLite FTS5): a callable taking the query text and returning ranked positions.
+    Raises InvalidCursor for a bad or stale cursor.
+    """
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    offset = decode_cursor(cursor, catalog.version) if cursor else 0
+
+    candidates = None
+    if template_type not in (None, ''):
+        candidates = set(catalog.type_positions(template_type))
+    if category:
+        category_positions = set(catalog.category_positions(category))
+        candidates = category_positions if candidates is None else candidates & category_positions
+
+    if match is not None and tokenize(text):
+        positions = [p for p in match(text) if candidates is None or p in candidates]
+    else:
+        positions = catalog.search_index.query(text, candidates)
+    page = positions[offset:offset + limit]
+    next_offset = offset + len(page)
+    templates = catalog.templates
+    return {
+        'catalog_version': catalog.version,
+        'total': len(positions),
+        'results': [_result(templates[p]) for p in page],
+        'next_cursor': encode_cursor(catalog.version, next_offset) if next_offset < len(positions) else None,
+    }
+
+def browse_groups(catalog, cursor=None, limit=DEFAULT_PAGE_SIZE):
+    """
+    Returns one page of the index cards (catalog.grouped_templates, in order) as a
+    JSON-ready dict shaped like a search_catalog page. Raises InvalidCursor for a bad
+    or stale cursor.
+    """
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    offset = decode_cursor(cursor, catalog.version) if cursor else 0
+    keys = catalog.group_keys
+    page = keys[offset:offset + limit]
+    next_offset = offset + len(page)
+    results = []
+    for key in page:
+        group = catalog.grouped_templates[key]
+        results.append({
+            'id': key,
+            'title': group['title'],
+            'description': group['description'],
+            'logo': group['logo'],
+            'templates': [_result(t) for t in group['templates']],
+        })
+    return {
+        'catalog_version': catalog.version,
+        'total': len(keys),
+        'results': results,
+        'next_cursor': encode_cursor(catalog.version, next_offset) if next_offset < len(keys) else None,
+    }
@@ -0,0 +1,145 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from flask import current_app
+from . import config_manager
+
+# Raw template source bodies and their HTTP validators are kept under the app data dir,
+# so refreshes can revalidate with If-None-Match / If-Modified-Since and the cache
+# survives restarts (including restarts while the network is down).
+SOURCE_CACHE_DIRNAME = 'source_cache'
+
+def _get_logger():
+    return current_app.logger if current_app else logging.getLogger(__name__)
+
+def _cache_dir():
+    """Returns the source cache directory, creating it if needed."""
+    config_manager._ensure_data_dir_exists()
+    path = os.path.join(config_manager.APP_DATA_DIR, SOURCE_CACHE_DIRNAME)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+def _entry_paths(url):
+    key = hashlib.sha256(url.encode('utf-8')).hexdigest()
+    cache_dir = _cache_dir()
+    return os.path.join(cache_dir, f"{key}.json"), os.path.join(cache_dir, f"{key}.body")
+
+def _write_atomic(path, data):
+    tmp_path = f"{path}.tmp.{os.getpid()}.{threading.get_ident()}"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+def load_entry(url):
+    """
+    Returns the stored metadata for a source URL, or None if nothing is cached.
+    The metadata dict holds 'url', 'etag', 'last_modified', 'body_sha256' and 'fetched_at'.
+    """
+    try:
+        meta_path, body_path = _entry_paths(url)
+        if not os.path.exists(meta_path) or not os.path.exists(body_path):
+            return None
+        with open(meta_path, 'r') as f:
+            entry = json.load(f)
+        if entry.get('url') != url:
+            return None
+        return entry
+    except (OSError, json.JSONDecodeError) as e:
+        _get_logger().warning(f"Could not read source cache entry for {url}: {e}")
+        return None
+
+def conditional_headers(entry):
+    """Builds the revalidation headers for a cached entry."""
+    headers = {}
+    if entry:
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+    return headers
+
+class BodyWriter:
+    """
+    Streams a source body to a temp file in the cache directory while it is being parsed.
+    commit() moves it into place with its metadata; abort() discards it. Use as a context
+    manager: leaving the block without commit() aborts.
+    """
+
+    def __init__(self, url):
+        self.url = url
+        self.size = 0
+        self._sha = hashlib.sha256()
+        self._file = None
+        self._committed = False
+        try:
+            self._meta_path, self._body_path = _entry_paths(url)
+            self._tmp_path = f"{self._body_path}.tmp.{os.getpid()}.{threading.get_ident()}"
+            self._file = open(self._tmp_path, 'wb')
+        except OSError as e:
+            _get_logger().error(f"Could not write source cache entry for {url}: {e}")
+
+    def write(self, chunk):
+        self._sha.update(chunk)
+        self.size += len(chunk)
+        if self._file is not None:
+            self._file.write(chunk)
+
+    def commit(self, etag, last_modified):
+        body_sha = self._sha.hexdigest()
+        entry = {
+            'url': self.url,
+            'etag': etag,
+            'last_modified': last_modified,
+            'body_sha256': body_sha,
+            'fetched_at': time.time(),
+        }
+        if self._file is None:
+            return
+        try:
+            self._file.close()
+            self._file = None
+            # Body first: a metadata file always points at a complete body.
+            os.replace(self._tmp_path, self._body_path)
+            _write_atomic(self._meta_path, json.dumps(entry).encode('utf-8'))
+            self._committed = True
+        except OSError as e:
+            _get_logger().error(f"Could not write source cache entry for {self.url}: {e}")
+
+    def abort(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if not self._committed:
+            try:
+                os.remove(self._tmp_path)
+            except (OSError, AttributeError):
+                pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.abort()
+
+def get_templates(url, parse_body):
+    """
+    Returns the templates of a cached source, parsed from its stored body with
+    parse_body(binary file object) -> list. Nothing is kept in memory between refreshes:
+    an unchanged source (a 304) is parsed again, and the catalog shares the unchanged
+    entries of the previous version.
+    """
+    try:
+        _, body_path = _entry_paths(url)
+        with open(body_path, 'rb') as f:
+            return parse_body(f)
+    except OSError as e:
+        _get_logger().error(f"Could not read cached body for {url}: {e}")
+        return []
+
+def clear():
+    """Drops every cached source body and its validators, so the next fetch is a full download."""
+    shutil.rmtree(os.path.join(config_manager.APP_DATA_DIR, SOURCE_CACHE_DIRNAME), ignore_errors=True)
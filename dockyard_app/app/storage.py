@@ -0,0 +1,493 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from flask import current_app
+from . import config_manager
+from . import catalog_snapshot
+from .template_record import to_jsonable
+
+# Persistent state (users, template sources, the merged catalog) goes through a storage
+# backend. SQLite in WAL mode is the default: it is safe for concurrent writers across
+# worker processes and supports FTS5 search. The original JSON files remain available
+# as the 'json' backend, and are migrated into SQLite on first boot.
+STORAGE_BACKENDS = ('sqlite', 'json')
+SQLITE_FILENAME = 'dockyard.db'
+USER_STORE_FILENAME = 'users.json'
+PINNED_TEMPLATES_FILENAME = 'pinned_templates.json'
+
+_storage = None
+_storage_lock = threading.Lock()
+
+def _get_logger():
+    return current_app.logger if current_app else logging.getLogger(__name__)
+
+def _write_json_atomic(path, data):
+    tmp_path = f"{path}.tmp.{os.getpid()}.{threading.get_ident()}"
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, indent=4)
+    os.replace(tmp_path, path)
+
+def _is_url_list(data):
+    return isinstance(data, list) and all(isinstance(url, str) for url in data)
+
+def read_template_sources_file(path):
+    """Reads the JSON template sources file. Returns a list of URLs, or an empty list if missing or invalid."""
+    logger = _get_logger()
+    if not os.path.exists(path):
+        logger.info(f"User template sources file not found: {path}. Returning empty list.")
+        return []
+    try:
+        with open(path, 'r') as f:
+            data = json.load(f)
+        if _is_url_list(data):
+            logger.info(f"Loaded {len(data)} user template sources from {path}.")
+            return data
+        logger.warning(f"Invalid format in {path}. Expected a list of strings. Returning empty list.")
+        return []
+    except json.JSONDecodeError:
+        logger.error(f"Error decoding JSON from {path}. Returning empty list.")
+        return []
+    except IOError as e:
+        logger.error(f"IOError reading from {path}: {e}. Returning empty list.")
+        return []
+
+class UserRepository:
+    """
+    In-memory view of the JSON user store, indexed by id and by username.
+    The file is parsed once and re-read only when its mtime (or size) changes.
+    Writes go through a lock and an atomic temp-file rename.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.RLock()
+        self._signature = None
+        self._users = []
+        self._by_id = {}
+        self._by_username = {}
+
+    def _file_signature(self):
+        try:
+            stat = os.stat(self.path)
+            return (stat.st_mtime_ns, stat.st_size)
+        except FileNotFoundError:
+            return None
+
+    def _reload_if_changed(self):
+        signature = self._file_signature()
+        if signature == self._signature:
+            return
+        with self._lock:
+            signature = self._file_signature()
+            if signature == self._signature:
+                return
+            try:
+                with open(self.path, 'r') as f:
+                    users = json.load(f)
+                if not isinstance(users, list):
+                    users = []
+            except (FileNotFoundError, json.JSONDecodeError):
+                users = []
+            self._index(users)
+            self._signature = signature
+
+    def _index(self, users):
+        # Swap in fully built indexes; readers never see a partial state.
+        self._by_id = {u['id']: u for u in users}
+        self._by_username = {u['username']: u for u in users}
+        self._users = users
+
+    def all(self):
+        self._reload_if_changed()
+        return list(self._users)
+
+    def count(self):
+        self._reload_if_changed()
+        return len(self._users)
+
+    def get_by_id(self, user_id):
+        self._reload_if_changed()
+        return self._by_id.get(user_id)
+
+    def get_by_username(self, username):
+        self._reload_if_changed()
+        return self._by_username.get(username)
+
+    def add(self, username, password_hash):
+        """
+        Appends a user and returns its id, or None if the username is taken.
+        Ids are max(existing)+1, so they are never reused.
+        """
+        with self._lock:
+            self._reload_if_changed()
+            users = list(self._users)
+            if any(u['username'] == username for u in users):
+                return None
+            new_id = max((u['id'] for u in users), default=0) + 1
+            users.append({'id': new_id, 'username': username, 'password_hash': password_hash})
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            _write_json_atomic(self.path, users)
+            self._index(users)
+            self._signature = self._file_signature()
+            return new_id
+
+class JsonStorage:
+    """The original file-based storage: users.json, user_template_sources.json and the catalog snapshot."""
+
+    name = 'json'
+    supports_search = False
+
+    def __init__(self, data_dir):
+        self.users = UserRepository(os.path.join(data_dir, USER_STORE_FILENAME))
+        self.sources_path = config_manager.USER_TEMPLATE_SOURCES_PATH
+        self.pins_path = os.path.join(data_dir, PINNED_TEMPLATES_FILENAME)
+        self._pins_lock = threading.Lock()
+
+    # Users
+    def count_users(self):
+        return self.users.count()
+
+    def get_user_by_id(self, user_id):
+        return self.users.get_by_id(user_id)
+
+    def get_user_by_username(self, username):
+        return self.users.get_by_username(username)
+
+    def add_user(self, username, password_hash):
+        return self.users.add(username, password_hash)
+
+    # Template sources
+    def get_template_sources(self):
+        return read_template_sources_file(self.sources_path)
+
+    def save_template_sources(self, urls_list):
+        logger = _get_logger()
+        try:
+            _write_json_atomic(self.sources_path, urls_list)
+            logger.info(f"Saved {len(urls_list)} user template sources to {self.sources_path}.")
+            return True
+        except (IOError, OSError) as e:
+            logger.error(f"IOError writing to {self.sources_path}: {e}")
+            return False
+
+    # Pinned templates (images kept pulled ahead of installs)
+    def get_pinned_templates(self):
+        try:
+            with open(self.pins_path) as f:
+                pins = json.load(f)
+        except (IOError, ValueError):
+            return []
+        return pins if isinstance(pins, list) else []
+
+    def pin_template(self, template_id, image):
+        with self._pins_lock:
+            pins = [p for p in self.get_pinned_templates() if p.get('template_id') != template_id]
+            pins.append({'template_id': template_id, 'image': image, 'pinned_at': time.time()})
+            _write_json_atomic(self.pins_path, pins)
+
+    def unpin_template(self, template_id):
+        with self._pins_lock:
+            pins = self.get_pinned_templates()
+            remaining = [p for p in pins if p.get('template_id') != template_id]
+            if len(remaining) != len(pins):
+                _write_json_atomic(self.pins_path, remaining)
+            return len(remaining) != len(pins)
+
+    # Catalog
+    def save_catalog(self, templates, version=None):
+        return catalog_snapshot.save_snapshot(templates)
+
+    def load_catalog(self):
+        return catalog_snapshot.load_snapshot()
+
+    def catalog_stats(self):
+        return catalog_snapshot.get_snapshot_stats()
+
+    def catalog_version(self):
+        return None
+
+    def catalog_marker(self):
+        """Cheap change marker for the stored catalog: the snapshot file's mtime."""
+        return catalog_snapshot.get_snapshot_mtime()
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    username TEXT NOT NULL UNIQUE,
+    password_hash TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS template_sources (
+    position INTEGER PRIMARY KEY,
+    url TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS catalog_templates (
+    position INTEGER PRIMARY KEY,
+    body TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS pinned_templates (
+    template_id TEXT PRIMARY KEY,
+    image TEXT NOT NULL,
+    pinned_at REAL NOT NULL
+);
+"""
+
+_FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS catalog_fts USING fts5(
+    position UNINDEXED, title, description, categories, image,
+    tokenize = 'unicode61'
+);
+"""
+
+class SqliteStorage:
+    """SQLite storage in WAL mode. One connection per thread; writes are short transactions."""
+
+    name = 'sqlite'
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._stats = {
+            'loaded': False,
+            'template_count': 0,
+            'saved_at': None,
+            'load_seconds': None,
+            'size_bytes': None,
+        }
+        conn = self._connection()
+        conn.execute('PRAGMA journal_mode=WAL')
+        with conn:
+            conn.executescript(_SCHEMA)
+        try:
+            with conn:
+                conn.executescript(_FTS_SCHEMA)
+            self.supports_search = True
+        except sqlite3.OperationalError as e:
+            _get_logger().warning(f"SQLite FTS5 is not available ({e}); full-text search falls back to the in-memory index.")
+            self.supports_search = False
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA busy_timeout=30000')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('PRAGMA foreign_keys=ON')
+            self._local.conn = conn
+        return conn
+
+    def _get_meta(self, key):
+        row = self._connection().execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row['value'] if row else None
+
+    @staticmethod
+    def _set_meta(conn, key, value):
+        conn.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, str(value)))
+
+    # Users
+    @staticmethod
+    def _user_row(row):
+        return dict(row) if row else None
+
+    def count_users(self):
+        return self._connection().execute('SELECT COUNT(*) FROM users').fetchone()[0]
+
+    def get_user_by_id(self, user_id):
+        return self._user_row(self._connection().execute(
+            'SELECT id, username, password_hash FROM users WHERE id = ?', (user_id,)).fetchone())
+
+    def get_user_by_username(self, username):
+        return self._user_row(self._connection().execute(
+            'SELECT id, username, password_hash FROM users WHERE username = ?', (username,)).fetchone())
+
+    def add_user(self, username, password_hash):
+        """Returns the new user's id, or None if the username is taken."""
+        conn = self._connection()
+        try:
+            with conn:
+                cursor = conn.execute('INSERT INTO users (username, password_hash) VALUES (?, ?)', (username, password_hash))
+        except sqlite3.IntegrityError:
+            # username is UNIQUE: another request registered it after the form checked.
+            return None
+        return cursor.lastrowid
+
+    # Template sources
+    def get_template_sources(self):
+        rows = self._connection().execute('SELECT url FROM template_sources ORDER BY position').fetchall()
+        return [row['url'] for row in rows]
+
+    def save_template_sources(self, urls_list):
+        conn = self._connection()
+        try:
+            with conn:
+                conn.execute('DELETE FROM template_sources')
+                conn.executemany('INSERT INTO template_sources (position, url) VALUES (?, ?)', list(enumerate(urls_list)))
+            _get_logger().info(f"Saved {len(urls_list)} user template sources to {self.path}.")
+            return True
+        except sqlite3.Error as e:
+            _get_logger().error(f"SQLite error saving template sources: {e}")
+            return False
+
+    # Pinned templates
+    def get_pinned_templates(self):
+        rows = self._connection().execute('SELECT template_id, image, pinned_at FROM pinned_templates ORDER BY pinned_at').fetchall()
+        return [dict(row) for row in rows]
+
+    def pin_template(self, template_id, image):
+        conn = self._connection()
+        with conn:
+            conn.execute('INSERT OR REPLACE INTO pinned_templates (template_id, image, pinned_at) VALUES (?, ?, ?)',
+                         (template_id, image, time.time()))
+
+    def unpin_template(self, template_id):
+        conn = self._connection()
+        with conn:
+            cursor = conn.execute('DELETE FROM pinned_templates WHERE template_id = ?', (template_id,))
+        return cursor.rowcount > 0
+
+    # Catalog
+    def save_catalog(self, templates, version=None):
+        """Replaces the stored catalog (and its FTS index) in a single transaction."""
+        conn = self._connection()
+        saved_at = time.time()
+        rows = [(position, json.dumps(t, separators=(',', ':'), default=to_jsonable)) for position, t in enumerate(templates)]
+        try:
+            with conn:
+                conn.execute('DELETE FROM catalog_templates')
+                conn.executemany('INSERT INTO catalog_templates (position, body) VALUES (?, ?)', rows)
+                if self.supports_search:
+                    conn.execute('DELETE FROM catalog_fts')
+                    conn.executemany(
+                        'INSERT INTO catalog_fts (position, title, description, categories, image) VALUES (?, ?, ?, ?, ?)',
+                        [(position, *_fts_fields(t)) for position, t in enumerate(templates)],
+                    )
+                self._set_meta(conn, 'catalog_saved_at', saved_at)
+                self._set_meta(conn, 'catalog_count', len(rows))
+                self._set_meta(conn, 'catalog_version', version or '')
+        except sqlite3.Error as e:
+            _get_logger().error(f"SQLite error saving catalog: {e}")
+            return False
+        self._stats.update({'saved_at': saved_at, 'template_count': len(rows)})
+        _get_logger().info(f"Saved catalog with {len(rows)} templates to {self.path}.")
+        return True
+
+    def load_catalog(self):
+        """Returns the stored catalog as a list of templates, or None if none has been saved."""
+        start = time.perf_counter()
+        conn = self._connection()
+        saved_at = self._get_meta('catalog_saved_at')
+        if saved_at is None:
+            return None
+        templates = [json.loads(row['body']) for row in conn.execute('SELECT body FROM catalog_templates ORDER BY position')]
+        self._stats.update({
+            'loaded': True,
+            'template_count': len(templates),
+            'saved_at': float(saved_at),
+            'load_seconds': time.perf_counter() - start,
+            'size_bytes': os.path.getsize(self.path),
+        })
+        _get_logger().info(f"Loaded {len(templates)} templates from {self.path} in {self._stats['load_seconds'] * 1000:.1f} ms.")
+        return templates
+
+    def catalog_stats(self):
+        stats = dict(self._stats)
+        stats['age_seconds'] = time.time() - stats['saved_at'] if stats['saved_at'] else None
+        return stats
+
+    def catalog_version(self):
+        """Returns the version of the stored catalog, as passed to save_catalog."""
+        return self._get_meta('catalog_version') or None
+
+    def catalog_marker(self):
+        """Cheap change marker for the stored catalog, so other workers can detect a new publish."""
+        return self._get_meta('catalog_saved_at')
+
+    def search_positions(self, text, limit=None):
+        """
+        Full-text search over the stored catalog. Returns catalog positions in rank order,
+        or None without FTS5 (check supports_search first).
+        """
+        if not self.supports_search:
+            return None
+        # Quote each term and match it as a prefix, mirroring the in-memory index.
+        terms = [term.replace('"', '""') for term in str(text).split() if term]
+        if not terms:
+            return []
+        match = ' '.join(f'"{term}"*' for term in terms)
+        sql = 'SELECT position FROM catalog_fts WHERE catalog_fts MATCH ? ORDER BY rank'
+        params = [match]
+        if limit:
+            sql += ' LIMIT ?'
+            params.append(int(limit))
+        return [row['position'] for row in self._connection().execute(sql, params)]
+
+    # Migration
+    def migrate_from_json(self, json_storage):
+        """One-time import of the JSON files into SQLite. The JSON files are left in place."""
+        if self._get_meta('json_migrated'):
+            return
+        logger = _get_logger()
+        users = json_storage.users.all()
+        sources = json_storage.get_template_sources() if os.path.exists(json_storage.sources_path) else []
+        conn = self._connection()
+        with conn:
+            # Workers booting together all get here: the write lock lets one of them migrate,
+            # and the others see its flag once they get the lock.
+            conn.execute('BEGIN IMMEDIATE')
+            if self._get_meta('json_migrated'):
+                return
+            for user in users:
+                conn.execute(
+                    'INSERT OR IGNORE INTO users (id, username, password_hash) VALUES (?, ?, ?)',
+                    (user['id'], user['username'], user['password_hash']),
+                )
+            if sources and not conn.execute('SELECT COUNT(*) FROM template_sources').fetchone()[0]:
+                conn.executemany('INSERT INTO template_sources (position, url) VALUES (?, ?)', list(enumerate(sources)))
+            self._set_meta(conn, 'json_migrated', time.time())
+        if self._get_meta('catalog_saved_at') is None:
+            templates = json_storage.load_catalog()
+            if templates:
+                self.save_catalog(templates)
+        logger.info(f"Migrated {len(users)} user(s) and {len(sources)} template source(s) from JSON files into {self.path}.")
+
+def _fts_fields(template):
+    categories = template.get('categories')
+    if isinstance(categories, (list, tuple)):
+        categories = ' '.join(c for c in categories if isinstance(c, str))
+    return (
+        str(template.get('title') or ''),
+        str(template.get('description') or ''),
+        str(categories or ''),
+        str(template.get('image') or ''),
+    )
+
+def get_storage():
+    """Returns the configured storage backend, creating it (and migrating JSON data) on first use."""
+    global _storage
+    if _storage is not None:
+        return _storage
+    with _storage_lock:
+        if _storage is None:
+            config_manager._ensure_data_dir_exists()
+            data_dir = config_manager.APP_DATA_DIR
+            backend = current_app.config.get('STORAGE_BACKEND', 'sqlite') if current_app else 'sqlite'
+            json_storage = JsonStorage(data_dir)
+            if backend == 'json':
+                _storage = json_storage
+            else:
+                if backend not in STORAGE_BACKENDS:
+                    _get_logger().warning(f"Unknown STORAGE_BACKEND '{backend}'. Using sqlite.")
+                sqlite_storage = SqliteStorage(os.path.join(data_dir, SQLITE_FILENAME))
+                sqlite_storage.migrate_from_json(json_storage)
+                _storage = sqlite_storage
+            _get_logger().info(f"Using '{_storage.name}' storage backend in {data_dir}.")
+    return _storage
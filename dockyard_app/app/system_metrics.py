@@ -0,0 +1,183 @@
+import logging
+import os
+import threading
+import time
+from array import array
+
+# Host metrics are sampled by one background thread into fixed-size, array-backed ring
+# buffers, so dashboard requests never block on psutil.cpu_percent(interval=...).
+DEFAULT_SAMPLE_INTERVAL = 2.0
+DEFAULT_HISTORY_SIZE = 300
+
+# Scalar series kept for every sample. Rates are per second over the sampling interval.
+SERIES = (
+    'timestamp',
+    'cpu_percent',
+    'memory_percent',
+    'memory_used',
+    'disk_read_bytes_per_sec',
+    'disk_write_bytes_per_sec',
+    'net_sent_bytes_per_sec',
+    'net_recv_bytes_per_sec',
+    'load_1',
+    'load_5',
+    'load_15',
+)
+
+logger = logging.getLogger(__name__)
+
+class MetricsRing:
+    """
+    Fixed-capacity ring buffer of samples. Each series is an array('d'), plus one
+    array per CPU core; no per-sample dicts are kept.
+    """
+
+    def __init__(self, capacity, cpu_count):
+        self.capacity = capacity
+        self.cpu_count = cpu_count
+        self._series = {name: array('d', [0.0]) * capacity for name in SERIES}
+        self._per_core = [array('d', [0.0]) * capacity for _ in range(cpu_count)]
+        self._next = 0
+        self._size = 0
+        self._sequence = 0
+        self._lock = threading.Lock()
+        self._condition = threading.Condition(self._lock)
+
+    def append(self, values, per_core):
+        with self._condition:
+            i = self._next
+            for name in SERIES:
+                self._series[name][i] = values[name]
+            for core, value in enumerate(per_core[:self.cpu_count]):
+                self._per_core[core][i] = value
+            self._next = (i + 1) % self.capacity
+            self._size = min(self._size + 1, self.capacity)
+            self._sequence += 1
+            self._condition.notify_all()
+
+    @property
+    def sequence(self):
+        """Total number of samples ever appended; used by streams to detect new samples."""
+        return self._sequence
+
+    def _indexes(self, limit=None):
+        count = self._size if limit is None else min(limit, self._size)
+        start = (self._next - count) % self.capacity
+        return [(start + k) % self.capacity for k in range(count)]
+
+    def latest(self):
+        """Returns the most recent sample as a dict, or None if nothing was sampled yet."""
+        with self._lock:
+            if not self._size:
+                return None
+            i = (self._next - 1) % self.capacity
+            sample = {name: self._series[name][i] for name in SERIES}
+            sample['per_core'] = [core[i] for core in self._per_core]
+            sample['sequence'] = self._sequence
+            return sample
+
+    def history(self, limit=None):
+        """Returns the buffered samples, oldest first, as column lists."""
+        with self._lock:
+            indexes = self._indexes(limit)
+            columns = {name: [self._series[name][i] for i in indexes] for name in SERIES}
+            columns['per_core'] = [[core[i] for i in indexes] for core in self._per_core]
+            columns['sequence'] = self._sequence
+            return columns
+
+    def wait_for_sample(self, after_sequence, timeout):
+        """Blocks until a sample newer than after_sequence exists (or timeout). Returns the current sequence."""
+        with self._condition:
+            self._condition.wait_for(lambda: self._sequence > after_sequence, timeout=timeout)
+            return self._sequence
+
+class MetricsSampler:
+    """Background thread that samples host metrics into a MetricsRing every `interval` seconds."""
+
+    def __init__(self, interval=DEFAULT_SAMPLE_INTERVAL, history_size=DEFAULT_HISTORY_SIZE):
+        import psutil # Imported lazily: only needed once the dashboard is opened
+        self.interval = interval
+        self.ring = MetricsRing(history_size, psutil.cpu_count() or 1)
+        self._thread = None
+        self._stop = threading.Event()
+        self._previous_io = None
+
+    def _io_counters(self):
+        import psutil
+        disk = psutil.disk_io_counters() if hasattr(psutil, 'disk_io_counters') else None
+        net = psutil.net_io_counters()
+        return (
+            time.monotonic(),
+            disk.read_bytes if disk else 0,
+            disk.write_bytes if disk else 0,
+            net.bytes_sent if net else 0,
+            net.bytes_recv if net else 0,
+        )
+
+    def sample_once(self):
+        import psutil
+        # Non-blocking: cpu_percent(interval=None) reports usage since the previous call.
+        per_core = psutil.cpu_percent(interval=None, percpu=True)
+        memory = psutil.virtual_memory()
+        io = self._io_counters()
+        rates = [0.0, 0.0, 0.0, 0.0]
+        if self._previous_io is not None:
+            elapsed = max(io[0] - self._previous_io[0], 1e-6)
+            rates = [max(0.0, (now - before) / elapsed) for now, before in zip(io[1:], self._previous_io[1:])]
+        self._previous_io = io
+        try:
+            load = os.getloadavg()
+        except (AttributeError, OSError):
+            load = (0.0, 0.0, 0.0)
+
+        self.ring.append({
+            'timestamp': time.time(),
+            'cpu_percent': sum(per_core) / len(per_core) if per_core else 0.0,
+            'memory_percent': memory.percent,
+            'memory_used': float(memory.used),
+            'disk_read_bytes_per_sec': rates[0],
+            'disk_write_bytes_per_sec': rates[1],
+            'net_sent_bytes_per_sec': rates[2],
+            'net_recv_bytes_per_sec': rates[3],
+            'load_1': load[0],
+            'load_5': load[1],
+            'load_15': load[2],
+        }, per_core)
+
+    def _run(self):
+        # A short first wait gives cpu_percent a meaningful baseline without delaying the first sample long.
+        self._stop.wait(min(self.interval, 0.5))
+        while not self._stop.is_set():
+            try:
+                self.sample_once()
+            except Exception as e:  # Keep sampling even if one psutil call fails.
+                logger.error(f"System metrics sample failed: {e}")
+            self._stop.wait(self.interval)
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        import psutil
+        # Prime the CPU counters so the first real sample has a baseline.
+        psutil.cpu_percent(interval=None, percpu=True)
+        self._previous_io = self._io_counters()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='system-metrics-sampler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+_sampler = None
+_sampler_lock = threading.Lock()
+
+def get_sampler(interval=DEFAULT_SAMPLE_INTERVAL, history_size=DEFAULT_HISTORY_SIZE):
+    """Returns the process-wide sampler, starting it on first use."""
+    global _sampler
+    if _sampler is None:
+        with _sampler_lock:
+            if _sampler is None:
+                sampler = MetricsSampler(interval=interval, history_size=history_size)
+                sampler.start()
+                _sampler = sampler
+    return _sampler
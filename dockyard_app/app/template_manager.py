@@ -1,63 +1,226 @@
+import os
 import requests
-import json
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait
 from flask import current_app
 from . import config_manager # Import config_manager to get user-defined URLs
+from . import source_cache
+from . import storage
+from . import search
+from . import leader
+from . import refresh
+from . import template_stream
+from . import logo_cache
+from . import instrumentation
+from .catalog import Catalog, CatalogDiff, EMPTY_CATALOG
 
-_cached_templates = []
-_is_updating = False
+# The current catalog. Replaced as a whole on each refresh (a single reference
+# assignment), so readers never observe a partially built catalog. Writers (refresh,
+# snapshot load, storage sync) hold _catalog_lock while replacing it together with
+# the change feed and the storage marker.
+_catalog = EMPTY_CATALOG
+_catalog_lock = threading.RLock()
+_last_refresh_at = None
+# Storage change marker of the catalog this process is serving, and when it was last checked.
+_storage_marker = None
+_last_storage_check = 0.0
+# Diffs between consecutive catalog versions seen by this process, oldest first.
+DEFAULT_CHANGE_HISTORY = 50
+_catalog_changes = deque(maxlen=DEFAULT_CHANGE_HISTORY)
 
-def fetch_templates_from_url(url):
-    """Fetches template data from a single URL."""
-    try:
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
-        data = response.json()
-        if isinstance(data, list):
-            return data
-        elif isinstance(data, dict) and 'templates' in data and isinstance(data['templates'], list):
-            return data['templates']
-        else:
-            # Use current_app.logger if available, otherwise print
+# Followers never fetch: after the sources change they leave this file in the data dir,
+# and the leader's scheduler starts the refresh and publishes the result to storage.
+REFRESH_REQUEST_FILENAME = 'catalog_refresh.request'
+
+DEFAULT_FETCH_TIMEOUT = 10
+DEFAULT_FETCH_MAX_WORKERS = 8
+DEFAULT_REFRESH_DEADLINE = 30
+
+def _source_limits():
+    config = current_app.config if current_app else {}
+    return (
+        config.get('TEMPLATE_SOURCE_MAX_BYTES', template_stream.DEFAULT_MAX_BYTES),
+        config.get('TEMPLATE_SOURCE_MAX_TEMPLATES', template_stream.DEFAULT_MAX_TEMPLATES),
+    )
+
+def _parse_cached_body(url):
+    """Returns a parser for a stored source body, used when reusing the on-disk copy."""
+    def parse(f):
+        try:
+            return template_stream.parse_stream(template_stream.read_file_chunks(f), _source_limits()[1])
+        except ValueError as e:
             logger = current_app.logger if current_app else logging.getLogger(__name__)
-            logger.error(f"Unexpected JSON structure from {url}")
+            logger.error(f"Error decoding cached JSON for {url}: {e}")
             return []
+    return parse
+
+def _read_templates(response, url):
+    """
+    Reads and parses a template source response, streaming the body to the source cache.
+    Bodies that announce a small Content-Length are parsed in one go; anything else is
+    parsed incrementally as it arrives. Raises ValueError subclasses for oversized or
+    malformed sources.
+    """
+    max_bytes, max_templates = _source_limits()
+    declared = response.headers.get('Content-Length')
+    declared = int(declared) if declared and declared.isdigit() else None
+    if declared is not None and max_bytes and declared > max_bytes:
+        raise template_stream.SourceLimitError(f"Source is larger than {max_bytes} bytes ({declared}).")
+    with source_cache.BodyWriter(url) as writer:
+        chunks = template_stream.limit_chunks(
+            response.iter_content(chunk_size=template_stream.CHUNK_SIZE), max_bytes, sink=writer.write)
+        if declared is not None and declared <= template_stream.FAST_PATH_MAX_BYTES:
+            templates = template_stream.parse_body(b''.join(chunks), max_templates)
+        else:
+            templates = template_stream.parse_stream(chunks, max_templates)
+        writer.commit(response.headers.get('ETag'), response.headers.get('Last-Modified'))
+    instrumentation.SOURCE_FETCH_BYTES.observe(writer.size, source=instrumentation.source_label(url))
+    return templates
+
+def fetch_templates_from_url(url, timeout=DEFAULT_FETCH_TIMEOUT):
+    """
+    Fetches template data from a single URL.
+    Revalidates against the on-disk source cache with If-None-Match / If-Modified-Since,
+    reusing the stored templates on 304 and falling back to them if the source is unreachable
+    or its body is invalid or over the configured limits.
+    """
+    logger = current_app.logger if current_app else logging.getLogger(__name__)
+    breakers = _source_breakers()
+    cached_entry = source_cache.load_entry(url)
+    outcome = 'error'
+    start = time.perf_counter()
+    try:
+        with requests.get(url, timeout=timeout, headers=source_cache.conditional_headers(cached_entry), stream=True) as response:
+            if response.status_code == 304 and cached_entry:
+                logger.info(f"Templates from {url} not modified since last fetch. Reusing cached copy.")
+                breakers.record_success(url)
+                outcome = 'not_modified'
+                return source_cache.get_templates(url, _parse_cached_body(url))
+            response.raise_for_status()
+            templates = _read_templates(response, url)
+        breakers.record_success(url)
+        outcome = 'ok'
+        return templates
     except requests.exceptions.RequestException as e:
-        logger = current_app.logger if current_app else logging.getLogger(__name__)
         logger.error(f"Error fetching template from {url}: {e}")
+        breakers.record_failure(url, e)
+        return _cached_copy(url, cached_entry)
+    except ValueError as e:
+        # Malformed JSON, an unexpected structure, or a source over the size/count limits.
+        logger.error(f"Rejected templates from {url}: {e}")
+        breakers.record_failure(url, e)
+        outcome = 'rejected'
+        return _cached_copy(url, cached_entry)
+    finally:
+        source = instrumentation.source_label(url)
+        instrumentation.SOURCE_FETCH_SECONDS.observe(time.perf_counter() - start, source=source)
+        instrumentation.SOURCE_FETCHES.inc(source=source, outcome=outcome)
+        if cached_entry:
+            # The conditional request is a lookup in the source cache: 304 reuses the stored body.
+            instrumentation.cache_result('source_body', outcome == 'not_modified')
+
+def _cached_copy(url, cached_entry=None):
+    """The last good copy of a source from the on-disk cache, or an empty list."""
+    cached_entry = cached_entry or source_cache.load_entry(url)
+    if not cached_entry:
         return []
-    except json.JSONDecodeError as e:
-        logger = current_app.logger if current_app else logging.getLogger(__name__)
-        logger.error(f"Error decoding JSON from {url}: {e}")
-        return []
-    # Add a basic logging import for cases where current_app might not be available (e.g. direct script call for testing)
-    except NameError: # if current_app is not defined (e.g. no Flask context)
-        import logging
-        logging.basicConfig(level=logging.INFO)
-        logger = logging.getLogger(__name__)
-        logger.error(f"Flask current_app not available. Error fetching/decoding from {url}: {e}")
-        return []
+    logger = current_app.logger if current_app else logging.getLogger(__name__)
+    fetched_at = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(cached_entry.get('fetched_at', 0)))
+    logger.warning(f"Using cached copy of {url} fetched at {fetched_at}.")
+    return source_cache.get_templates(url, _parse_cached_body(url))
 
+_breakers = None
 
-def update_cached_templates():
-    """Fetches and updates the cached templates.
-    Prioritizes user-defined URLs, then falls back to environment config.
-    """
-    global _cached_templates
-    global _is_updating
+def _source_breakers():
+    global _breakers
+    if _breakers is None:
+        config = current_app.config if current_app else {}
+        _breakers = refresh.SourceBreakers(
+            backoff_base=config.get('TEMPLATE_SOURCE_BACKOFF_SECONDS', refresh.DEFAULT_BACKOFF_BASE_SECONDS),
+            backoff_max=config.get('TEMPLATE_SOURCE_BACKOFF_MAX_SECONDS', refresh.DEFAULT_BACKOFF_MAX_SECONDS),
+            failure_threshold=config.get('TEMPLATE_SOURCE_FAILURE_THRESHOLD', refresh.DEFAULT_FAILURE_THRESHOLD),
+        )
+    return _breakers
 
-    # Ensure logger is available even if current_app is not (e.g., during threaded execution startup)
+
+def _fetch_in_app_context(flask_app, url, timeout):
+    """Runs fetch_templates_from_url inside an app context so worker threads can log and read config."""
+    if flask_app is None:
+        return fetch_templates_from_url(url, timeout=timeout)
+    with flask_app.app_context():
+        return fetch_templates_from_url(url, timeout=timeout)
+
+def fetch_all_sources(source_urls):
+    """
+    Fetches all source URLs concurrently on a bounded thread pool.
+    Each source gets its own request timeout, and the whole batch is bounded by an
+    overall deadline; sources that miss the deadline are reported as empty.
+    Returns a list of template lists in the same order as source_urls.
+    """
     logger = current_app.logger if current_app else logging.getLogger(__name__)
-    if not current_app and not hasattr(logger, 'info'): # Basic setup if no Flask logger
-        import logging
-        logging.basicConfig(level=logging.INFO)
-        logger = logging.getLogger(__name__)
+    if not source_urls:
+        return []
+
+    flask_app = current_app._get_current_object() if current_app else None
+    config = flask_app.config if flask_app else {}
+    timeout = config.get('TEMPLATE_FETCH_TIMEOUT', DEFAULT_FETCH_TIMEOUT)
+    deadline = config.get('TEMPLATE_REFRESH_DEADLINE', DEFAULT_REFRESH_DEADLINE)
+    max_workers = max(1, min(config.get('TEMPLATE_FETCH_MAX_WORKERS', DEFAULT_FETCH_MAX_WORKERS), len(source_urls)))
+
+    breakers = _source_breakers()
+    breakers.forget_except(set(source_urls))
+    executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='template-fetch')
+    try:
+        # Sources whose circuit is open are not fetched; their cached copy is used instead.
+        futures = [
+            executor.submit(_fetch_in_app_context, flask_app, url, timeout) if breakers.allow(url) else None
+            for url in source_urls
+        ]
+        done, _ = wait([f for f in futures if f is not None], timeout=deadline)
 
+        results = []
+        for url, future in zip(source_urls, futures):
+            if future is None:
+                logger.info(f"Skipping {url}: its circuit is open after repeated failures.")
+                results.append(_cached_copy(url))
+                continue
+            if future not in done:
+                logger.warning(f"Fetching {url} did not finish within the {deadline}s refresh deadline. Skipping it.")
+                breakers.record_failure(url, f"Missed the {deadline}s refresh deadline")
+                results.append(_cached_copy(url))
+                continue
+            try:
+                results.append(future.result())
+            except Exception as e:
+                logger.error(f"Unexpected error fetching templates from {url}: {e}")
+                results.append([])
+        return results
+    finally:
+        # Don't wait for stragglers past the deadline; their results are discarded.
+        executor.shutdown(wait=False, cancel_futures=True)
 
-    if _is_updating:
-        logger.info("Template update already in progress. Skipping.")
-        return
+def _refresh_catalog():
+    """Fetches all sources and swaps in the new catalog. Run by the refresh coordinator only."""
+    previous_version = _catalog.version
+    result = 'error'
+    start = time.perf_counter()
+    try:
+        catalog = _fetch_and_swap_catalog()
+        result = 'changed' if catalog.version != previous_version else 'unchanged'
+        return catalog
+    finally:
+        instrumentation.CATALOG_REFRESH_SECONDS.observe(time.perf_counter() - start)
+        instrumentation.CATALOG_REFRESHES.inc(result=result)
+
+def _fetch_and_swap_catalog():
+    """Prioritizes user-defined URLs, then falls back to environment config."""
+    global _catalog
+    global _last_refresh_at
+    global _storage_marker
 
-    _is_updating = True
+    logger = current_app.logger if current_app else logging.getLogger(__name__)
     logger.info("Starting template cache update...")
 
     source_urls = []
@@ -81,45 +244,229 @@ def update_cached_templates():
 
     if not source_urls:
         logger.warning("No template source URLs configured (neither user-defined nor environment). Cache will be empty.")
-        _cached_templates = []
-        _is_updating = False
-        return
+        with _catalog_lock:
+            _catalog = EMPTY_CATALOG
+            _catalog_changes.clear()
+        return _catalog
 
+    logger.info(f"Fetching templates from {len(source_urls)} source(s) concurrently for cache update.")
     new_templates_data = []
-    for url in source_urls:
-        logger.info(f"Fetching templates from: {url} for cache update.")
-        templates = fetch_templates_from_url(url) # This function now also uses a logger
+    # Results come back in source order, so the merged list is deterministic
+    # regardless of which source answered first.
+    for url, templates in zip(source_urls, fetch_all_sources(source_urls)):
         if templates:
             new_templates_data.extend(templates)
         else:
             logger.warning(f"No templates found or error fetching from {url} during cache update.")
 
-    _cached_templates = new_templates_data
-    _is_updating = False
-    logger.info(f"Template cache updated. Total templates: {len(_cached_templates)}")
+    # Held until the catalog is in storage, so a sync doesn't reload this process's own catalog.
+    with _catalog_lock:
+        previous_version = _catalog.version
+        _swap_catalog(Catalog(new_templates_data, previous=_catalog or None))
+        _last_refresh_at = time.time()
+        diff = _catalog.diff
+        if diff is not None:
+            logger.info(f"Template cache updated. Total templates: {len(_catalog)} (catalog version {_catalog.version}; "
+                        f"{len(diff.added)} added, {len(diff.removed)} removed, {len(diff.changed)} changed)")
+        else:
+            logger.info(f"Template cache updated. Total templates: {len(_catalog)} (catalog version {_catalog.version})")
+        # An unchanged catalog is already in storage; rewriting it would only make followers reload.
+        if _catalog and _catalog.version != previous_version:
+            backend = storage.get_storage()
+            if backend.save_catalog(list(_catalog.templates), version=_catalog.version):
+                _storage_marker = backend.catalog_marker()
+    if _catalog and current_app:
+        # Fetches only logos that aren't cached yet, so an unchanged catalog costs nothing.
+        logo_cache.prefetch_catalog(current_app._get_current_object(), _catalog)
+    return _catalog
+
+_coordinator = refresh.RefreshCoordinator(_refresh_catalog)
+
+instrumentation.Gauge('dockyard_catalog_templates', 'Templates in the catalog served by this process.',
+                      lambda: len(_catalog))
+instrumentation.Gauge('dockyard_catalog_age_seconds', 'Seconds since this process last refreshed the catalog.',
+                      lambda: None if _last_refresh_at is None else round(time.time() - _last_refresh_at, 3))
+
+def request_refresh(flask_app=None):
+    """
+    Starts a catalog refresh in the background, or joins the one already running.
+    Returns a Future that resolves to the new catalog.
+    """
+    if flask_app is None and current_app:
+        flask_app = current_app._get_current_object()
+    return _coordinator.request(flask_app)
+
+def update_cached_templates(timeout=None):
+    """
+    Refreshes the catalog and waits for the result. If a refresh is already in progress
+    (from the scheduler or another request), waits for that one instead of starting a
+    second. Returns the current catalog, which is unchanged if the refresh failed.
+    """
+    try:
+        request_refresh().result(timeout=timeout)
+    except Exception:
+        pass # Logged by the coordinator; keep serving the previous catalog.
+    return _catalog
+
+def _refresh_request_path():
+    return os.path.join(config_manager.APP_DATA_DIR, REFRESH_REQUEST_FILENAME)
+
+def schedule_refresh(flask_app=None):
+    """
+    Asks for a catalog refresh after the template sources changed. Any process may call
+    this; the request is stored in the data dir and only the leader acts on it, so the
+    refresh (and the fetch it implies) runs once, in the leader. Returns immediately.
+    """
+    config_manager._ensure_data_dir_exists()
+    with open(_refresh_request_path(), 'w') as f:
+        f.write(str(time.time()))
+    if leader.is_leader():
+        handle_refresh_request(flask_app)
+
+def handle_refresh_request(flask_app=None):
+    """
+    Starts a refresh if one was requested. Run periodically by the leader's scheduler.
+    A refresh already in progress may have read the old sources, so the request is left
+    in place until that one finishes. Returns True if a refresh was started.
+    """
+    if _coordinator.in_progress:
+        return False
+    try:
+        os.remove(_refresh_request_path())
+    except FileNotFoundError:
+        return False
+    request_refresh(flask_app)
+    return True
+
+def is_refreshing():
+    """True while a refresh runs in this process or one is waiting for the leader."""
+    return _coordinator.in_progress or os.path.exists(_refresh_request_path())
+
+def _swap_catalog(new_catalog):
+    """Makes new_catalog current, recording its diff from the previous version for the change feed."""
+    global _catalog
+    with _catalog_lock:
+        diff = new_catalog.diff
+        if diff is not None and diff.from_version != diff.to_version:
+            _catalog_changes.append(diff)
+        _catalog = new_catalog
+
+def get_changes_since(version):
+    """
+    Returns a CatalogDiff from `version` to the current catalog, or None if that version
+    is unknown or too old for the change history (the client should reload everything).
+    """
+    catalog = _catalog
+    if version == catalog.version:
+        return CatalogDiff(version, version)
+    diffs = list(_catalog_changes)
+    # Latest occurrence first: a catalog can return to an earlier version.
+    for start in range(len(diffs) - 1, -1, -1):
+        if diffs[start].from_version == version:
+            chain = diffs[start:]
+            contiguous = all(a.to_version == b.from_version for a, b in zip(chain, chain[1:]))
+            if contiguous and chain[-1].to_version == catalog.version:
+                return CatalogDiff.compose(chain)
+            return None
+    return None
+
+def load_cached_templates_from_snapshot():
+    """
+    Populates the cache from the persisted catalog (a snapshot file or the SQLite store),
+    without touching the network. Returns True if a stored catalog was loaded.
+    """
+    global _storage_marker
+    backend = storage.get_storage()
+    marker = backend.catalog_marker()
+    templates = backend.load_catalog()
+    if templates is None:
+        return False
+    snapshot_catalog = Catalog(templates)
+    with _catalog_lock:
+        # A refresh that already finished wins over the (older) snapshot.
+        if not _catalog:
+            _swap_catalog(snapshot_catalog)
+            _storage_marker = marker
+    return True
+
+def sync_catalog_from_storage(min_interval=5):
+    """
+    Picks up a catalog published to storage by another process (the scheduler leader).
+    Checks a cheap change marker at most every min_interval seconds and only reloads
+    and re-indexes when it changed. Returns True if a new catalog was swapped in.
+    Returns at once if another thread is already syncing or swapping the catalog.
+    """
+    global _storage_marker
+    global _last_storage_check
+    if not _catalog_lock.acquire(blocking=False):
+        return False
+    try:
+        now = time.monotonic()
+        if now - _last_storage_check < min_interval:
+            return False
+        _last_storage_check = now
+
+        backend = storage.get_storage()
+        marker = backend.catalog_marker()
+        if marker is None or marker == _storage_marker:
+            return False
+        templates = backend.load_catalog()
+        if templates is None:
+            return False
+        new_catalog = Catalog(templates, previous=_catalog or None)
+        _swap_catalog(new_catalog)
+        _storage_marker = marker
+    finally:
+        _catalog_lock.release()
+    logger = current_app.logger if current_app else logging.getLogger(__name__)
+    logger.info(f"Loaded catalog version {new_catalog.version} published by another worker ({len(new_catalog)} templates).")
+    return True
+
+def get_cache_status():
+    """Returns template cache metrics, including snapshot age and load time."""
+    return {
+        'template_count': len(_catalog),
+        'catalog_version': _catalog.version,
+        'is_updating': _coordinator.in_progress,
+        'refresh_requested': os.path.exists(_refresh_request_path()),
+        'last_refresh_at': _last_refresh_at,
+        'last_refresh_error': _coordinator.last_error,
+        'sources': _source_breakers().status(),
+        'storage_backend': storage.get_storage().name,
+        'snapshot': storage.get_storage().catalog_stats(),
+    }
+
+def get_catalog():
+    """
+    Returns the current catalog without waiting for the network. While it is empty, loads
+    the catalog published to storage; on the leader, also starts a refresh in the background
+    (or joins the running one). Callers show an empty catalog as refreshing (see is_refreshing).
+    """
+    if not _catalog:
+        sync_catalog_from_storage(min_interval=0)
+        if not _catalog and leader.is_leader():
+            request_refresh()
+    return _catalog
 
 def get_all_templates():
     """Returns all templates, primarily from cache. Fetches if cache is empty."""
-    logger = current_app.logger if current_app else logging.getLogger(__name__)
-    if not _cached_templates and not _is_updating:
-        logger.info("Cache is empty, attempting initial fetch...")
-        update_cached_templates()
-    return _cached_templates
+    return get_catalog().templates
+
+def search_templates(catalog, **kwargs):
+    """
+    Runs a /api/templates search. With SEARCH_BACKEND=fts and a SQLite store holding this
+    catalog version, text matching uses FTS5; otherwise the in-memory index is used.
+    """
+    match = None
+    if current_app and current_app.config.get('SEARCH_BACKEND') == 'fts':
+        backend = storage.get_storage()
+        if backend.supports_search and backend.catalog_version() == catalog.version:
+            match = backend.search_positions
+    return search.search_catalog(catalog, match=match, **kwargs)
 
 def get_template_by_id(template_id_str):
     """Gets a single template by its unique ID from the cache."""
-    all_templates = get_all_templates()
-    for i, t in enumerate(all_templates):
-        title = t.get('title')
-        if title:
-            # Recreate the unique ID using the same logic as in the index route
-            current_id = f"{title.replace(' ', '_').lower()}_{i}"
-            if current_id == template_id_str:
-                # Add the unique id to the template dict before returning
-                # so it's available for the caller.
-                t['id'] = current_id
-                return t
-    return None
+    return get_catalog().get(template_id_str)
 
 # Add a basic logging import at module level for the logger fallback in fetch_templates_from_url
 import logging
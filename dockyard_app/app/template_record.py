@@ -0,0 +1,159 @@
+import json
+import sys
+from collections.abc import Mapping
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; the standard library encoder is the fallback.
+    orjson = None
+
+# Compact, read-only catalog entries. The fields every page, index and search touches
+# are kept in slots, with their strings interned so the copies of a template that
+# several sources list (and repeated images, logos and categories) share one string.
+# Everything else (env, ports, volumes, note, ...) is kept as one compact JSON string
+# and decoded only when read, e.g. on the details page or when generating a compose file.
+# A variant of another template (the same app from another source, see merge.py) can
+# store only the fields that differ from that base template.
+HOT_FIELDS = ('type', 'title', 'description', 'categories', 'platform', 'logo', 'image', 'name')
+
+def _intern(value):
+    return sys.intern(value) if type(value) is str else value
+
+def _encode_extra(extra):
+    if orjson is not None:
+        try:
+            return orjson.dumps(extra).decode('utf-8')
+        except TypeError:  # e.g. integers beyond 64 bits; the standard encoder handles them.
+            pass
+    return json.dumps(extra, separators=(',', ':'), ensure_ascii=False)
+
+def _decode_extra(text):
+    return orjson.loads(text) if orjson is not None else json.loads(text)
+
+_MISSING = object()
+
+def _same_value(a, b):
+    # 1 == True == 1.0 in Python, but not in JSON: equal candidates are compared encoded.
+    return a is b or (a == b and _encode_extra(a) == _encode_extra(b))
+
+class Template(Mapping):
+    """
+    A catalog template. Reads like the upstream dict (template['image'],
+    template.get('env'), iteration, Jinja attribute access), but can't be modified.
+    Hot fields are also plain attributes; to_dict() returns the full upstream form.
+    """
+
+    __slots__ = ('id',) + HOT_FIELDS + ('_extra', '_base')
+
+    def __init__(self, template_id, fields, base=None):
+        extra = {}
+        values = dict.fromkeys(HOT_FIELDS)
+        for key, value in fields.items():
+            if key == 'id':
+                continue
+            if key == 'categories':
+                if type(value) in (list, tuple) and all(type(c) is str for c in value):
+                    values[key] = tuple(sys.intern(c) for c in value)
+                    continue
+            elif key in values and (type(value) is str or (key == 'type' and type(value) is int)):
+                values[key] = _intern(value)
+                continue
+            # Anything that doesn't fit a hot slot (including explicit nulls) is kept
+            # verbatim, so to_dict() reproduces the upstream template exactly.
+            extra[key] = value
+        object.__setattr__(self, 'id', template_id)
+        for key, value in values.items():
+            object.__setattr__(self, key, value)
+        base_extra = base.extra() if base is not None and extra else None
+        if base_extra and all(key in extra for key in base_extra):
+            extra = {key: value for key, value in extra.items() if not _same_value(base_extra.get(key, _MISSING), value)}
+        else:
+            base = None
+        object.__setattr__(self, '_base', base)
+        object.__setattr__(self, '_extra', sys.intern(_encode_extra(extra)) if extra else None)
+
+    @classmethod
+    def from_dict(cls, template, template_id=None, base=None):
+        """Builds a Template from an upstream dict, storing only its differences from `base` if given."""
+        if isinstance(template, cls) and template_id in (None, template.id):
+            return template
+        return cls(template_id if template_id is not None else template.get('id'), template, base)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Template is read-only.")
+
+    def __delattr__(self, name):
+        raise AttributeError("Template is read-only.")
+
+    @property
+    def base(self):
+        """The template this one is stored as a delta of, or None."""
+        return self._base
+
+    def extra(self):
+        """Decodes the non-hot fields. Returns a new dict on every call."""
+        extra = self._base.extra() if self._base is not None else {}
+        if self._extra is not None:
+            extra.update(_decode_extra(self._extra))
+        return extra
+
+    def _has_extra(self):
+        return self._extra is not None or self._base is not None
+
+    def items(self):
+        result = self._hot_items()
+        if self._has_extra():
+            result.extend(self.extra().items())
+        return result
+
+    def to_dict(self):
+        """The template as a plain dict, in its upstream form (categories as a list)."""
+        result = dict(self._hot_items())
+        if 'categories' in result:
+            result['categories'] = list(result['categories'])
+        if self._has_extra():
+            result.update(self.extra())
+        return result
+
+    def _hot_items(self):
+        result = [('id', self.id)] if self.id is not None else []
+        for key in HOT_FIELDS:
+            value = getattr(self, key)
+            if value is not None:
+                result.append((key, value))
+        return result
+
+    def __getitem__(self, key):
+        if key == 'id' or key in HOT_FIELDS:
+            value = getattr(self, key)
+            if value is not None:
+                return value
+        if self._has_extra():
+            extra = self.extra()
+            if key in extra:
+                return extra[key]
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        if key == 'id' or key in HOT_FIELDS:
+            value = getattr(self, key)
+            if value is not None:
+                return value
+        if not self._has_extra():
+            return default
+        return self.extra().get(key, default)
+
+    def __iter__(self):
+        return iter([key for key, _ in self.items()])
+
+    def __len__(self):
+        return len(self._hot_items()) + (len(self.extra()) if self._has_extra() else 0)
+
+    def __repr__(self):
+        return f"Template(id={self.id!r}, title={self.title!r})"
+
+def to_jsonable(value):
+    """json.dumps `default=` hook that serializes Template objects as their upstream dicts."""
+    if isinstance(value, Template):
+        return value.to_dict()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
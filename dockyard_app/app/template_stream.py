@@ -0,0 +1,222 @@
+import codecs
+import json
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; the standard library parser is the fallback.
+    orjson = None
+
+# Incremental parsing of Portainer template sources. Large bodies are parsed one template
+# at a time as chunks arrive, so peak memory is the parsed templates plus one chunk,
+# instead of the raw body, its decoded text and the full object tree at once. Small
+# bodies take a single-shot fast path. Every template is validated and normalized.
+DEFAULT_MAX_BYTES = 50 * 1024 * 1024
+DEFAULT_MAX_TEMPLATES = 50000
+# Bodies up to this size are parsed in one go (orjson when available).
+FAST_PATH_MAX_BYTES = 2 * 1024 * 1024
+# A single template larger than this is rejected (it would have to be buffered whole).
+MAX_TEMPLATE_BYTES = 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+
+_WHITESPACE = ' \t\n\r'
+_DELIMITERS = _WHITESPACE + ',]}'
+_STRING_FIELDS = ('title', 'description', 'image', 'logo', 'note', 'name', 'platform')
+_decoder = json.JSONDecoder()
+_CONTAINERS = (dict, list)
+
+class SourceLimitError(ValueError):
+    """A source exceeded the configured size or template-count limit."""
+
+class TemplateParseError(ValueError):
+    """The source body isn't a Portainer template list."""
+
+def normalize_template(template):
+    """
+    Validates and normalizes one template. Returns the template, or None if it can't be
+    used (not an object, or neither an image nor a stack repository to install from).
+    Strips surrounding whitespace from text fields, turns numeric 'type' strings into
+    ints and drops non-string categories.
+    """
+    if not isinstance(template, dict):
+        return None
+    for field in _STRING_FIELDS:
+        value = template.get(field)
+        if isinstance(value, str):
+            template[field] = value.strip()
+    template_type = template.get('type')
+    if isinstance(template_type, str) and template_type.strip().isdigit():
+        template['type'] = int(template_type)
+    categories = template.get('categories')
+    if categories is not None:
+        template['categories'] = [c.strip() for c in categories if isinstance(c, str)] if isinstance(categories, list) else []
+    if not template.get('image') and not isinstance(template.get('repository'), dict):
+        return None
+    return template
+
+def _extract_list(data):
+    if isinstance(data, list):
+        return data
+    if isinstance(data, dict) and isinstance(data.get('templates'), list):
+        return data['templates']
+    raise TemplateParseError("Expected a list of templates or an object with a 'templates' list.")
+
+def _normalized(templates, max_templates):
+    result = []
+    for template in templates:
+        template = normalize_template(template)
+        if template is not None:
+            result.append(template)
+            if len(result) > max_templates:
+                raise SourceLimitError(f"Source has more than {max_templates} templates.")
+    return result
+
+def parse_body(body, max_templates=DEFAULT_MAX_TEMPLATES):
+    """Parses a complete body (bytes). Raises TemplateParseError or SourceLimitError."""
+    try:
+        data = orjson.loads(body) if orjson is not None else json.loads(body)
+    except ValueError as e:
+        raise TemplateParseError(f"Invalid JSON: {e}")
+    return _normalized(_extract_list(data), max_templates)
+
+class _TextBuffer:
+    """Decoded text from a chunk iterator, with a read position and on-demand refills."""
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._decoder = codecs.getincrementaldecoder('utf-8')()
+        self.text = ''
+        self.pos = 0
+        self.eof = False
+
+    def fill(self):
+        """Appends the next chunk. Returns False at end of input."""
+        if self.eof:
+            return False
+        chunk = next(self._chunks, None)
+        if chunk is None:
+            self.eof = True
+            self.text += self._decoder.decode(b'', final=True)
+            return False
+        # Drop what has been consumed so the buffer stays around one chunk long.
+        self.text = self.text[self.pos:] + self._decoder.decode(chunk)
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """Returns the next non-whitespace character (without consuming it), or '' at the end."""
+        while True:
+            while self.pos < len(self.text) and self.text[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.text):
+                return self.text[self.pos]
+            if not self.fill():
+                return ''
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise TemplateParseError(f"Expected '{char}' in template source.")
+        self.pos += 1
+
+    def value(self):
+        """Decodes the next JSON value, reading more input until it is complete."""
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.text, self.pos)
+            except json.JSONDecodeError as e:
+                if len(self.text) - self.pos > MAX_TEMPLATE_BYTES:
+                    raise SourceLimitError(f"A single template is larger than {MAX_TEMPLATE_BYTES} bytes.")
+                if not self.fill():
+                    raise TemplateParseError(f"Invalid JSON: {e}")
+                continue
+            # A number may continue in the next chunk ("1" of "1.5"): only trust it once
+            # a delimiter follows.
+            if not self.eof and not isinstance(value, (dict, list, str)) and \
+                    (end == len(self.text) or self.text[end] not in _DELIMITERS):
+                if self.fill():
+                    continue
+            self.pos = end
+            return value
+
+def _iter_array(buffer):
+    buffer.expect('[')
+    if buffer.peek() == ']':
+        buffer.pos += 1
+        return
+    while True:
+        yield buffer.value()
+        separator = buffer.peek()
+        buffer.pos += 1
+        if separator == ']':
+            return
+        if separator != ',':
+            raise TemplateParseError("Expected ',' or ']' in template list.")
+
+def iter_templates(chunks):
+    """
+    Yields the raw templates of a source body given as an iterable of byte chunks, one at a
+    time. Accepts a top-level list or an object with a 'templates' list (other members
+    are skipped). Raises TemplateParseError on malformed input.
+    """
+    buffer = _TextBuffer(chunks)
+    first = buffer.peek()
+    if first == '[':
+        yield from _iter_array(buffer)
+        return
+    if first != '{':
+        raise TemplateParseError("Expected a list of templates or an object with a 'templates' list.")
+    buffer.pos += 1
+    found = False
+    while buffer.peek() != '}':
+        key = buffer.value()
+        if not isinstance(key, str):
+            raise TemplateParseError("Invalid object key in template source.")
+        buffer.expect(':')
+        if key == 'templates' and buffer.peek() == '[':
+            found = True
+            yield from _iter_array(buffer)
+        else:
+            buffer.value()
+        if buffer.peek() == ',':
+            buffer.pos += 1
+        elif buffer.peek() != '}':
+            raise TemplateParseError("Expected ',' or '}' in template source.")
+    if not found:
+        raise TemplateParseError("Expected an object with a 'templates' list.")
+
+def _share_keys(value, memo):
+    """
+    Rebuilds dicts with keys taken from memo. A one-shot json.loads shares equal keys
+    across the whole body; decoding one template at a time doesn't, and 100k templates
+    would otherwise each hold their own copies of 'title', 'image', 'env', ...
+    """
+    if type(value) is dict:
+        return {memo.setdefault(k, k): _share_keys(v, memo) if type(v) in _CONTAINERS else v
+                for k, v in value.items()}
+    return [_share_keys(v, memo) if type(v) in _CONTAINERS else v for v in value]
+
+def parse_stream(chunks, max_templates=DEFAULT_MAX_TEMPLATES):
+    """Parses, validates and normalizes a streamed body. Raises TemplateParseError or SourceLimitError."""
+    memo = {}
+    templates = (_share_keys(t, memo) if type(t) is dict else t for t in iter_templates(chunks))
+    return _normalized(templates, max_templates)
+
+def limit_chunks(chunks, max_bytes, sink=None):
+    """Passes chunks through, raising SourceLimitError past max_bytes. Each chunk is also given to sink(chunk)."""
+    total = 0
+    for chunk in chunks:
+        if not chunk:
+            continue
+        total += len(chunk)
+        if max_bytes and total > max_bytes:
+            raise SourceLimitError(f"Source is larger than {max_bytes} bytes.")
+        if sink is not None:
+            sink(chunk)
+        yield chunk
+
+def read_file_chunks(f, chunk_size=CHUNK_SIZE):
+    while True:
+        chunk = f.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
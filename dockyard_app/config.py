@@ -10,4 +10,86 @@ class Config:
     TEMPLATE_SOURCES_URL = os.environ.get('TEMPLATE_SOURCES_URL') or "https://raw.githubusercontent.com/Qballjos/portainer_templates/master/Template/template.json"
 
     # Scheduler settings
+    # Set SCHEDULER_ENABLED=0 to run without background jobs (benchmarks); the catalog then
+    # only changes when loaded from storage.
+    SCHEDULER_ENABLED = os.environ.get('SCHEDULER_ENABLED', '1') != '0'
     TEMPLATE_UPDATE_INTERVAL_HOURS = int(os.environ.get('TEMPLATE_UPDATE_INTERVAL_HOURS', 4))
+    # Random delay (up to this many seconds) added to each scheduled refresh
+    TEMPLATE_UPDATE_JITTER_SECONDS = int(os.environ.get('TEMPLATE_UPDATE_JITTER_SECONDS', 300))
+
+    # Template fetch settings
+    TEMPLATE_FETCH_MAX_WORKERS = int(os.environ.get('TEMPLATE_FETCH_MAX_WORKERS', 8))
+    TEMPLATE_FETCH_TIMEOUT = float(os.environ.get('TEMPLATE_FETCH_TIMEOUT', 10))
+    TEMPLATE_REFRESH_DEADLINE = float(os.environ.get('TEMPLATE_REFRESH_DEADLINE', 30))
+    # Sources over these limits are rejected (the last good cached copy is kept)
+    TEMPLATE_SOURCE_MAX_BYTES = int(os.environ.get('TEMPLATE_SOURCE_MAX_BYTES', 50 * 1024 * 1024))
+    TEMPLATE_SOURCE_MAX_TEMPLATES = int(os.environ.get('TEMPLATE_SOURCE_MAX_TEMPLATES', 50000))
+    # Failing sources: skipped after this many consecutive failures, retried with exponential backoff
+    TEMPLATE_SOURCE_FAILURE_THRESHOLD = int(os.environ.get('TEMPLATE_SOURCE_FAILURE_THRESHOLD', 3))
+    TEMPLATE_SOURCE_BACKOFF_SECONDS = float(os.environ.get('TEMPLATE_SOURCE_BACKOFF_SECONDS', 60))
+    TEMPLATE_SOURCE_BACKOFF_MAX_SECONDS = float(os.environ.get('TEMPLATE_SOURCE_BACKOFF_MAX_SECONDS', 3600))
+
+    # Storage: 'sqlite' (default, WAL mode) or 'json' (the original flat files)
+    STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'sqlite')
+    # Text matching for /api/templates: 'memory' (in-process index) or 'fts' (SQLite FTS5)
+    SEARCH_BACKEND = os.environ.get('SEARCH_BACKEND', 'memory')
+
+    # Multi-worker mode: how often workers check storage for a newly published catalog,
+    # and how often followers try to take over the scheduler from a departed leader.
+    CATALOG_SYNC_INTERVAL_SECONDS = float(os.environ.get('CATALOG_SYNC_INTERVAL_SECONDS', 5))
+    LEADER_CHECK_INTERVAL_SECONDS = float(os.environ.get('LEADER_CHECK_INTERVAL_SECONDS', 30))
+
+    # Dashboard metrics sampler
+    METRICS_SAMPLE_INTERVAL_SECONDS = float(os.environ.get('METRICS_SAMPLE_INTERVAL_SECONDS', 2))
+    METRICS_HISTORY_SIZE = int(os.environ.get('METRICS_HISTORY_SIZE', 300))
+
+    # Server-sent event streams (dashboard metrics, install job progress): each one holds a
+    # gunicorn thread, so streams are short (clients reconnect) and capped per worker.
+    # Keep SSE_MAX_STREAMS below GUNICORN_THREADS.
+    SSE_MAX_SECONDS = int(os.environ.get('SSE_MAX_SECONDS', 25))
+    SSE_MAX_STREAMS = int(os.environ.get('SSE_MAX_STREAMS', 4))
+
+    # Docker: leave DOCKER_BASE_URL unset to use DOCKER_HOST / the default socket
+    DOCKER_BASE_URL = os.environ.get('DOCKER_BASE_URL')
+    DOCKER_CLIENT_POOL_SIZE = int(os.environ.get('DOCKER_CLIENT_POOL_SIZE', 10))
+    DOCKER_STATS_INTERVAL_SECONDS = float(os.environ.get('DOCKER_STATS_INTERVAL_SECONDS', 2))
+    DOCKER_STATS_MAX_CONTAINERS = int(os.environ.get('DOCKER_STATS_MAX_CONTAINERS', 100))
+    DOCKER_STATS_WORKERS = int(os.environ.get('DOCKER_STATS_WORKERS', 8))
+    # The leader stops polling container stats when no one has asked for them for this long
+    DOCKER_STATS_IDLE_SECONDS = int(os.environ.get('DOCKER_STATS_IDLE_SECONDS', 300))
+
+    # AI compose generation
+    AI_MODEL_NAME = os.environ.get('AI_MODEL_NAME', 'gemini-pro')
+    AI_CACHE_SIZE = int(os.environ.get('AI_CACHE_SIZE', 256))
+    # Stack files fetched for the native converter (LRU entries)
+    STACKFILE_CACHE_SIZE = int(os.environ.get('STACKFILE_CACHE_SIZE', 64))
+
+    # Index page: cards rendered with the page; the rest load from /api/templates as the user scrolls
+    INDEX_PAGE_SIZE = int(os.environ.get('INDEX_PAGE_SIZE', 48))
+
+    # Logo cache: index card logos are prefetched after each refresh and served from /logo/<key>
+    LOGO_CACHE_MAX_MB = float(os.environ.get('LOGO_CACHE_MAX_MB', 100))
+    LOGO_THUMBNAIL_SIZE = int(os.environ.get('LOGO_THUMBNAIL_SIZE', 160))
+    LOGO_PREFETCH_WORKERS = int(os.environ.get('LOGO_PREFETCH_WORKERS', 8))
+    LOGO_CACHE_MAX_AGE_SECONDS = int(os.environ.get('LOGO_CACHE_MAX_AGE_SECONDS', 7 * 24 * 3600))
+
+    # Install jobs
+    INSTALL_JOB_WORKERS = int(os.environ.get('INSTALL_JOB_WORKERS', 2))
+    INSTALL_JOB_QUEUE_LIMIT = int(os.environ.get('INSTALL_JOB_QUEUE_LIMIT', 20))
+
+    # Image pre-pull for pinned templates (0 disables the periodic run / the bandwidth cap)
+    PREPULL_INTERVAL_SECONDS = int(os.environ.get('PREPULL_INTERVAL_SECONDS', 600))
+    PREPULL_MAX_CONCURRENT = int(os.environ.get('PREPULL_MAX_CONCURRENT', 2))
+    PREPULL_MAX_BANDWIDTH_MBPS = float(os.environ.get('PREPULL_MAX_BANDWIDTH_MBPS', 0))
+    PREPULL_IDLE_CPU_PERCENT = float(os.environ.get('PREPULL_IDLE_CPU_PERCENT', 75))
+
+    # Metrics at /metrics (Prometheus text format): logged-in users only, or set METRICS_TOKEN
+    # to let scrapers in with a bearer token instead.
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN') or None
+    METRICS_SHARE_INTERVAL_SECONDS = float(os.environ.get('METRICS_SHARE_INTERVAL_SECONDS', 5))
+
+    # Request profiler: off, header (requests sending X-DockYard-Profile) or all.
+    # Collapsed stacks are written to <data dir>/profiles.
+    PROFILER_MODE = os.environ.get('PROFILER_MODE', 'off').lower()
+    PROFILER_INTERVAL_MS = float(os.environ.get('PROFILER_INTERVAL_MS', 5))
+    PROFILER_KEEP = int(os.environ.get('PROFILER_KEEP', 50))
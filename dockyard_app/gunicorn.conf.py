@@ -0,0 +1,33 @@
+# Gunicorn configuration for running DockYard in production:
+#   gunicorn -c dockyard_app/gunicorn.conf.py
+#
+# Every worker builds the app with the create_app() factory and serves the shared catalog from storage. Only one
+# process (the holder of the scheduler lock in the data dir) runs the refresh job, so
+# adding workers doesn't multiply upstream template fetches.
+import multiprocessing
+import os
+
+# Run from dockyard_app/, where wsgi.py and config.py live.
+chdir = os.path.dirname(os.path.abspath(__file__))
+
+# Called in each worker after fork (see preload_app below).
+wsgi_app = 'app:create_app()'
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:5001')
+workers = int(os.environ.get('GUNICORN_WORKERS', min(multiprocessing.cpu_count() * 2 + 1, 8)))
+# Threads keep long-lived requests (SSE streams, slow clients) from pinning a whole worker.
+# SSE streams use at most SSE_MAX_STREAMS (4) of them, for SSE_MAX_SECONDS (25s) at a time,
+# so with 8 threads at least half of each worker serves ordinary requests.
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 60))
+graceful_timeout = 30
+keepalive = 5
+
+# Don't preload: the scheduler's background thread must be started after fork,
+# in the worker that wins the scheduler lock.
+preload_app = False
+
+accesslog = '-'
+errorlog = '-'
+loglevel = os.environ.get('GUNICORN_LOG_LEVEL', 'info')
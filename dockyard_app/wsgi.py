@@ -0,0 +1,7 @@
+"""WSGI entry point for production servers, e.g. `gunicorn -c gunicorn.conf.py wsgi:app`."""
+from app import create_app
+
+app = create_app()
+
+if __name__ == '__main__':
+    app.run(host='0.0.0.0', port=5001)
@@ -0,0 +1,47 @@
+import os
+import sys
+import tempfile
+import uuid
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'dockyard_app'))
+# The fake Docker daemon and template source servers are shared with the benchmarks.
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+# Nothing a test does may land in the real /app_data: the data dir is read when the app
+# package is imported, so point it at a scratch dir first.
+os.environ['DOCKYARD_DATA_DIR'] = tempfile.mkdtemp(prefix='dockyard-tests-')
+# An unroutable source: the startup refresh fails fast and fetches nothing.
+os.environ['TEMPLATE_SOURCES_URL'] = 'http://127.0.0.1:9/none.json'
+
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    """A fresh, empty data dir for one test."""
+    from app import config_manager
+
+    monkeypatch.setattr(config_manager, 'APP_DATA_DIR', str(tmp_path))
+    return str(tmp_path)
+
+
+@pytest.fixture(scope='session')
+def app():
+    """The application (one per process, see create_app)."""
+    from app import create_app
+
+    flask_app = create_app()
+    flask_app.config.update(TESTING=True, WTF_CSRF_ENABLED=False)
+    return flask_app
+
+
+@pytest.fixture
+def client(app):
+    """A test client logged in as a fresh user."""
+    client = app.test_client()
+    username = f"user-{uuid.uuid4().hex[:8]}"
+    client.post('/register', data={'username': username, 'password': 'pw', 'confirm_password': 'pw'})
+    response = client.post('/login', data={'username': username, 'password': 'pw'})
+    assert response.status_code == 302
+    return client
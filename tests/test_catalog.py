@@ -0,0 +1,24 @@
+from app.catalog import Catalog
+
+
+def _nginx(description):
+    # The same app from several sources: one cluster, later entries stored as deltas of the first.
+    return {'type': 1, 'title': 'Nginx', 'description': description, 'image': 'nginx:latest',
+            'env': [{'name': 'PORT'}], 'ports': ['80/tcp']}
+
+
+def test_reused_entries_never_keep_a_base_from_an_older_catalog():
+    first = Catalog([_nginx('one'), _nginx('two'), _nginx('three')])
+    lead, variant, other = first.templates
+    assert variant.base is lead and other.base is lead
+
+    # The lead is gone: the former variant leads the cluster and is stored in full.
+    second = Catalog([_nginx('two'), _nginx('three')], previous=first)
+    assert second.templates[0].base is None
+    assert second.templates[1].base is second.templates[0]
+    assert second.templates[0].to_dict() == variant.to_dict()
+
+    # Unchanged clusters still share the previous entries.
+    third = Catalog([_nginx('two'), _nginx('three')], previous=second)
+    assert third.templates == second.templates
+    assert all(a is b for a, b in zip(third.templates, second.templates))
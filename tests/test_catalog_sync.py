@@ -0,0 +1,47 @@
+import threading
+
+import pytest
+
+from app import storage
+from app import template_manager
+from app.catalog import EMPTY_CATALOG
+from stub_servers import make_templates
+
+
+@pytest.fixture
+def empty_catalog(app, monkeypatch):
+    monkeypatch.setattr(template_manager, '_catalog', EMPTY_CATALOG)
+    monkeypatch.setattr(template_manager, '_storage_marker', None)
+    monkeypatch.setattr(template_manager, '_last_storage_check', 0.0)
+    with app.app_context():
+        yield
+
+
+def test_sync_loads_the_published_catalog_once(empty_catalog):
+    backend = storage.get_storage()
+    assert backend.save_catalog(make_templates(3, prefix='Sync'), version='sync-test')
+
+    assert template_manager.sync_catalog_from_storage(min_interval=0)
+    assert len(template_manager.get_catalog()) == 3
+    assert not template_manager.sync_catalog_from_storage(min_interval=0)
+
+
+def test_sync_steps_aside_while_the_catalog_is_being_replaced(empty_catalog):
+    storage.get_storage().save_catalog(make_templates(2, prefix='Busy'), version='busy-test')
+    held, release = threading.Event(), threading.Event()
+
+    def swap():
+        with template_manager._catalog_lock:
+            held.set()
+            release.wait(5)
+
+    writer = threading.Thread(target=swap)
+    writer.start()
+    held.wait(5)
+    try:
+        assert not template_manager.sync_catalog_from_storage(min_interval=0)
+        assert not template_manager._catalog
+    finally:
+        release.set()
+        writer.join()
+    assert template_manager.sync_catalog_from_storage(min_interval=0)
@@ -0,0 +1,96 @@
+import time
+
+import pytest
+import yaml
+
+from app import ai_manager, compose_converter, jobs
+from compare_compose import summarize
+from stub_servers import StubGenerativeModel
+
+# Portainer v2 templates covering the fields the AI prompt asks to map, with the summary
+# (image, ports, volume targets, environment names, restart) the compose file must have.
+CORPUS = [
+    ({'type': 1, 'title': 'Nginx', 'image': 'nginx:latest', 'ports': ['8080:80/tcp', '443/tcp']},
+     {'image': 'nginx:latest', 'ports': ['443/tcp', '8080:80/tcp'], 'volume_targets': [],
+      'environment': [], 'restart': 'unless-stopped'}),
+    ({'type': 1, 'title': 'Port Map', 'image': 'example/app', 'ports': [{'80/tcp': '8000'}, {'53/udp': ''}]},
+     {'image': 'example/app', 'ports': ['53/udp', '8000:80/tcp'], 'volume_targets': [],
+      'environment': [], 'restart': 'unless-stopped'}),
+    ({'type': 1, 'title': 'Postgres DB', 'image': 'postgres:16', 'restart_policy': 'always',
+      'volumes': [{'container': '/var/lib/postgresql/data'}, {'container': '/etc/conf', 'bind': '/srv/conf', 'readonly': True}],
+      'env': [{'name': 'POSTGRES_PASSWORD', 'label': 'Password'},
+              {'name': 'PGDATA', 'default': '/var/lib/postgresql/data'},
+              {'name': 'MODE', 'select': [{'text': 'A', 'value': 'a'}, {'text': 'B', 'value': 'b', 'default': True}]},
+              {'label': 'no name, skipped'}]},
+     {'image': 'postgres:16', 'ports': [], 'volume_targets': ['/etc/conf', '/var/lib/postgresql/data'],
+      'environment': ['MODE', 'PGDATA', 'POSTGRES_PASSWORD'], 'restart': 'always'}),
+    ({'type': 1, 'title': 'Host Net', 'image': 'example/host', 'network': 'host', 'ports': ['9000:9000']},
+     {'image': 'example/host', 'ports': [], 'volume_targets': [], 'environment': [], 'restart': 'unless-stopped'}),
+    ({'type': 1, 'title': 'Quoting "yes"', 'image': 'example/yes:0755', 'command': 'run --flag: yes',
+      'labels': [{'name': 'on', 'value': 'no'}], 'network': 'proxy', 'env': [{'name': 'TZ', 'default': None}]},
+     {'image': 'example/yes:0755', 'ports': [], 'volume_targets': [], 'environment': ['TZ'],
+      'restart': 'unless-stopped'}),
+]
+
+STACKFILE = "services:\n  web:\n    image: example/web:1\n    environment:\n      - DOMAIN=${DOMAIN}\n"
+
+
+@pytest.mark.parametrize('template, expected', CORPUS, ids=[t['title'] for t, _ in CORPUS])
+def test_container_templates_convert_to_the_fields_the_ai_is_asked_for(template, expected):
+    start = time.perf_counter()
+    compose = compose_converter.convert_template(template)
+    assert time.perf_counter() - start < 0.05  # no network, no model
+    assert summarize(compose) == expected
+
+
+def test_values_stay_strings_after_yaml_parsing():
+    template = CORPUS[4][0]
+    service = yaml.safe_load(compose_converter.convert_template(template))['services']['quoting_yes']
+    assert service['command'] == 'run --flag: yes'
+    assert service['labels'] == {'on': 'no'}
+    assert service['environment'] == {'TZ': ''}
+    assert service['networks'] == ['proxy']
+
+
+def test_stack_templates_keep_their_stack_file_and_list_the_env_defaults():
+    template = {'type': 3, 'title': 'Stack', 'repository': {'url': 'https://github.com/example/stacks', 'stackfile': 'web/compose.yml'},
+                'env': [{'name': 'DOMAIN', 'default': 'example.com'}]}
+    assert compose_converter.stackfile_url(template['repository']) == \
+        'https://raw.githubusercontent.com/example/stacks/HEAD/web/compose.yml'
+    compose = compose_converter.convert_template(template, STACKFILE)
+    assert '#   DOMAIN=example.com' in compose
+    assert yaml.safe_load(compose) == yaml.safe_load(STACKFILE)
+
+
+@pytest.mark.parametrize('template', [
+    {'type': 1, 'title': 'No image'},
+    {'type': 1, 'title': 'Bad port', 'image': 'x', 'ports': [{'80': '1', '81': '2'}]},
+    {'type': 1, 'title': 'Bad volume', 'image': 'x', 'volumes': ['/data']},
+    {'type': 9, 'title': 'Unknown type'},
+    {'type': 2, 'title': 'Stack without file', 'repository': {'url': 'https://gitlab.com/a/b', 'stackfile': 'c.yml'}},
+])
+def test_templates_the_converter_cannot_handle_raise(template):
+    with pytest.raises(compose_converter.ConversionError):
+        stackfile = compose_converter.fetch_stackfile(template) if compose_converter.is_stack(template) else None
+        compose_converter.convert_template(template, stackfile)
+
+
+@pytest.fixture
+def stub_model(app, data_dir, monkeypatch):
+    model = StubGenerativeModel(latency=0)
+    monkeypatch.setattr(ai_manager, '_model', model)
+    monkeypatch.setattr(ai_manager, '_memory_cache', type(ai_manager._memory_cache)())
+    with app.app_context():
+        yield model
+
+
+def test_the_ai_is_only_asked_for_templates_the_converter_cannot_handle(stub_model):
+    compose, error, generator = jobs.generate_compose(CORPUS[0][0])
+    assert (error, generator, stub_model.calls) == (None, 'native', 0)
+
+    compose, error, generator = jobs.generate_compose({'type': 1, 'title': 'No image'})
+    assert (error, generator, stub_model.calls) == (None, 'ai', 1)
+    assert yaml.safe_load(compose)['services']
+
+    _, _, generator = jobs.generate_compose(CORPUS[0][0], use_ai=True)
+    assert (generator, stub_model.calls) == ('ai', 2)
@@ -0,0 +1,155 @@
+import math
+import os
+import time
+
+import docker
+import pytest
+
+from app import container_stats
+from app.container_stats import ROLLUPS, ContainerStatsCollector, TimeSeriesStore
+from stub_servers import FakeDockerDaemon
+
+
+@pytest.fixture
+def daemon():
+    with FakeDockerDaemon(containers=3) as daemon:
+        yield daemon
+
+
+@pytest.fixture
+def client(daemon):
+    client = docker.DockerClient(base_url=daemon.base_url)
+    yield client
+    client.close()
+
+
+def _collector(client, **kwargs):
+    return ContainerStatsCollector(client_factory=lambda: client, workers=4, **kwargs)
+
+
+def test_rollups_match_per_bucket_means():
+    # 3 hours and a bit of 10s samples: the 1m tier (180 buckets) wraps around its ring.
+    step, start = 10, 1_700_000_000 // 3600 * 3600
+    samples = [(start + k * step, {'cpu_percent': float(k), 'memory_bytes': float(k % 7)}) for k in range(3 * 360 + 5)]
+    store = TimeSeriesStore(max_containers=1)
+    for timestamp, values in samples:
+        store.add('container', 'app', timestamp, values)
+
+    for resolution, (width, capacity) in ROLLUPS.items():
+        buckets = {}
+        for timestamp, values in samples:
+            buckets.setdefault(timestamp // width * width, []).append(values)
+        expected = sorted(buckets.items())[-capacity:]
+        series = store.snapshot(resolution)[0]['series']
+        assert series['timestamps'] == [float(t) for t, _ in expected]
+        for field in ('cpu_percent', 'memory_bytes'):
+            means = [sum(v[field] for v in bucket) / len(bucket) for _, bucket in expected]
+            assert len(series[field]) == len(means)
+            assert all(math.isclose(a, b) for a, b in zip(series[field], means)), (resolution, field)
+        limited = store.snapshot(resolution, limit=3)[0]['series']['timestamps']
+        assert limited == [float(t) for t, _ in expected[-3:]]
+
+    # 1s buckets hold one sample each, 1m buckets six and 1h buckets 360 (the last one five).
+    assert len(store.snapshot('1s')[0]['series']['timestamps']) == ROLLUPS['1s'][1]
+    assert len(store.snapshot('1m')[0]['series']['timestamps']) == ROLLUPS['1m'][1]
+    assert len(store.snapshot('1h')[0]['series']['timestamps']) == 4
+
+
+def test_unknown_resolution_is_rejected():
+    with pytest.raises(ValueError):
+        TimeSeriesStore().snapshot('5m')
+
+
+def test_store_evicts_the_least_recently_seen_container():
+    store = TimeSeriesStore(max_containers=3)
+    for n in range(5):
+        store.add(f'c{n}', f'app-{n}', 1000 + n, {'cpu_percent': 1.0})
+    store.add('c2', 'app-2', 2000, {'cpu_percent': 1.0})
+    store.add('c5', 'app-5', 2001, {'cpu_percent': 1.0})
+    assert sorted(s['id'] for s in store.snapshot()) == ['c2', 'c4', 'c5']
+
+
+def test_container_memory_does_not_grow_with_samples():
+    store = TimeSeriesStore(max_containers=1)
+    store.add('c', 'app', 0, {'cpu_percent': 1.0})
+    series = store._series['c']
+
+    def footprint():
+        return sum(r._starts.buffer_info()[1] + r._counts.buffer_info()[1]
+                   + sum(column.buffer_info()[1] for column in r._sums.values())
+                   for r in series.rollups.values())
+
+    before = footprint()
+    for k in range(20_000):
+        store.add('c', 'app', 1 + k, {'cpu_percent': 1.0})
+    assert footprint() == before
+
+
+def test_collector_computes_rates_from_daemon_counters(daemon, client):
+    collector = _collector(client)
+    try:
+        assert collector.poll_once() == len(daemon.containers)
+        first = {s['id']: s['latest'] for s in collector.store.snapshot()}
+        assert all(latest['cpu_percent'] == 0.0 for latest in first.values()), "no rate without a previous sample"
+        time.sleep(0.05)
+        collector.poll_once()
+    finally:
+        collector.stop()
+    for series in collector.store.snapshot():
+        latest = series['latest']
+        # The fake daemon adds 50ms of CPU per 1s of system time on 2 CPUs at each call.
+        assert math.isclose(latest['cpu_percent'], 10.0)
+        assert latest['memory_bytes'] > first[series['id']]['memory_bytes'] > 0
+        assert latest['net_rx_bytes_per_sec'] > 0 and latest['blkio_write_bytes_per_sec'] > 0
+
+
+def test_collector_keeps_at_most_max_containers(daemon, client):
+    collector = _collector(client, max_containers=2)
+    try:
+        collector.poll_once()
+    finally:
+        collector.stop()
+    assert len(collector.store.snapshot()) == 2
+
+
+def test_other_workers_read_the_published_tiers(data_dir, client, monkeypatch):
+    shared_dir = os.path.join(data_dir, container_stats.SHARED_DIRNAME)
+    os.makedirs(shared_dir)
+    collector = _collector(client, shared_dir=shared_dir)
+    try:
+        collector.poll_once()
+        collector.publish(force=True)
+    finally:
+        collector.stop()
+
+    # A follower: no collector of its own.
+    monkeypatch.setattr(container_stats, '_collector', None)
+    monkeypatch.setattr(container_stats, '_shared_reports', {})
+    for resolution in ROLLUPS:
+        assert container_stats.read_report(resolution) == collector.report(resolution)
+    limited = container_stats.read_report('1s', limit=1)
+    assert all(len(c['series']['timestamps']) == 1 for c in limited['containers'])
+    with pytest.raises(ValueError):
+        container_stats.read_report('5m')
+
+
+def test_follower_without_published_tiers_reports_waiting(data_dir, monkeypatch):
+    monkeypatch.setattr(container_stats, '_collector', None)
+    monkeypatch.setattr(container_stats, '_shared_reports', {})
+    report = container_stats.read_report('1m')
+    assert report['available'] is False and report['containers'] == []
+
+
+def test_collector_polls_only_while_stats_are_wanted(data_dir, client, monkeypatch):
+    shared_dir = os.path.join(data_dir, container_stats.SHARED_DIRNAME)
+    collector = _collector(client, shared_dir=shared_dir, idle_after=60)
+    assert not collector.is_wanted()
+
+    monkeypatch.setattr(container_stats, '_last_demand_touch', None)
+    container_stats.note_demand()
+    assert collector.is_wanted()
+
+    demand = os.path.join(shared_dir, container_stats.DEMAND_FILENAME)
+    stale = time.time() - 120
+    os.utime(demand, (stale, stale))
+    assert not collector.is_wanted()
@@ -0,0 +1,100 @@
+import time
+import types
+
+import docker
+import pytest
+
+from app.image_prepull import BandwidthBudget, PrePuller, instant_template_ids, normalize_image, repository_of
+from stub_servers import FakeDockerDaemon
+
+LATENCY = 0.02
+
+
+@pytest.fixture
+def pins():
+    # Templates repeat images and share repositories, and sources spell one image differently.
+    pins = []
+    for n in range(24):
+        repository = f'example/app-{n % 6}'
+        tag = f'{(n // 6) % 2 + 1}.0'
+        image = f'docker.io/{repository}:{tag}' if n % 2 else f'{repository}:{tag}'
+        pins.append({'template_id': f'template-{n}', 'image': image})
+    return pins
+
+
+def _pull(pins, max_concurrent, latency=LATENCY, max_bytes_per_second=0, bandwidth_window=None, present=()):
+    """Pre-pulls pins into a fresh fake daemon; returns (daemon, status by image, local images, seconds)."""
+    with FakeDockerDaemon(containers=0, pull_latency=latency) as daemon:
+        daemon.images.update(present)
+        client = docker.DockerClient(base_url=daemon.base_url)
+        prepuller = PrePuller(lambda: client, max_concurrent=max_concurrent, max_bytes_per_second=max_bytes_per_second)
+        if bandwidth_window:
+            prepuller.bandwidth = BandwidthBudget(max_bytes_per_second, window=bandwidth_window)
+        start = time.perf_counter()
+        prepuller.run_once(pins)
+        elapsed = time.perf_counter() - start
+        status = {s['image']: s for s in prepuller.status()}
+        local = prepuller.local_images.get(client)
+        client.close()
+    return daemon, status, local, elapsed
+
+
+def test_each_image_is_pulled_once_whatever_its_spelling(pins):
+    unique = {normalize_image(pin['image']) for pin in pins}
+    daemon, status, _, _ = _pull(pins, max_concurrent=4)
+    assert sorted(daemon.pulls) == sorted(unique)
+    assert set(status) == unique
+    for pin in pins:
+        assert pin['template_id'] in status[normalize_image(pin['image'])]['template_ids']
+
+
+@pytest.mark.parametrize('cap', [1, 3])
+def test_no_more_than_max_concurrent_pulls_run_at_once(pins, cap):
+    repositories = len({repository_of(pin['image']) for pin in pins})
+    daemon, status, _, _ = _pull(pins, max_concurrent=cap)
+    assert all(s['state'] == 'local' for s in status.values())
+    assert daemon.max_active_pulls == min(cap, repositories)
+
+
+def test_bandwidth_budget_waits_for_the_window():
+    window = 0.5
+    budget = BandwidthBudget(max_bytes_per_second=1000, window=window)
+    budget.consume(5000)
+    start = time.perf_counter()
+    budget.wait()
+    assert time.perf_counter() - start >= window * 0.9
+    start = time.perf_counter()
+    budget.wait()
+    assert time.perf_counter() - start < 0.1
+
+
+def test_pulls_over_the_budget_are_held_back():
+    # One worker and three repositories: each pull downloads more than a window allows,
+    # so every pull after the first waits for the window to pass.
+    window = 0.5
+    pins = [{'template_id': f'template-{n}', 'image': f'example/throttled-{n}:1.0'} for n in range(3)]
+    _, _, _, unthrottled = _pull(pins, max_concurrent=1, latency=0)
+    _, status, _, throttled = _pull(pins, max_concurrent=1, latency=0,
+                                    max_bytes_per_second=FakeDockerDaemon.LAYER_SIZE, bandwidth_window=window)
+    assert all(s['state'] == 'local' for s in status.values())
+    assert throttled >= (len(pins) - 1) * window * 0.9
+    assert unthrottled < window
+
+
+def test_images_on_the_host_are_reported_local_without_pulling(pins):
+    unique = sorted({normalize_image(pin['image']) for pin in pins})
+    present, missing = unique[::2], unique[1::2]
+    daemon, status, local, _ = _pull(pins, max_concurrent=4, present=present)
+    assert sorted(daemon.pulls) == missing
+    assert all(status[image]['state'] == 'local' for image in unique)
+    assert all(status[image]['layers'] == 0 for image in present)
+    assert set(unique) <= local
+
+    catalog = types.SimpleNamespace(templates=[
+        {'id': 'pinned', 'image': pins[0]['image']},
+        # Another spelling of a pulled image is instant too.
+        {'id': 'alias', 'image': 'docker.io/' + unique[0]},
+        {'id': 'not-pulled', 'image': 'example/never-pinned:1.0'},
+        {'id': 'no-image'},
+    ])
+    assert instant_template_ids(catalog, local) == ['pinned', 'alias']
@@ -0,0 +1,48 @@
+import json
+import os
+
+from app import jobs
+
+
+def _persisted_events(job):
+    with open(os.path.join(jobs._jobs_dir(), f"{job.id}.json")) as f:
+        return [event['message'] for event in json.load(f)['events']]
+
+
+def test_job_events_are_capped_and_keep_their_seq():
+    job = jobs.Job('t', 'Test')
+    for i in range(jobs.MAX_JOB_EVENTS + 100):
+        job.add_event('pull', f'event {i + 1}', layer='abc')
+
+    assert len(job.events) == jobs.MAX_JOB_EVENTS
+    assert job.events_after(0)[0]['seq'] == 101
+    assert [e['seq'] for e in job.events_after(598)] == [599, 600]
+    assert job.events_after(600) == []
+    assert job.wait_for_events(599, timeout=0)[0]['message'] == 'event 600'
+    assert jobs.Job.from_dict(job.to_dict()).last_seq == 600
+
+
+def test_deploy_steps_are_persisted_at_once_and_layer_progress_throttled(app, data_dir, monkeypatch):
+    from app import docker_manager
+    seen = {}
+
+    def deploy_template(template, report):
+        report('pull', 'Pulling example:latest...')
+        seen['after_step'] = _persisted_events(job)
+        report('pull', 'Downloading', layer='a', current=1, total=2)
+        report('pull', 'Downloading', layer='a', current=2, total=2)
+        seen['after_progress'] = _persisted_events(job)
+        report('deploy', 'Starting container...')
+        seen['after_deploy'] = _persisted_events(job)
+        return 'container-id'
+
+    monkeypatch.setattr(docker_manager, 'deploy_template', deploy_template)
+    monkeypatch.setattr(jobs, 'generate_compose', lambda template, use_ai=False: ('services: {}', None, 'native'))
+    manager = jobs.JobManager(app, workers=1)
+    job = manager.submit({'id': 't', 'title': 'Test'}, deploy=True)
+    manager._executor.shutdown(wait=True)
+
+    assert seen['after_step'][-1] == 'Pulling example:latest...'
+    assert seen['after_progress'] == seen['after_step']  # within PERSIST_INTERVAL_SECONDS of the step
+    assert seen['after_deploy'][-1] == 'Starting container...'
+    assert _persisted_events(job)[-1] == 'Done.'
@@ -0,0 +1,32 @@
+import json
+import os
+
+from app import instrumentation
+
+
+def _share(data_dir, pid, started_at, count):
+    directory = os.path.join(data_dir, instrumentation.METRICS_DIRNAME)
+    os.makedirs(directory, exist_ok=True)
+    metrics = {'dockyard_test_total': {'': count}}
+    with open(os.path.join(directory, f'{pid}.json'), 'w') as f:
+        json.dump({'started_at': started_at, 'metrics': metrics}, f)
+    return os.path.join(directory, f'{pid}.json')
+
+
+def test_snapshots_of_a_reused_pid_are_dropped(data_dir):
+    parent = os.getppid()
+    started_at = instrumentation._process_started_at(parent)
+    _share(data_dir, parent, started_at, 1)
+    assert instrumentation.read_shared_snapshots() == [{'dockyard_test_total': {'': 1}}]
+
+    # Same pid, but written by a process that started earlier (a previous run).
+    stale = _share(data_dir, parent, started_at - 3600, 2)
+    assert instrumentation.read_shared_snapshots() == []
+    assert not os.path.exists(stale)
+
+
+def test_the_leader_clears_snapshots_of_an_earlier_run(data_dir):
+    path = _share(data_dir, os.getppid(), instrumentation._process_started_at(os.getppid()), 1)
+    instrumentation.clear_shared_snapshots()
+    assert not os.path.exists(path)
+    instrumentation.clear_shared_snapshots()  # nothing left to remove
@@ -0,0 +1,74 @@
+import os
+
+import pytest
+
+from app import leader
+from app import template_manager
+from app.catalog import EMPTY_CATALOG
+
+
+class FakeCoordinator:
+    """Records refresh requests instead of fetching."""
+
+    def __init__(self):
+        self.in_progress = False
+        self.requests = 0
+
+    def request(self, flask_app=None):
+        self.requests += 1
+
+
+@pytest.fixture
+def coordinator(data_dir, monkeypatch):
+    fake = FakeCoordinator()
+    monkeypatch.setattr(template_manager, '_coordinator', fake)
+    return fake
+
+
+@pytest.fixture
+def follower(monkeypatch):
+    monkeypatch.setattr(leader, 'is_leader', lambda: False)
+
+
+def _requested(data_dir):
+    return os.path.exists(os.path.join(str(data_dir), template_manager.REFRESH_REQUEST_FILENAME))
+
+
+def test_saving_sources_in_a_follower_leaves_the_refresh_to_the_leader(client, coordinator, follower, data_dir):
+    response = client.post('/api/settings/templates/sources', json={'urls': ['http://127.0.0.1:9/a.json']})
+    assert response.status_code == 202
+    assert coordinator.requests == 0
+    assert _requested(data_dir)
+
+    assert template_manager.handle_refresh_request()
+    assert coordinator.requests == 1
+    assert not _requested(data_dir)
+    assert not template_manager.handle_refresh_request()
+
+
+def test_a_request_waits_for_the_refresh_in_progress(app, coordinator, follower, data_dir):
+    with app.app_context():
+        template_manager.schedule_refresh(app)
+    coordinator.in_progress = True
+    assert not template_manager.handle_refresh_request()
+    assert _requested(data_dir)
+
+    coordinator.in_progress = False
+    assert template_manager.handle_refresh_request()
+    assert coordinator.requests == 1
+
+
+def test_empty_catalog_on_the_leader_is_served_as_refreshing(client, coordinator, monkeypatch):
+    monkeypatch.setattr(leader, 'is_leader', lambda: True)
+    monkeypatch.setattr(template_manager, '_catalog', EMPTY_CATALOG)
+    monkeypatch.setattr(template_manager, 'sync_catalog_from_storage', lambda min_interval=5: False)
+    coordinator.in_progress = True
+
+    response = client.get('/')
+    assert response.status_code == 200
+    assert b'id="catalog-refreshing"' in response.data
+    assert 'ETag' not in response.headers
+    assert coordinator.requests == 1
+
+    page = client.get('/api/templates?view=groups').get_json()
+    assert page['results'] == [] and page['refreshing'] is True
@@ -0,0 +1,19 @@
+from stub_servers import TemplateSourceServer
+
+from app import source_cache
+from app import template_manager
+
+
+def test_unchanged_sources_are_parsed_again_from_the_stored_body(app, data_dir):
+    with TemplateSourceServer(sources=1, templates_per_source=5) as stub, app.app_context():
+        url = stub.urls[0]
+        first = template_manager.fetch_templates_from_url(url)
+        assert source_cache.load_entry(url)['etag']
+
+        again = template_manager.fetch_templates_from_url(url)
+        assert stub.not_modified_count == 1
+        assert again == first and again is not first
+
+        source_cache.clear()
+        assert source_cache.load_entry(url) is None
+        assert template_manager.fetch_templates_from_url(url) == first
@@ -0,0 +1,39 @@
+import time
+
+import pytest
+
+
+@pytest.fixture
+def short_streams(app, monkeypatch):
+    from app import routes  # Registered by create_app()
+
+    monkeypatch.setitem(app.config, 'SSE_MAX_SECONDS', 1)
+    monkeypatch.setitem(app.config, 'SSE_MAX_STREAMS', 1)
+    monkeypatch.setattr(routes, '_stream_slots', None)
+
+
+def _read(response):
+    try:
+        return response.get_data(as_text=True)
+    finally:
+        response.close()
+
+
+def test_streams_end_after_sse_max_seconds(client, short_streams):
+    start = time.monotonic()
+    body = _read(client.get('/api/metrics/stream'))
+    assert body.startswith('retry: 2000')
+    assert 0.9 <= time.monotonic() - start < 5
+
+
+def test_streams_over_the_limit_answer_at_once_and_free_their_slot(client, short_streams):
+    held = client.get('/api/metrics/stream')
+    next(iter(held.response))  # holds the only slot
+
+    start = time.monotonic()
+    body = _read(client.get('/api/metrics/stream'))
+    assert time.monotonic() - start < 0.5
+    assert body.startswith('retry: 5000')
+
+    held.close()
+    assert _read(client.get('/api/metrics/stream')).startswith('retry: 2000')
@@ -0,0 +1,7 @@
+def test_template_status_needs_a_login(app, client):
+    response = app.test_client().get('/api/templates/status')
+    assert response.status_code == 302
+    assert '/login' in response.headers['Location']
+
+    status = client.get('/api/templates/status').get_json()
+    assert 'sources' in status and 'refresh_requested' in status
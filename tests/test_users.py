@@ -0,0 +1,30 @@
+import pytest
+
+from app import storage
+
+
+@pytest.fixture(params=['json', 'sqlite'])
+def users(request, tmp_path):
+    if request.param == 'json':
+        return storage.UserRepository(str(tmp_path / 'users.json'))
+    return storage.SqliteStorage(str(tmp_path / 'dockyard.db'))
+
+
+def test_a_taken_username_is_refused(users):
+    add = users.add if isinstance(users, storage.UserRepository) else users.add_user
+    first = add('alice', 'hash')
+    assert first is not None
+    assert add('alice', 'other hash') is None
+    assert add('bob', 'hash') not in (None, first)
+
+
+def test_register_shows_a_username_taken_by_a_concurrent_request(app, monkeypatch):
+    from app.forms import RegistrationForm
+    form = {'username': 'racer', 'password': 'pw', 'confirm_password': 'pw'}
+    app.test_client().post('/register', data=form)
+    # The form's own check passed before the other request saved the user.
+    monkeypatch.setattr(RegistrationForm, 'validate_username', lambda self, field: None)
+
+    response = app.test_client().post('/register', data=form)
+    assert response.status_code == 200
+    assert b'That username is taken' in response.data